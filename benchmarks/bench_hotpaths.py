@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the host-side hot paths of the ds1054z package
+
+Runs without an oscilloscope against the simulator of the package,
+connected in the same process (ds1054z.simulator.SimulatorTransport).
+For each memory depth it measures:
+
+* decode_ieee_block() of a single chunk
+* the chunked RAW read: get_waveform_bytes(mode='RAW')
+* the conversion to voltages: get_waveform_samples(mode='RAW')
+* waveform_time_values and waveform_time_values_decimal
+* the CSV export of the save-data action
+* all host-side measurements of ds1054z.measurements (if NumPy is installed)
+* the number of round trips of the high-level operations
+
+Run it from the repository root:
+
+    python benchmarks/bench_hotpaths.py --depths 12k,120k,1.2M
+    python benchmarks/bench_hotpaths.py --json results-new.json --compare results-old.json
+
+Saving the results of two commits as JSON and comparing them shows
+the relative change of every benchmark.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ds1054z import DS1054Z
+from ds1054z.cli import write_csv
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform, ieee_block
+
+try:
+    from ds1054z.measurements import measure as measure_samples
+except ImportError:
+    measure_samples = None
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+DEPTHS = {'12k': 12000, '120k': 120000, '1.2M': 1200000, '12M': 12000000, '24M': 24000000}
+
+def measure(func, min_time=0.2, max_runs=20):
+    """
+    Calls func repeatedly (at least once, until min_time has passed)
+    and returns the best time of a single call in seconds.
+    """
+    best = None
+    total = 0.0
+    runs = 0
+    while runs < max_runs and (runs == 0 or total < min_time):
+        start = clock()
+        func()
+        elapsed = clock() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return best
+
+def round_trips(scope, func):
+    """ The number of reads from the scope needed to run func """
+    with scope.trace() as recorder:
+        func()
+    return sum(1 for ev in recorder.transactions if ev.direction == 'read')
+
+def bench_depth(depth, tmpdir):
+    results = {}
+    scope = DS1054Z('simulator', transport=SimulatorTransport(SimulatedScope(memory_depth=depth)))
+    scope.stop()
+
+    block = ieee_block(Waveform().codes(min(depth, 250000), 1e-6, 0.04, 0))
+    results['decode_ieee_block'] = measure(lambda: DS1054Z.decode_ieee_block(block))
+    results['get_waveform_bytes RAW'] = measure(lambda: scope.get_waveform_bytes(1, mode='RAW'))
+    results['get_waveform_samples RAW'] = measure(lambda: scope.get_waveform_samples(1, mode='RAW'))
+    scope.write(':WAVeform:MODE RAW')
+    results['waveform_time_values'] = measure(lambda: scope.waveform_time_values)
+    results['waveform_time_values_decimal'] = measure(lambda: scope.waveform_time_values_decimal)
+
+    samples = scope.get_waveform_samples(1, mode='RAW')
+    times = scope.waveform_time_values_decimal
+    filename = os.path.join(tmpdir, 'bench.csv')
+    results['save-data csv export'] = measure(lambda: write_csv(filename, ['CHAN1'], [times, samples]))
+    os.remove(filename)
+    if measure_samples is not None:
+        xinc = scope.waveform_preamble_dict['xinc']
+        results['host-side measurements (all items)'] = measure(lambda: measure_samples(samples, xinc))
+
+    results['round trips get_waveform_bytes RAW'] = round_trips(scope, lambda: scope.get_waveform_bytes(1, mode='RAW'))
+    results['round trips waveform_time_values'] = round_trips(scope, lambda: scope.waveform_time_values)
+    return results
+
+def bench_fixed():
+    results = {}
+    scope = DS1054Z('simulator', transport=SimulatorTransport())
+    results['get_waveform_samples NORMal'] = measure(lambda: scope.get_waveform_samples(1))
+    results['round trips get_waveform_samples NORMal'] = round_trips(scope, lambda: scope.get_waveform_samples(1))
+    results['round trips display_data'] = round_trips(scope, lambda: scope.display_data)
+    results['round trips displayed_channels'] = round_trips(scope, lambda: scope.displayed_channels)
+    results['round trips get_channel_measurement'] = round_trips(scope, lambda: scope.get_channel_measurement(1, 'vpp'))
+    scope.run()
+    results['round trips memory_depth_internal_total'] = round_trips(scope, lambda: scope.memory_depth_internal_total)
+    return results
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)),
+                                      stderr=subprocess.STDOUT)
+        return out.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_result(name, value):
+    if name.startswith('round trips'):
+        return '{0:10d}   '.format(value)
+    return '{0:10.3f} ms'.format(value * 1e3)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--depths', default='12k,120k,1.2M,12M,24M',
+        help='Comma separated memory depths (of {0}), default: all'.format(', '.join(DEPTHS)))
+    parser.add_argument('--json', metavar='FILE', help='Save the results to this JSON file')
+    parser.add_argument('--compare', metavar='FILE', help='Compare with the results saved in this JSON file')
+    args = parser.parse_args()
+
+    results = {'fixed': bench_fixed()}
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for name in args.depths.split(','):
+            results[name] = bench_depth(DEPTHS[name], tmpdir)
+    finally:
+        os.rmdir(tmpdir)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+
+    for group, values in results.items():
+        print('[{0}]'.format(group))
+        for name, value in values.items():
+            line = '  {0:<42s} {1}'.format(name, format_result(name, value))
+            old = previous.get(group, {}).get(name)
+            if old:
+                line += '   {0:+7.1f} %'.format((value - old) / float(old) * 100)
+            print(line)
+
+    if args.json:
+        meta = {'commit': git_commit(), 'python': platform.python_version(),
+                'machine': platform.machine(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        with open(args.json, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
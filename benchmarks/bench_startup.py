@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Startup benchmark for the ds1054z package
+
+Measures the time it takes to import the package and the CLI module
+(each in a fresh interpreter) and to create DS1054Z instances.
+No oscilloscope is needed: the *IDN? query is answered by the simulator.
+
+Run it from the repository root:
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --json > startup.json
+
+The JSON output can be compared between commits.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def import_time(module, repeat):
+    """ Best wall time (in s) of importing module in a fresh interpreter """
+    code = ('import time; t0 = time.perf_counter(); import {0}; '
+            'print(time.perf_counter() - t0)'.format(module))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'),
+                                         env.get('PYTHONPATH', '')])
+    times = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code], env=env)
+        times.append(float(out.decode('ascii')))
+    return min(times)
+
+def best_of(func, number, repeat):
+    """ Best time (in s) per call of func """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    from ds1054z import DS1054Z
+    from ds1054z.simulator import SimulatorTransport
+
+    transport = SimulatorTransport()
+
+    def construct_verified():
+        DS1054Z._identity_cache.clear()
+        DS1054Z('192.0.2.1', transport=transport)
+
+    def construct_cached():
+        DS1054Z('192.0.2.1', transport=transport)
+
+    def construct_unverified():
+        DS1054Z('192.0.2.1', verify_identity=False)
+
+    def snap_values():
+        from ds1054z import _closest_value
+        for val in (3e-9, 1.1e-3, 0.7, 42., 9e1):
+            _closest_value(DS1054Z.possible_timebase_scale_values, val)
+            _closest_value(DS1054Z.possible_channel_scale_values, val)
+            _closest_value(DS1054Z.possible_probe_ratio_values, val)
+
+    results = [
+        ('import ds1054z', import_time('ds1054z', args.repeat)),
+        ('import ds1054z.cli', import_time('ds1054z.cli', args.repeat)),
+        ('DS1054Z() verifying identity', best_of(construct_verified, 1000, args.repeat)),
+        ('DS1054Z() with cached identity', best_of(construct_cached, 1000, args.repeat)),
+        ('DS1054Z(verify_identity=False)', best_of(construct_unverified, 1000, args.repeat)),
+        ('15x closest value snapping', best_of(snap_values, 1000, args.repeat)),
+    ]
+    if args.json:
+        print(json.dumps(dict(results), indent=2, sort_keys=True))
+    else:
+        for name, seconds in results:
+            print('{0:<36s} {1:10.1f} µs'.format(name, seconds * 1e6))
+
+if __name__ == "__main__":
+    main()
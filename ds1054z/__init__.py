@@ -10,7 +10,11 @@ import re
 import time
 import sys
 import struct
-import decimal
+import bisect
+import functools
+import contextlib
+import threading
+from collections import OrderedDict, namedtuple
 
 import vxi11
 
@@ -21,6 +25,202 @@ try:
 except AttributeError:
     clock = time.time
 
+def _scale_values(min_val, max_val, mantissae):
+    """
+    Lists the values from min_val to max_val (both included)
+    which are a mantissa from mantissae times a power of ten.
+    """
+    possible_values = []
+    # initialize with the decimal mantissa and exponent for min_val
+    mantissa_idx = mantissae.index(int('{0:e}'.format(min_val)[0]))
+    exponent = int('{0:e}'.format(min_val).split('e')[1])
+    value = min_val
+    while value <= max_val:
+        possible_values.append(value)
+        # construct the next value:
+        mantissa_idx += 1
+        mantissa_idx %= len(mantissae)
+        if mantissa_idx == 0: exponent += 1
+        # parsing the string gives the float closest to the decimal value
+        value = float('{0}e{1}'.format(mantissae[mantissa_idx], exponent))
+    return tuple(possible_values)
+
+def _closest_value(sorted_values, value):
+    """
+    Returns the entry of sorted_values closest to value
+    (the smaller one if there is a tie).
+    """
+    idx = bisect.bisect_left(sorted_values, value)
+    if idx == 0:
+        return sorted_values[0]
+    if idx == len(sorted_values):
+        return sorted_values[-1]
+    lower, upper = sorted_values[idx-1], sorted_values[idx]
+    return lower if value - lower <= upper - value else upper
+
+class _TracedOperation(object):
+    """ Context of a high-level operation reported to the tracers of a scope """
+
+    def __init__(self, scope, name):
+        self.scope = scope
+        self.name = name
+
+    def __enter__(self):
+        stack = self.scope._operations
+        self.parent = stack[-1][0] if stack else None
+        # stack entries: [operation name, current chunk index]
+        stack.append([self.name, None])
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = clock()
+        self.scope._operations.pop()
+        from ds1054z.tracing import Operation
+        self.scope._notify_tracers(Operation(self.name, self.start, end, self.parent))
+        return False
+
+def _traced(func):
+    """
+    Decorator for methods of DS1054Z making them a high-level operation
+    as reported to the tracers (see :py:meth:`DS1054Z.add_tracer`).
+    """
+    code = func.__code__
+    arg_names = code.co_varnames[1:code.co_argcount]
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not self._tracers:
+            return func(self, *args, **kwargs)
+        params = []
+        for name, value in list(zip(arg_names, args)) + list(kwargs.items()):
+            label = _trace_param(self, name, value)
+            if label is not None:
+                params.append(label)
+        name = '{0}({1})'.format(func.__name__, ', '.join(params)) if params else func.__name__
+        with _TracedOperation(self, name):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+def _trace_param(scope, name, value):
+    """
+    Formats an argument of a traced operation for its label (like ``CHAN1``).
+    Returns None for arguments left out of the label: None and anything
+    but numbers and strings (callbacks, checkpoints, settings, ...).
+    """
+    if name in ('channel', 'channels'):
+        channels = value if isinstance(value, (list, tuple)) else [value]
+        return ','.join(str(scope._interpret_channel(channel)) for channel in channels)
+    if isinstance(value, (list, tuple)) and all(isinstance(item, (str, int, float)) for item in value):
+        return ','.join(str(item) for item in value)
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    return None
+
+class TransferError(IOError):
+    """
+    Reading the internal memory of the scope failed (even after retrying).
+
+    :ivar checkpoint: The :py:class:`TransferCheckpoint` of the transfer
+                      to continue it with (or None if it cannot be continued)
+    """
+
+    def __init__(self, msg, checkpoint=None):
+        super(TransferError, self).__init__(msg)
+        self.checkpoint = checkpoint
+
+class TransferCheckpoint(object):
+    """
+    The state of a transfer of the internal memory: the bytes received so far
+    and the acquisition they belong to. Pass it as ``checkpoint`` to
+    :py:meth:`DS1054Z.get_waveform_bytes` to continue the transfer where it stopped,
+    also from another instance (after reconnecting to the scope):
+
+    >>> try:
+    ...     data = scope.get_waveform_bytes(1, mode='RAW')
+    ... except ds1054z.TransferError as e:
+    ...     scope = ds1054z.DS1054Z('192.168.0.23')
+    ...     data = scope.get_waveform_bytes(1, mode='RAW', checkpoint=e.checkpoint)
+
+    The transfer can only be continued if the scope is still stopped
+    on the same acquisition: its preamble and the first bytes of the memory are compared.
+
+    :ivar str channel: The channel being read
+    :ivar str mode: The waveform mode (RAW or MAXimum)
+    :ivar dict preamble: The :py:attr:`DS1054Z.waveform_preamble_dict` of the acquisition
+    :ivar bytearray data: The bytes received so far
+    """
+
+    #: The number of bytes compared with the memory of the scope when continuing a transfer
+    probe_size = 1000
+
+    def __init__(self, channel, mode, preamble):
+        self.channel = channel
+        self.mode = mode
+        self.preamble = preamble
+        self.data = bytearray()
+
+    @property
+    def complete(self):
+        """ Whether all bytes of the memory have been received """
+        return len(self.data) >= self.preamble['pnts']
+
+    def __repr__(self):
+        return '<TransferCheckpoint {0} {1}: {2} of {3} bytes>'.format(
+            self.channel, self.mode, len(self.data), self.preamble['pnts'])
+
+class TransferCancelled(TransferError):
+    """
+    A transfer was cancelled with a :py:class:`CancellationToken`.
+    Transfers of the internal memory can be continued with its checkpoint.
+    """
+
+class CancellationToken(object):
+    """
+    Cancels long transfers (like :py:meth:`DS1054Z.get_waveform_bytes` in RAW mode)
+    from another thread or a signal handler. The transfer stops before its next
+    chunk and raises :py:class:`TransferCancelled`.
+
+    >>> token = ds1054z.CancellationToken()
+    >>> threading.Timer(5, token.cancel).start()
+    >>> scope.get_waveform_bytes(1, mode='RAW', cancel=token)
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """ Requests the cancellation """
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        """ Whether the cancellation was requested """
+        return self._event.is_set()
+
+class TransferProgress(namedtuple('TransferProgress', 'done total elapsed rate')):
+    """
+    The progress of a long transfer as passed to progress callbacks:
+    bytes done out of total, the time elapsed (in s) and the throughput (in bytes/s).
+    """
+
+    @property
+    def eta(self):
+        """ The estimated remaining time (in s), None before the throughput is known """
+        if not self.rate:
+            return None
+        return (self.total - self.done) / self.rate
+
+    def __str__(self):
+        eta = '?' if self.eta is None else '{0:.0f} s'.format(self.eta)
+        return '{0:.1f}/{1:.1f} MB, {2:.2f} MB/s, ETA {3}'.format(
+            self.done / 1e6, self.total / 1e6, self.rate / 1e6, eta)
+
+def _transfer_progress(done, total, start, resumed=0):
+    """ The progress of a transfer started at start (of which resumed bytes were done before) """
+    elapsed = clock() - start
+    return TransferProgress(done, total, elapsed, (done - resumed) / elapsed if elapsed > 0 else 0.0)
+
 class DS1054Z(vxi11.Instrument):
     """
     This class represents the oscilloscope.
@@ -29,6 +229,30 @@ class DS1054Z(vxi11.Instrument):
     :ivar vendor:  should be ``'RIGOL TECHNOLOGIES'``
     :ivar serial:  e.g. ``'DS1ZA118171631'``
     :ivar firmware: e.g. ``'00.04.03.SP1'``
+
+    The identity of the scope is verified by querying ``*IDN?`` when creating
+    the instance. You can change this with the keyword argument ``verify_identity``:
+
+    * ``True`` (default): query and verify the identity right away,
+    * ``'lazy'``: defer this until one of the attributes above is accessed,
+    * ``False``: don't verify the identity at all (the attributes above
+      will still be fetched from the scope when accessed).
+
+    The identity is cached per connection (the type of transport, host and port)
+    for the lifetime of the process, so creating another instance connecting
+    the same way doesn't query it again.
+
+    The timeout of long transfers (chunks of the internal memory, screenshots)
+    is extended by the time they are expected to take, estimated from the
+    throughput measured so far (see :py:meth:`transfer_timeout`).
+
+    Instead of the VXI-11 connection to host, a different transport can be used
+    by passing it as the keyword argument ``transport``. It needs to provide
+    the methods ``write_raw(data)``, ``read_raw(num=-1)``, and ``close()``
+    (see :py:mod:`ds1054z.transport`).
+
+    If the VXI-11 core channel of the device is known to listen on a specific port,
+    pass it as ``vxi11_port`` to connect without asking the portmapper first.
     """
 
     IDN_PATTERN = r'^RIGOL TECHNOLOGIES,DS1\d\d\dZ( Plus)?,'
@@ -36,6 +260,8 @@ class DS1054Z(vxi11.Instrument):
     H_GRID = 12
     SAMPLES_ON_DISPLAY = 1200
     DISPLAY_DATA_BYTES = 100000
+    #: Number of bytes read at a time by :py:meth:`get_display_data` with progress or cancellation
+    DISPLAY_DATA_PIECE = 8192
     SCALE_MANTISSAE = (1, 2, 5)
     MIN_TIMEBASE_SCALE = 5E-9
     MAX_TIMEBASE_SCALE = 50E0
@@ -45,52 +271,339 @@ class DS1054Z(vxi11.Instrument):
     MAX_PROBE_RATIO = 1000
     CHANNEL_LIST = ("CHAN1", "CHAN2", "CHAN3", "CHAN4", "MATH")
 
+    possible_probe_ratio_values = _scale_values(MIN_PROBE_RATIO, MAX_PROBE_RATIO, SCALE_MANTISSAE)
+    possible_timebase_scale_values = _scale_values(MIN_TIMEBASE_SCALE, MAX_TIMEBASE_SCALE, SCALE_MANTISSAE)
+    possible_channel_scale_values = _scale_values(MIN_CHANNEL_SCALE, MAX_CHANNEL_SCALE, SCALE_MANTISSAE)
+    possible_memory_depth_values = (12000, 120000, 1200000, 12000000, 24000000,
+                                     6000,  60000,  600000,  6000000, 12000000,
+                                     3000,  30000,  300000,  3000000,  6000000)
+    _memory_depth_steps = tuple(sorted(set(possible_memory_depth_values)))
+
+    #: Maximum number of queries joined to a compound query by :py:meth:`get_measurements`
+    measurement_batch_size = 10
+    #: Maximum number of queries or commands joined to a compound one by :py:meth:`configure`
+    setting_batch_size = 10
+
+    #: Number of bytes requested per ``:WAVeform:DATA?`` when reading the internal memory
+    waveform_chunk_size = 250000
+    #: How often a failed chunk of the internal memory is requested again
+    chunk_retries = 3
+    #: The delay before the first retry of a chunk (in s), doubled for every further retry
+    chunk_retry_backoff = 0.2
+
+    #: The throughput (in bytes/s) assumed for timeouts until it was measured
+    assumed_throughput = 100e3
+    #: Multiple of the expected duration of a transfer added to the timeout
+    transfer_timeout_factor = 3.0
+
+    #: ``*IDN?`` strings of the scopes identified so far (by :py:attr:`_identity_key`)
+    _identity_cache = {}
+
     def __init__(self, host, *args, **kwargs):
         self.start = clock()
+        verify_identity = kwargs.pop('verify_identity', True)
+        self.transport = kwargs.pop('transport', None)
+        self.vxi11_port = kwargs.pop('vxi11_port', None)
         super(DS1054Z, self).__init__(host, *args, **kwargs)
-        idn = self.idn
-        match = re.match(self.IDN_PATTERN, idn)
-        if not match:
-            msg = "Unknown device identification:\n%s\n" \
-                  "If you believe this device should be supported " \
-                  "by this package, feel free to contact " \
-                  "the maintainer with this information." % idn
-            raise NameError(msg)
-        idn = idn.split(',')
-        self.vendor = idn[0]
-        self.product = idn[1]
-        self.serial = idn[2]
-        self.firmware = idn[3]
+        self._verify_identity = bool(verify_identity)
+        self._identity = None
         self.mask_begin_num = None
-        self.possible_probe_ratio_values = self._populate_possible_values('PROBE_RATIO')
-        self.possible_timebase_scale_values = self._populate_possible_values('TIMEBASE_SCALE')
-        self.possible_channel_scale_values = self._populate_possible_values('CHANNEL_SCALE')
-        self.possible_memory_depth_values = (12000, 120000, 1200000, 12000000, 24000000,
-                                              6000,  60000,  600000,  6000000, 12000000,
-                                              3000,  30000,  300000,  3000000,  6000000)
+        self.metrics = None
+        self._tracers = []
+        self._operations = []
+        self._pending_query = None
+        self.recording = None
+        #: The throughput of long transfers measured so far (in bytes/s), None before the first one
+        self.throughput = None
+        self._bytes_read = 0
+        #: The memory depth according to the preamble of the last read of the internal memory
+        self.captured_memory_depth = None
+        #: The :py:attr:`waveform_preamble` fetched last (like by :py:meth:`get_waveform_bytes`)
+        self.last_waveform_preamble = None
+        self._modelled_memory_depth = None
+        # called between two chunks of the internal memory, returns True if it used
+        # the scope meanwhile (set by ds1054z.shared.SharedScope to serve urgent requests)
+        self._between_chunks = None
+        if verify_identity is True:
+            self._identify()
+
+    def _identify(self):
+        """ Fetches (and verifies) the identity of the scope, if not done yet """
+        if self._identity is not None:
+            return self._identity
+        idn = self._identity_cache.get(self._identity_key)
+        if idn is None:
+            idn = self.idn
+        if self._verify_identity:
+            match = re.match(self.IDN_PATTERN, idn)
+            if not match:
+                msg = "Unknown device identification:\n%s\n" \
+                      "If you believe this device should be supported " \
+                      "by this package, feel free to contact " \
+                      "the maintainer with this information." % idn
+                raise NameError(msg)
+        self._identity_cache[self._identity_key] = idn
+        idn = idn.split(',')
+        self._identity = (idn + [''] * 4)[:4]
+        return self._identity
+
+    @property
+    def _identity_key(self):
+        """ The key of the identity cache: the type of transport, host and port """
+        port = getattr(self.transport, 'port', self.vxi11_port)
+        return (type(self.transport), self.host, port)
+
+    @property
+    def vendor(self):
+        return self._identify()[0]
+
+    @property
+    def product(self):
+        return self._identify()[1]
+
+    @property
+    def serial(self):
+        return self._identify()[2]
+
+    @property
+    def firmware(self):
+        return self._identify()[3]
 
     def clock(self):
         return clock() - self.start
 
     def log_timing(self, msg):
-        logger.info('{0:.3f} - {1}'.format(self.clock(), msg))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('{0:.3f} - {1}'.format(self.clock(), msg))
+
+    def enable_metrics(self, metrics=None):
+        """
+        Starts collecting metrics of all transactions with the scope.
+
+        :param metrics: An existing instance to record to (to share it between
+                        several scopes, for example). A new one is created if omitted.
+        :type metrics: ds1054z.metrics.Metrics
+        :return: The instance the metrics are being recorded to
+        :rtype: ds1054z.metrics.Metrics
+        """
+        if metrics is None:
+            from ds1054z.metrics import Metrics
+            metrics = Metrics(labels={'host': self.host})
+        self.metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        """ Stops collecting metrics (see :py:meth:`enable_metrics`) """
+        self.metrics = None
+        self._pending_query = None
+
+    def add_tracer(self, callback):
+        """
+        Registers a tracer: a callable which will be called with a
+        :py:class:`ds1054z.tracing.Transaction` for every write and read and with a
+        :py:class:`ds1054z.tracing.Operation` after every high-level operation.
+        See :py:mod:`ds1054z.tracing`.
+        """
+        self._tracers.append(callback)
+
+    def remove_tracer(self, callback):
+        """ Unregisters a tracer added with :py:meth:`add_tracer` """
+        self._tracers.remove(callback)
+
+    @contextlib.contextmanager
+    def trace(self, recorder=None):
+        """
+        Context manager recording all events while it's active:
+
+        >>> with scope.trace() as recorder:
+        ...     scope.get_waveform_bytes(1, mode='RAW')
+        >>> recorder.save('raw-read.trace.json')
+
+        :param recorder: A recorder to use instead of a new one
+        :type recorder: ds1054z.tracing.TraceRecorder
+        :return: the recorder (yielded)
+        """
+        if recorder is None:
+            from ds1054z.tracing import TraceRecorder
+            recorder = TraceRecorder()
+        self.add_tracer(recorder)
+        try:
+            yield recorder
+        finally:
+            self.remove_tracer(recorder)
+
+    def start_recording(self, filename):
+        """
+        Starts recording all transactions with the scope to a session file
+        which can be played back with :py:func:`ds1054z.recording.replay`.
+
+        :param str filename: The session file (compressed if ending with ``.gz``)
+        :return: The session writer
+        :rtype: ds1054z.recording.SessionWriter
+        """
+        from ds1054z.recording import SessionWriter
+        self.stop_recording()
+        meta = {'host': self.host, 'idn': ','.join(self._identify())}
+        self.recording = SessionWriter(filename, meta=meta)
+        return self.recording
+
+    def stop_recording(self):
+        """ Stops recording (see :py:meth:`start_recording`) and closes the session file """
+        recording, self.recording = self.recording, None
+        if recording is not None:
+            recording.close()
+
+    @contextlib.contextmanager
+    def record(self, filename):
+        """
+        Context manager recording all transactions while it's active:
+
+        >>> with scope.record('raw-read.ds1054z.gz'):
+        ...     scope.get_waveform_bytes(1, mode='RAW')
+
+        :param str filename: The session file (compressed if ending with ``.gz``)
+        :return: the session writer (yielded)
+        """
+        recording = self.start_recording(filename)
+        try:
+            yield recording
+        finally:
+            self.stop_recording()
+
+    def transfer_timeout(self, nbytes, base=None):
+        """
+        The timeout for a transfer of nbytes: the base timeout plus
+        :py:attr:`transfer_timeout_factor` times the duration expected
+        at the throughput measured so far (or :py:attr:`assumed_throughput`).
+
+        :param int nbytes: The expected number of bytes
+        :param float base: The base timeout (in s), default: the timeout of the connection
+        """
+        if base is None:
+            base = self.timeout if self.transport is None else getattr(self.transport, 'timeout', 0)
+        throughput = self.throughput or self.assumed_throughput
+        return base + self.transfer_timeout_factor * nbytes / throughput
+
+    @contextlib.contextmanager
+    def _sized_transfer(self, nbytes):
+        """
+        Applies the timeout for a transfer of about nbytes and measures
+        its throughput (from the number of bytes actually read)
+        """
+        target = self if self.transport is None else self.transport
+        base = getattr(target, 'timeout', None)
+        if base is not None:
+            target.timeout = self.transfer_timeout(nbytes, base)
+        start, bytes_read = clock(), self._bytes_read
+        try:
+            yield
+        finally:
+            if base is not None:
+                target.timeout = base
+        duration = clock() - start
+        nbytes = self._bytes_read - bytes_read
+        if nbytes >= 10000 and duration > 0:
+            rate = nbytes / duration
+            self.throughput = rate if self.throughput is None else (self.throughput + rate) / 2
+
+    def _notify_tracers(self, event):
+        for tracer in list(self._tracers):
+            tracer(event)
+
+    def _trace_transaction(self, cmd, direction, nbytes, start, end):
+        from ds1054z.tracing import Transaction
+        operation = chunk = None
+        if self._operations:
+            operation = self._operations[-1][0]
+            for entry in reversed(self._operations):
+                if entry[1] is not None:
+                    chunk = entry[1]
+                    break
+        cmd = cmd.decode(self.ENCODING, 'replace').strip()
+        self._notify_tracers(Transaction(cmd, direction, nbytes, start, end, operation, chunk))
+
+    def _trace_chunk(self, idx):
+        """ Marks the following transactions as belonging to chunk idx of the current operation """
+        if self._operations:
+            self._operations[-1][1] = idx
 
     def write_raw(self, cmd, *args, **kwargs):
-        self.log_timing('starting write')
-        logger.debug('sending: ' + repr(cmd))
-        super(DS1054Z, self).write_raw(cmd, *args, **kwargs)
-        self.log_timing('finishing write')
+        # checking the log level first avoids formatting messages nobody reads
+        timing = logger.isEnabledFor(logging.INFO)
+        if timing:
+            self.log_timing('starting write')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('sending: ' + repr(cmd))
+        metrics, tracers, recording = self.metrics, self._tracers, self.recording
+        observed = metrics is not None or tracers or recording is not None
+        if observed:
+            start = clock()
+        if self.transport is not None:
+            self.transport.write_raw(cmd)
+        else:
+            super(DS1054Z, self).write_raw(cmd, *args, **kwargs)
+        if timing:
+            self.log_timing('finishing write')
+        if observed:
+            end = clock()
+            if recording is not None:
+                recording.add(b'W', start, end, cmd)
+            if tracers:
+                self._trace_transaction(cmd, 'write', len(cmd), start, end)
+            if b'?' in cmd:
+                # the transaction will be recorded once the answer was read
+                self._pending_query = (cmd, start, len(cmd))
+            elif metrics is not None:
+                metrics.record(cmd, end - start, len(cmd), 0)
 
     def read_raw(self, *args, **kwargs):
-        self.log_timing('starting read')
-        data = super(DS1054Z, self).read_raw(*args, **kwargs)
-        self.log_timing('finished reading {0} bytes'.format(len(data)))
-        if len(data) > 200:
-            logger.debug('received a long answer: {0} ... {1}'.format(format_hex(data[0:10]), format_hex(data[-10:])))
+        timing = logger.isEnabledFor(logging.INFO)
+        if timing:
+            self.log_timing('starting read')
+        metrics, tracers, recording = self.metrics, self._tracers, self.recording
+        observed = metrics is not None or tracers or recording is not None
+        if observed:
+            start = clock()
+        if self.transport is not None:
+            data = self.transport.read_raw(*args, **kwargs)
         else:
-            logger.debug('received: ' + repr(data))
+            data = super(DS1054Z, self).read_raw(*args, **kwargs)
+        self._bytes_read += len(data)
+        if observed:
+            end = clock()
+            if recording is not None:
+                recording.add(b'R', start, end, data)
+            cmd, query_start, bytes_out = self._pending_query or (b'', start, 0)
+            self._pending_query = None
+            if tracers:
+                self._trace_transaction(cmd, 'read', len(data), start, end)
+            if metrics is not None:
+                metrics.record(cmd, end - query_start, bytes_out, len(data))
+        if timing:
+            self.log_timing('finished reading {0} bytes'.format(len(data)))
+        if logger.isEnabledFor(logging.DEBUG):
+            if len(data) > 200:
+                logger.debug('received a long answer: {0} ... {1}'.format(format_hex(data[0:10]), format_hex(data[-10:])))
+            else:
+                logger.debug('received: ' + repr(data))
         return data
 
+    def open(self):
+        """ Opens the connection to the scope (done automatically when needed) """
+        if self.transport is not None:
+            return
+        if self.link is None and self.client is None and self.vxi11_port:
+            self.client = vxi11.vxi11.CoreClient(self.host, port=self.vxi11_port)
+        super(DS1054Z, self).open()
+
+    def close(self):
+        """ Closes the connection to the scope """
+        self.stop_recording()
+        if self.transport is not None:
+            self.transport.close()
+        else:
+            super(DS1054Z, self).close()
+
     def query(self, message, *args, **kwargs):
         """
         Write a message to the scope and read back the answer.
@@ -123,6 +636,7 @@ class DS1054Z(vxi11.Instrument):
         return self.query(':TRIGger:STATus?') in ('TD', 'WAIT', 'RUN', 'AUTO')
 
     @property
+    @_traced
     def waveform_preamble(self):
         """
         Provides the values returned by the command ``:WAVeform:PREamble?``.
@@ -136,11 +650,20 @@ class DS1054Z(vxi11.Instrument):
         where it returns a :py:obj:`dict` instead of a :py:obj:`tuple`.
 
         This property will be fetched from the scope every time you access it.
+        The values fetched last are kept in :py:attr:`last_waveform_preamble`.
 
         :return: (fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref)
         :rtype: tuple of float and int values
         """
-        values = self.query(":WAVeform:PREamble?")
+        self.last_waveform_preamble = self.parse_waveform_preamble(self.query(":WAVeform:PREamble?"))
+        return self.last_waveform_preamble
+
+    @staticmethod
+    def parse_waveform_preamble(values):
+        """
+        Converts the answer to ``:WAVeform:PREamble?`` into a tuple
+        (see :py:attr:`waveform_preamble`).
+        """
         #
         # From the Programming Guide:
         # format: <format>,<type>,<points>,<count>,<xincrement>,<xorigin>,<xreference>,<yincrement>,<yorigin>,<yreference>
@@ -178,7 +701,8 @@ class DS1054Z(vxi11.Instrument):
         keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
         return dict(zip(keys, self.waveform_preamble))
 
-    def get_waveform_samples(self, channel, mode='NORMal'):
+    @_traced
+    def get_waveform_samples(self, channel, mode='NORMal', checkpoint=None, progress=None, cancel=None):
         """
         Returns the waveform voltage samples of the specified channel.
 
@@ -200,24 +724,42 @@ class DS1054Z(vxi11.Instrument):
         :param channel: The channel name (like 'CHAN1' or 1).
         :type channel: int or str
         :param str mode: can be 'NORMal', 'MAX', or 'RAW'
+        :param TransferCheckpoint checkpoint: see :py:meth:`get_waveform_bytes`
+        :param progress: see :py:meth:`get_waveform_bytes`
+        :param CancellationToken cancel: see :py:meth:`get_waveform_bytes`
         :return: voltage samples
         :rtype: list of float values
         """
 
-        buff = self.get_waveform_bytes(channel, mode=mode)
-        fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref = self.waveform_preamble
+        buff = self.get_waveform_bytes(channel, mode=mode, checkpoint=checkpoint, progress=progress, cancel=cancel)
+        return self.bytes_to_samples(buff, self.waveform_preamble, self.mask_begin_num)
+
+    @staticmethod
+    def bytes_to_samples(buff, preamble, mask_begin_num=None):
+        """
+        Converts waveform bytes to voltage samples.
+
+        :param bytes buff: The bytes as returned by :py:meth:`get_waveform_bytes`
+        :param tuple preamble: The :py:attr:`waveform_preamble` belonging to them
+        :param tuple mask_begin_num: The padding added by :py:meth:`get_waveform_bytes`
+                                     (:py:attr:`mask_begin_num` after reading), replaced by NaN
+        :return: voltage samples
+        :rtype: list of float values
+        """
+        fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref = preamble
         samples = list(struct.unpack(str(len(buff))+'B', buff))
         samples = [(val - yorig - yref)*yinc for val in samples]
-        if self.mask_begin_num:
-            at_begin = self.mask_begin_num[0]
-            num = self.mask_begin_num[1]
+        if mask_begin_num:
+            at_begin = mask_begin_num[0]
+            num = mask_begin_num[1]
             if at_begin:
                 samples = [float('nan')] * num + samples[num:]
             else:
                 samples = samples[:-num] + [float('nan')] * num
         return samples
 
-    def get_waveform_bytes(self, channel, mode='NORMal'):
+    @_traced
+    def get_waveform_bytes(self, channel, mode='NORMal', checkpoint=None, progress=None, cancel=None):
         """
         Get the waveform data for a specific channel as :py:obj:`bytes`.
         (In most cases you would want to use the higher level
@@ -235,19 +777,29 @@ class DS1054Z(vxi11.Instrument):
 
         In case the internal memory will be read, the data request will
         automatically be split into chunks if it's impossible to read
-        all bytes at once.
+        all bytes at once. The length of every chunk is checked and
+        a failed chunk is requested again (see :py:attr:`chunk_retries`).
+        If it keeps failing, a :py:class:`TransferError` is raised,
+        carrying a :py:class:`TransferCheckpoint` to continue the transfer with.
 
         :param channel: The channel name (like CHAN1, ...). Alternatively specify the channel by its number (as integer).
         :type channel: int or str
         :param str mode: can be NORMal, MAXimum, or RAW
+        :param TransferCheckpoint checkpoint: The checkpoint of an interrupted transfer
+                                              of the internal memory to continue
+        :param progress: A callable called with a :py:class:`TransferProgress`
+                         after every chunk of the internal memory
+        :param CancellationToken cancel: A token to cancel reading the internal
+                                         memory with (see :py:class:`TransferCancelled`)
         :return: The waveform data
         :rtype: bytes
         """
         channel = self._interpret_channel(channel)
-        if mode.upper().startswith('NORM') or (self.running and mode.upper().startswith('MAX')):
+        if checkpoint is None and (mode.upper().startswith('NORM') or (self.running and mode.upper().startswith('MAX'))):
             return self._get_waveform_bytes_screen(channel, mode=mode)
         else:
-            return self._get_waveform_bytes_internal(channel, mode=mode)
+            return self._get_waveform_bytes_internal(channel, mode=mode, checkpoint=checkpoint,
+                                                     progress=progress, cancel=cancel)
 
     def _get_waveform_bytes_screen(self, channel, mode='NORMal'):
         """
@@ -297,57 +849,107 @@ class DS1054Z(vxi11.Instrument):
             self.mask_begin_num = None
         return buff
 
-    def _get_waveform_bytes_internal(self, channel, mode='RAW'):
+    def _get_waveform_bytes_internal(self, channel, mode='RAW', checkpoint=None, progress=None, cancel=None):
         """
         This function returns the waveform bytes from the scope if you desire
         to read the bytes corresponding to the internal (deep) memory.
         """
         channel = self._interpret_channel(channel)
         assert mode.upper().startswith('MAX') or mode.upper().startswith('RAW')
+        if checkpoint is not None and (checkpoint.channel, checkpoint.mode) != (channel, mode):
+            raise ValueError('The checkpoint belongs to a transfer of {0} in mode {1}'.format(
+                checkpoint.channel, checkpoint.mode))
         if self.running:
+            if checkpoint is not None:
+                raise TransferError('Cannot continue the transfer: the scope was started again')
             self.stop()
         self.write(":WAVeform:SOURce " + channel)
         self.write(":WAVeform:FORMat BYTE")
         self.write(":WAVeform:MODE " + mode)
         wp = self.waveform_preamble_dict
+        if checkpoint is None:
+            checkpoint = TransferCheckpoint(channel, mode, wp)
+        else:
+            self._verify_checkpoint(checkpoint, wp)
+        self._check_memory_depth_model(wp)
         pnts = wp['pnts']
-        buff = b""
-        max_byte_len = 250000
-        pos = 1
-        while len(buff) < pnts:
-            self.write(":WAVeform:STARt {0}".format(pos))
+        max_byte_len = self.waveform_chunk_size
+        start, resumed = clock(), len(checkpoint.data)
+        while len(checkpoint.data) < pnts:
+            if len(checkpoint.data) > resumed and self._between_chunks is not None and self._between_chunks():
+                # other operations may have changed the waveform settings
+                self.write(":WAVeform:SOURce " + channel)
+                self.write(":WAVeform:FORMat BYTE")
+                self.write(":WAVeform:MODE " + mode)
+                # or even the acquisition, the bytes must not be spliced from two
+                if self.running:
+                    raise TransferError('The transfer of {0} was interrupted: '
+                                        'the scope was started again'.format(channel), checkpoint)
+                self._verify_checkpoint(checkpoint, self.waveform_preamble_dict)
+            if cancel is not None and cancel.cancelled:
+                raise TransferCancelled('The transfer of {0} was cancelled'.format(channel), checkpoint)
+            pos = len(checkpoint.data) + 1
+            self._trace_chunk((pos - 1) // max_byte_len)
             end_pos = min(pnts, pos+max_byte_len-1)
-            self.write(":WAVeform:STOP {0}".format(end_pos))
-            tmp_buff = self.query_raw(":WAVeform:DATA?")
-            buff += DS1054Z.decode_ieee_block(tmp_buff)
-            pos += max_byte_len
-        return buff
+            checkpoint.data += self._read_memory_window(pos, end_pos, checkpoint)
+            if progress is not None:
+                progress(_transfer_progress(len(checkpoint.data), pnts, start, resumed))
+        return bytes(checkpoint.data)
+
+    def _verify_checkpoint(self, checkpoint, preamble):
+        """ Makes sure the scope is still stopped on the acquisition of a checkpoint """
+        probe = min(len(checkpoint.data), checkpoint.probe_size)
+        if preamble != checkpoint.preamble or \
+           (probe and self._read_memory_window(1, probe) != bytes(checkpoint.data[:probe])):
+            raise TransferError('Cannot continue the transfer: the acquisition has changed', checkpoint)
+        logger.info('continuing the transfer of {0} at byte {1}'.format(checkpoint.channel, len(checkpoint.data)))
+
+    def _read_memory_window(self, start, stop, checkpoint=None):
+        """
+        Reads the bytes start to stop (counting from 1, both included)
+        of the internal memory, retrying if this fails.
+        """
+        delay = self.chunk_retry_backoff
+        for attempt in range(self.chunk_retries + 1):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+                self._recover()
+            try:
+                self.write(":WAVeform:STARt {0}".format(start))
+                self.write(":WAVeform:STOP {0}".format(stop))
+                with self._sized_transfer(stop - start + 1):
+                    data = DS1054Z.decode_ieee_block(self.query_raw(":WAVeform:DATA?"))
+            except (vxi11.vxi11.Vxi11Exception, IOError, ValueError, IndexError) as e:
+                error = '{0}: {1}'.format(e.__class__.__name__, e)
+            else:
+                if len(data) == stop - start + 1:
+                    return data
+                error = 'received {0} instead of {1} bytes'.format(len(data), stop - start + 1)
+            logger.warning('reading the bytes {0}-{1} failed (attempt {2}): {3}'.format(start, stop, attempt + 1, error))
+        raise TransferError('Reading the bytes {0}-{1} failed {2} times, last error: {3}'.format(
+            start, stop, self.chunk_retries + 1, error), checkpoint)
+
+    def _recover(self):
+        """ Discards answers still pending after a failed transaction """
+        self._pending_query = None
+        if self.transport is None:
+            try:
+                self.clear()
+            except (vxi11.vxi11.Vxi11Exception, IOError) as e:
+                logger.warning('clearing the device failed: {0}'.format(e))
 
     def _populate_possible_values(self, which):
         """
         Populates list of possible values.
 
         Uses MIN_which, MAX_which, and SCALE_MANTISSAE attributes.
+        (The lists for the default attributes are precomputed
+        as ``possible_..._values`` class attributes.)
         """
         min_val = getattr(self, 'MIN_' + which.upper())
         max_val = getattr(self, 'MAX_' + which.upper())
-        mantissae = self.SCALE_MANTISSAE
-        possible_values = []
-        # initialize with the decimal mantissa and exponent for min_val
-        mantissa_idx = mantissae.index(int('{0:e}'.format(min_val)[0]))
-        exponent = int('{0:e}'.format(min_val).split('e')[1])
-        value = min_val
-        while value <= max_val:
-            # add the value to the list of possible values
-            possible_values.append(value)
-            # construct the next value:
-            mantissa_idx += 1
-            mantissa_idx %= len(mantissae)
-            if mantissa_idx == 0: exponent += 1
-            value = '{0}e{1}'.format(mantissae[mantissa_idx], exponent)
-            value = decimal.Decimal(value)
-            value = float(value)
-        return possible_values
+        return list(_scale_values(min_val, max_val, self.SCALE_MANTISSAE))
 
     @property
     def timebase_offset(self):
@@ -388,7 +990,7 @@ class DS1054Z(vxi11.Instrument):
 
     @timebase_scale.setter
     def timebase_scale(self, new_timebase):
-        new_timebase = min(self.possible_timebase_scale_values, key=lambda x:abs(x-new_timebase))
+        new_timebase = _closest_value(self.possible_timebase_scale_values, new_timebase)
         self.write(":TIMebase:MAIN:SCALe {0}".format(new_timebase))
 
     @property
@@ -396,6 +998,7 @@ class DS1054Z(vxi11.Instrument):
         return float(self.query(':ACQuire:SRATe?'))
 
     @property
+    @_traced
     def waveform_time_values(self):
         """
         The timestamps that belong to the waveform samples accessed to
@@ -404,14 +1007,17 @@ class DS1054Z(vxi11.Instrument):
         Access this property only after fetching your waveform data,
         otherwise the values will not be correct.
 
-        Will be fetched every time you access this property.
+        Will be fetched every time you access this property
+        (the number of samples is taken from the same preamble,
+        the acquisition is not interrupted).
 
         :return: sample timestamps (in seconds)
         :rtype: list of float
         """
         wp = self.waveform_preamble_dict
+        # screen data with fewer points is padded to the whole screen
         tv = []
-        for i in range(self.memory_depth_curr_waveform):
+        for i in range(max(wp['pnts'], self.SAMPLES_ON_DISPLAY)):
             tv.append(wp['xinc'] * i + wp['xorig'])
         return tv
 
@@ -431,12 +1037,24 @@ class DS1054Z(vxi11.Instrument):
         :return: sample timestamps (in seconds)
         :rtype: list of :py:obj:`Decimal`
         """
-        wp = self.waveform_preamble_dict
+        return self.decimal_time_values(self.waveform_preamble_dict)
+
+    @classmethod
+    def decimal_time_values(cls, preamble):
+        """
+        The timestamps of the samples belonging to the preamble (as a dict,
+        see :py:attr:`waveform_preamble_dict`) as :py:obj:`Decimal` values
+        (like :py:attr:`waveform_time_values_decimal` without querying the scope).
+        """
+        wp = preamble
         xinc_fmt = list('{0:.6e}'.format(wp['xinc']).partition('e'))
         xinc_fmt[0] = xinc_fmt[0].rstrip('0')
         xinc_fmt = ''.join(xinc_fmt)
+        import decimal
         xinc_dec = decimal.Decimal(xinc_fmt)
-        return [decimal.Decimal(t).quantize(xinc_dec) for t in self.waveform_time_values]
+        # screen data with fewer points is padded to the whole screen
+        return [decimal.Decimal(wp['xinc'] * i + wp['xorig']).quantize(xinc_dec)
+                for i in range(max(wp['pnts'], cls.SAMPLES_ON_DISPLAY))]
 
     @staticmethod
     def format_si_prefix(number, unit=None, as_unicode=True, number_format='{0:.6f}'):
@@ -516,13 +1134,13 @@ class DS1054Z(vxi11.Instrument):
         self.write('WAVeform:MODE ' + mode)
 
     @property
+    @_traced
     def memory_depth_curr_waveform(self):
         """
         The current memory depth of the oscilloscope.
         This value is the number of samples to expect when reading the
         waveform data and depends on the status of the scope (running / stopped).
-
-        Needed by :py:attr:`waveform_time_values`.
+        The scope is not stopped to find it out (see :py:meth:`memory_depth_model`).
 
         This property will be updated every time you access it.
         """
@@ -547,29 +1165,70 @@ class DS1054Z(vxi11.Instrument):
         return int(float(mdep))
 
     @property
+    @_traced
     def memory_depth_internal_total(self):
         """
         The total number of samples in the **raw (=deep) memory** of the oscilloscope.
-        If it's running, the scope will be stopped temporarily when accessing this value.
+
+        If the memory depth is set to AUTO, the value is computed by
+        :py:meth:`memory_depth_model` from the current settings, the
+        acquisition is not interrupted.
 
         This property will be updated every time you access it.
         """
-        mdep = self.query(":ACQuire:MDEPth?")
-        if mdep == "AUTO":
-            curr_running = self.running
-            curr_mode = self.query(':WAVeform:MODE?')
-            if curr_running:
-                self.stop()
-            if curr_mode.startswith('NORM'):
-                # in this case we need to switch to RAW mode to find out the memory depth
-                self.write(':WAVeform:MODE RAW')
-                mdep = self.waveform_preamble_dict['pnts']
-                self.write(':WAVeform:MODE ' + curr_mode)
-            else:
-                mdep = self.waveform_preamble_dict['pnts']
-            if curr_running:
-                self.run()
-        return int(float(mdep))
+        return self.memory_depth_model()
+
+    def max_memory_depth(self, channels):
+        """
+        The largest memory depth possible with the given number of enabled channels.
+
+        :param int channels: The number of enabled channels (CHAN1 - CHAN4)
+        :rtype: int
+        """
+        return self._memory_depths(channels)[-1]
+
+    def _memory_depths(self, channels):
+        """ The possible memory depths (sorted) with the given number of enabled channels """
+        row = min(max(int(channels), 1), 3) - 1
+        return tuple(sorted(self.possible_memory_depth_values[row * 5:row * 5 + 5]))
+
+    @_traced
+    def memory_depth_model(self):
+        """
+        The number of samples in the **raw (=deep) memory** as it follows from
+        the settings of the scope, without stopping it or changing the
+        waveform mode. With the memory depth set to AUTO, the scope fills
+        the whole screen width (:py:attr:`H_GRID` divisions) at the current
+        sample rate, using the closest of the :py:attr:`possible_memory_depth_values`
+        for the number of enabled channels (up to :py:meth:`max_memory_depth`).
+
+        The settings are fetched with a single compound query.
+        The model is checked against the preamble whenever the internal memory
+        is read (see :py:attr:`captured_memory_depth`).
+
+        :rtype: int
+        """
+        queries = [':ACQuire:MDEPth?', ':ACQuire:SRATe?', ':TIMebase:MAIN:SCALe?']
+        queries += [':{0}:DISPlay?'.format(channel) for channel in self.CHANNEL_LIST[:4]]
+        answers = self._query_batch(queries, len(queries))
+        mdep, srate, scale = answers[:3]
+        if mdep.strip().upper() != 'AUTO':
+            depth = int(float(mdep))
+        else:
+            channels = sum(1 for answer in answers[3:] if answer.strip() in ('1', 'ON'))
+            depth = float(srate) * float(scale) * self.H_GRID
+            depth = _closest_value(self._memory_depths(channels), depth)
+        self._modelled_memory_depth = depth
+        return depth
+
+    def _check_memory_depth_model(self, preamble):
+        """ Compares the last modelled memory depth with the preamble of a capture read """
+        pnts = preamble['pnts']
+        self.captured_memory_depth = pnts
+        if self._modelled_memory_depth is not None and self._modelled_memory_depth != pnts:
+            logger.warning('the modelled memory depth {0} differs from the {1} points of the capture'.format(
+                self._modelled_memory_depth, pnts))
+        self._modelled_memory_depth = None
 
     @property
     def memory_depth(self):
@@ -611,7 +1270,7 @@ class DS1054Z(vxi11.Instrument):
             raise NameError("Cannot set memory depth when not running.")
         if type(mdepth) in (float, int):
             # determin closest memory depth:
-            new_mdepth = min(self.possible_memory_depth_values, key=lambda x:abs(x-mdepth))
+            new_mdepth = _closest_value(self._memory_depth_steps, mdepth)
         else:
             new_mdepth = mdepth
         assert new_mdepth == 'AUTO' or new_mdepth in self.possible_memory_depth_values
@@ -624,13 +1283,135 @@ class DS1054Z(vxi11.Instrument):
         The bitmap bytes of the current screen content.
         This property will be updated every time you access it.
         """
+        return self.get_display_data()
+
+    @_traced
+    def get_display_data(self, progress=None, cancel=None):
+        """
+        The bitmap bytes of the current screen content (see :py:attr:`display_data`).
+
+        With a progress callback or a cancellation token, the image is read
+        in pieces of :py:attr:`DISPLAY_DATA_PIECE` bytes (over VXI-11), reporting
+        the progress and checking for the cancellation after each of them.
+
+        :param progress: A callable called with a :py:class:`TransferProgress`
+        :param CancellationToken cancel: A token to cancel the transfer with
+        :rtype: bytes
+        """
         self.write(":DISPlay:DATA? ON,OFF,PNG")
         logger.info("Receiving screen capture...")
-        buff = self.read_raw(self.DISPLAY_DATA_BYTES)
+        with self._sized_transfer(self.DISPLAY_DATA_BYTES):
+            if progress is None and cancel is None:
+                buff = self.read_raw(self.DISPLAY_DATA_BYTES)
+            else:
+                buff = self._read_ieee_block(self.DISPLAY_DATA_PIECE, progress, cancel)
         logger.info("read {0} bytes in .display_data".format(len(buff)))
         return DS1054Z.decode_ieee_block(buff)
 
+    def _read_ieee_block(self, piece, progress=None, cancel=None):
+        """ Reads an IEEE binary data block (incl. its terminating newline) in pieces """
+        start = clock()
+        query = self._pending_query
+        buff = bytearray(self.read_raw(piece))
+        n_header_bytes = int(chr(buff[1])) + 2
+        total = n_header_bytes + int(bytes(buff[2:n_header_bytes]).decode('ascii')) + 1
+        while True:
+            if progress is not None:
+                progress(_transfer_progress(min(len(buff), total), total, start))
+            want = min(piece, total - len(buff))
+            if want <= 0:
+                break
+            if cancel is not None and cancel.cancelled:
+                self._recover()
+                raise TransferCancelled('The transfer was cancelled')
+            if query is not None:
+                # the following pieces answer the same query (nothing more was written)
+                self._pending_query = (query[0], clock(), 0)
+            data = self.read_raw(want)
+            buff += data
+            if len(data) < want:
+                # the end of the block (without the newline)
+                total = len(buff)
+        return bytes(buff)
+
+    @_traced
+    def save_setup(self):
+        """
+        Fetches the complete setup of the scope (``:SYSTem:SETup?``) as an opaque
+        block of bytes, which can be stored and restored with :py:meth:`restore_setup`.
+
+        :rtype: bytes
+        """
+        with self._sized_transfer(self.DISPLAY_DATA_BYTES):
+            return DS1054Z.decode_ieee_block(self.query_raw(":SYSTem:SETup?"))
+
+    @_traced
+    def restore_setup(self, setup):
+        """
+        Restores a setup fetched with :py:meth:`save_setup` in a single command.
+
+        :param bytes setup: The setup
+        """
+        length = str(len(setup)).encode('ascii')
+        self.write_raw(b":SYSTem:SETup #" + str(len(length)).encode('ascii') + length + setup)
+
+    @_traced
+    def configure(self, settings):
+        """
+        Brings settings of the scope to the wanted values, changing only those
+        which differ: the current values are read with compound queries and the
+        changed ones are written with compound commands (of up to
+        :py:attr:`setting_batch_size` each), in the order given.
+
+        >>> scope.configure(OrderedDict([(':TIMebase:MAIN:SCALe', 1e-3),
+        ...                              (':CHANnel1:SCALe', 0.5), (':CHANnel2:DISPlay', False)]))
+        OrderedDict([(':CHANnel1:SCALe', 0.5)])
+
+        :param dict settings: The wanted values by SCPI command header
+                              (a missing leading ``:`` is added).
+                              Numbers are compared numerically, booleans with ``1``/``ON``
+                              and ``0``/``OFF``, strings case insensitively (and with their
+                              short form, like ``NORMal`` with ``NORM``).
+        :return: The settings which were changed
+        :rtype: OrderedDict
+        """
+        headers = list(settings)
+        # after a semicolon, a header without the leading colon would be relative to the previous one
+        absolute = dict((header, header if header[:1] in ':*' else ':' + header) for header in headers)
+        current = self._query_batch([absolute[header] + '?' for header in headers], self.setting_batch_size)
+        changed = OrderedDict((header, settings[header]) for header, answer in zip(headers, current)
+                              if not self._same_setting(answer, settings[header]))
+        commands = ['{0} {1}'.format(absolute[header], self._format_setting(value))
+                    for header, value in changed.items()]
+        batch_size = max(1, self.setting_batch_size)
+        for i in range(0, len(commands), batch_size):
+            self.write(';'.join(commands[i:i + batch_size]))
+        return changed
+
+    @staticmethod
+    def _format_setting(value):
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        return str(value)
+
+    @staticmethod
+    def _same_setting(answer, wanted):
+        """ Whether the answer to a query of a setting is the wanted value """
+        answer = answer.strip()
+        if isinstance(wanted, bool):
+            return answer.upper() in (('1', 'ON') if wanted else ('0', 'OFF'))
+        if isinstance(wanted, (int, float)):
+            try:
+                value = float(answer)
+            except ValueError:
+                return False
+            return abs(value - wanted) <= 1e-6 * max(abs(value), abs(wanted))
+        wanted = str(wanted).strip()
+        short = ''.join(c for c in wanted if not c.islower())
+        return answer.upper() in (wanted.upper(), short.upper())
+
     @property
+    @_traced
     def displayed_channels(self):
         """
         The list of channels currently displayed on the scope.
@@ -676,7 +1457,7 @@ class DS1054Z(vxi11.Instrument):
         :param float ratio: Ratio of the probe connected to the channel
         """
         ratio = float(ratio)
-        ratio = min(self.possible_probe_ratio_values, key=lambda x:abs(x-ratio))
+        ratio = _closest_value(self.possible_probe_ratio_values, ratio)
         channel = self._interpret_channel(channel)
         self.write(":{0}:PROBe {1}".format(channel, ratio))
 
@@ -739,10 +1520,10 @@ class DS1054Z(vxi11.Instrument):
         channel = self._interpret_channel(channel)
         if use_closest_match:
             probe_ratio = self.get_probe_ratio(channel)
-            possible_channel_scale_values = [val * probe_ratio for val in self.possible_channel_scale_values]
-            volts = min(possible_channel_scale_values, key=lambda x:abs(x-volts))
+            volts = _closest_value(self.possible_channel_scale_values, volts / probe_ratio) * probe_ratio
         self.write(":{0}:SCALe {1}".format(channel, volts))
 
+    @_traced
     def get_channel_measurement(self, channel, item, type="CURRent"):
         """
         Measures value on a channel
@@ -753,11 +1534,72 @@ class DS1054Z(vxi11.Instrument):
         :param str type: Type of measurement, can be CURRent, MAXimum, MINimum, AVERages, DEViation
         """
         channel = self._interpret_channel(channel)
-        ret = float(self.query(":MEASure:STATistic:item? {0},{1},{2}".format(type, item, channel)))
+        return self._parse_measurement(self.query(":MEASure:STATistic:item? {0},{1},{2}".format(type, item, channel)))
+
+    @staticmethod
+    def _parse_measurement(answer):
+        ret = float(answer)
         if ret == 9.9e37: # This is a value which means that the measurement cannot be taken for some reason (channel disconnected/no edge in the trace etc.)
             return None
         return ret
 
+    def _query_batch(self, queries, batch_size):
+        """
+        Sends queries joined with semicolons to compound queries of up to batch_size
+        queries each. If the scope doesn't answer a compound query with the expected
+        number of values, its queries are sent one by one.
+
+        :return: the answers
+        :rtype: list
+        """
+        answers = []
+        batch_size = max(1, batch_size)
+        for i in range(0, len(queries), batch_size):
+            batch = queries[i:i + batch_size]
+            batch_answers = self.query(';'.join(batch)).split(';')
+            if len(batch_answers) != len(batch):
+                batch_answers = [self.query(query) for query in batch]
+            answers += batch_answers
+        return answers
+
+    @_traced
+    def get_measurements(self, channels, items, types="CURRent"):
+        """
+        Measures several values on several channels at once.
+
+        The queries are joined with semicolons to compound queries of up to
+        :py:attr:`measurement_batch_size` queries each, so that many values
+        take few round trips. If the scope doesn't answer a compound query
+        with the expected number of values, the queries are sent one by one.
+
+        >>> values = scope.get_measurements([1, 2], ['vpp', 'frequency'])
+        >>> values['CHAN2']['frequency']
+        1000.0
+
+        :param channels: The channels (names or numbers, see :py:meth:`get_channel_measurement`)
+        :type channels: list
+        :param list items: The items to measure (see :py:meth:`get_channel_measurement`)
+        :param types: The type of measurement (like CURRent), or a list of types
+        :type types: str or list
+        :return: The values by channel name and item, or by channel name, item and type
+                 if a list of types was given. Values which cannot be measured are None.
+        :rtype: dict
+        """
+        single_type = isinstance(types, str)
+        if single_type:
+            types = [types]
+        channels = [self._interpret_channel(channel) for channel in channels]
+        keys = [(channel, item, type) for channel in channels for item in items for type in types]
+        queries = [":MEASure:STATistic:item? {2},{1},{0}".format(*key) for key in keys]
+        values = [self._parse_measurement(answer) for answer in self._query_batch(queries, self.measurement_batch_size)]
+        results = OrderedDict((channel, OrderedDict()) for channel in channels)
+        for (channel, item, type), value in zip(keys, values):
+            if single_type:
+                results[channel][item] = value
+            else:
+                results[channel].setdefault(item, OrderedDict())[type] = value
+        return results
+
 def format_hex(byte_str):
     if sys.version_info >= (3, 0):
         return ' '.join( [ "{:02X}".format(x)  for x in byte_str ] )
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.accumulator` - Statistics over many captures
+===========================================================================
+
+Folds captures into per-sample statistics (count, min, max, mean and
+standard deviation) one at a time, so the memory needed doesn't grow
+with the number of captures:
+
+>>> from ds1054z.accumulator import WaveformAccumulator
+>>> acc = WaveformAccumulator()
+>>> for i in range(1000):
+...     acc.add(scope.get_waveform_samples(1))
+>>> acc.save('envelopes.csv')
+
+The mean and variance are updated with the numerically stable
+algorithm of Welford, in the form of Chan et al. for combining sets,
+which is also used to merge accumulators filled by parallel workers.
+Samples which are NaN (like the masked samples of
+:py:meth:`ds1054z.DS1054Z.get_waveform_samples`) are not counted.
+It depends on NumPy (``pip install ds1054z[analysis]``).
+"""
+
+import numpy as np
+
+class WaveformAccumulator(object):
+    """
+    Per-sample statistics over captures of the same length.
+
+    :param float xinc: The time between two samples (in s), used for the time column of exports
+    :param float xorig: The time of the first sample (in s)
+
+    :ivar int captures: The number of captures added
+    :ivar count: The number of (non-NaN) values per sample
+    :ivar min: The per-sample minimum (the lower envelope)
+    :ivar max: The per-sample maximum (the upper envelope)
+    :ivar mean: The per-sample mean
+    """
+
+    def __init__(self, xinc=None, xorig=0.0):
+        self.xinc = xinc
+        self.xorig = xorig
+        self.captures = 0
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+
+    @property
+    def points(self):
+        """ The number of samples per capture (None before the first capture was added) """
+        return None if self.count is None else len(self.count)
+
+    def _init(self, points):
+        self.count = np.zeros(points, dtype=np.int64)
+        self.mean = np.zeros(points)
+        self.m2 = np.zeros(points)
+        self.min = np.full(points, np.nan)
+        self.max = np.full(points, np.nan)
+
+    def add(self, samples):
+        """
+        Adds a capture, or many captures at once.
+
+        :param samples: The samples of a capture, or a 2-dimensional array of captures (one per row)
+        :type samples: list or numpy.ndarray
+        :return: self
+        """
+        x = np.atleast_2d(np.asarray(samples, dtype=np.float64))
+        valid = ~np.isnan(x)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(valid, x, 0).sum(axis=0) / count
+        deviation = np.where(valid, x - mean, 0)
+        m2 = (deviation * deviation).sum(axis=0)
+        self._combine(x.shape[0], count, mean, m2, np.fmin.reduce(x, axis=0), np.fmax.reduce(x, axis=0))
+        return self
+
+    def merge(self, other):
+        """
+        Merges the statistics of another accumulator (of captures of the same length) into this one.
+
+        :param WaveformAccumulator other: The other accumulator
+        :return: self
+        """
+        if other.count is not None:
+            self._combine(other.captures, other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    def _combine(self, captures, count, mean, m2, min_, max_):
+        if self.count is None:
+            self._init(len(count))
+        if len(count) != len(self.count):
+            raise ValueError('Captures of {0} samples cannot be added to statistics of {1} samples'.format(
+                len(count), len(self.count)))
+        upd = count > 0
+        na, nb = self.count[upd], count[upd]
+        n = na + nb
+        delta = mean[upd] - self.mean[upd]
+        self.mean[upd] += delta * nb / n
+        self.m2[upd] += m2[upd] + delta * delta * na * nb / n
+        self.count[upd] = n
+        self.min = np.fmin(self.min, min_)
+        self.max = np.fmax(self.max, max_)
+        self.captures += captures
+
+    def variance(self, ddof=0):
+        """
+        The per-sample variance
+
+        :param int ddof: Delta degrees of freedom (1 for the unbiased sample variance)
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof=0):
+        """ The per-sample standard deviation (see :py:meth:`variance`) """
+        return np.sqrt(self.variance(ddof))
+
+    @property
+    def time_values(self):
+        """ The time of the samples (or None, if xinc is not known) """
+        if self.xinc is None or self.count is None:
+            return None
+        return self.xorig + np.arange(self.points) * self.xinc
+
+    def envelopes(self):
+        """
+        The envelopes and statistics of all samples.
+
+        :return: arrays by name: ``min``, ``max``, ``mean``, ``std`` and ``count``,
+                 as well as ``time`` if xinc is known. Samples without values are NaN.
+        :rtype: dict
+        """
+        mean = np.where(self.count > 0, self.mean, np.nan)
+        env = {'min': self.min, 'max': self.max, 'mean': mean, 'std': self.std(), 'count': self.count}
+        if self.time_values is not None:
+            env['time'] = self.time_values
+        return env
+
+    def save(self, filename):
+        """
+        Exports the statistics.
+
+        A ``.npz`` file keeps everything needed to restore the accumulator
+        with :py:meth:`load`; a ``.csv`` file contains the columns of :py:meth:`envelopes`.
+        """
+        if filename.endswith('.npz'):
+            np.savez(filename, captures=self.captures, count=self.count, mean=self.mean, m2=self.m2,
+                     min=self.min, max=self.max,
+                     xinc=np.nan if self.xinc is None else self.xinc, xorig=self.xorig)
+            return
+        env = self.envelopes()
+        columns = [name for name in ('time', 'min', 'max', 'mean', 'std', 'count') if name in env]
+        np.savetxt(filename, np.column_stack([env[name] for name in columns]),
+                   delimiter=',', header=','.join(columns), comments='', fmt='%.9g')
+
+    @classmethod
+    def load(cls, filename):
+        """ Restores an accumulator saved to a ``.npz`` file with :py:meth:`save` """
+        data = np.load(filename)
+        xinc = float(data['xinc'])
+        acc = cls(xinc=None if np.isnan(xinc) else xinc, xorig=float(data['xorig']))
+        acc.captures = int(data['captures'])
+        for name in ('count', 'mean', 'm2', 'min', 'max'):
+            setattr(acc, name, data[name])
+        return acc
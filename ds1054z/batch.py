@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.batch` - Batch analysis of saved captures
+========================================================================
+
+Analyses many saved captures in parallel: an analysis function is applied
+to every capture by a pool of worker processes, and its results are
+reduced one by one as they arrive, in the order the workers finish.
+
+>>> from ds1054z.batch import analyze, measure_capture
+>>> results = analyze(glob.glob('campaign/*.csv'), measure_capture)
+>>> results['campaign/run-0001.csv']['CHAN1']['vpp']
+3.28
+
+>>> def vpp(capture):
+...     return max(samples.max() - samples.min() for samples in capture.channels.values())
+>>> worst = analyze(filenames, vpp, reducer=max, initial=0.0, progress=print)
+
+The workers receive filenames instead of pickled samples and load the
+captures themselves (:py:func:`load_capture`): NumPy ``.npy`` files are
+memory-mapped, so large captures are only paged in as far as they are used.
+:py:func:`analyze_array` does the same for captures in memory by writing
+them to a temporary ``.npy`` file which all workers map.
+The analysis function (and the reducer) must be picklable, i.e. defined
+at the top level of a module.
+It depends on NumPy (``pip install ds1054z[analysis]``).
+"""
+
+from collections import namedtuple, OrderedDict
+import multiprocessing
+import tempfile
+import shutil
+import time
+import os
+
+import numpy as np
+
+class Capture(namedtuple('Capture', 'name channels xinc xorig')):
+    """
+    A capture as loaded by :py:func:`load_capture`.
+
+    :ivar name: The filename (with ``#row`` appended for rows of arrays)
+    :ivar channels: The samples by channel name (OrderedDict of arrays)
+    :ivar xinc: The time between two samples (in s), None if unknown
+    :ivar xorig: The time of the first sample (in s)
+    """
+
+class BatchProgress(namedtuple('BatchProgress', 'done total bytes elapsed')):
+    """
+    The progress of a batch analysis: captures done out of total,
+    bytes of samples analysed and the time elapsed (in s).
+    """
+
+    @property
+    def rate(self):
+        """ The throughput (in bytes/s) """
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """ The estimated remaining time (in s), None before the first result """
+        if not self.done:
+            return None
+        return self.elapsed / self.done * (self.total - self.done)
+
+    def __str__(self):
+        eta = '?' if self.eta is None else '{0:.0f} s'.format(self.eta)
+        return '{0}/{1} captures, {2:.1f} MB, {3:.1f} MB/s, ETA {4}'.format(
+            self.done, self.total, self.bytes / 1e6, self.rate / 1e6, eta)
+
+def load_capture(filename, mmap=True):
+    """
+    Loads a saved capture:
+
+    * ``.csv``/``.txt`` files as written by ``ds1054z save-data``
+      (with or without the time column),
+    * ``.npy`` files with the samples of one channel (1-dimensional)
+      or of several channels (one per row), memory-mapped if mmap is set,
+    * ``.npz`` files with an array per channel and optionally
+      the scalars ``xinc`` and ``xorig``.
+
+    :param str filename: The file to load
+    :param bool mmap: Whether to memory-map ``.npy`` files
+    :rtype: Capture
+    """
+    name, row = filename, None
+    if '#' in filename and not os.path.exists(filename):
+        filename, row = filename.rsplit('#', 1)
+        row = int(row)
+    ext = os.path.splitext(filename)[1].lower()
+    channels = OrderedDict()
+    xinc, xorig = None, 0.0
+    if ext in ('.csv', '.txt'):
+        delimiter = ',' if ext == '.csv' else '\t'
+        with open(filename) as f:
+            header = f.readline().strip().split(delimiter)
+        data = np.loadtxt(filename, delimiter=delimiter, skiprows=1, ndmin=2)
+        if header[0] == 'TIME':
+            if len(data) > 1:
+                xinc = float(data[1, 0] - data[0, 0])
+            xorig = float(data[0, 0])
+            header, data = header[1:], data[:, 1:]
+        for i, channel in enumerate(header):
+            channels[channel] = data[:, i]
+    elif ext == '.npy':
+        data = np.load(filename, mmap_mode='r' if mmap else None)
+        if row is not None:
+            data = data[row]
+        for i, samples in enumerate(np.atleast_2d(data)):
+            channels['CHAN{0}'.format(i + 1)] = samples
+    elif ext == '.npz':
+        with np.load(filename) as data:
+            for key in data.files:
+                if key == 'xinc':
+                    xinc = float(data[key])
+                elif key == 'xorig':
+                    xorig = float(data[key])
+                else:
+                    channels[key] = data[key]
+    else:
+        raise ValueError('Unknown kind of capture file: {0}'.format(filename))
+    return Capture(name, channels, xinc, xorig)
+
+def measure_capture(capture, items=None):
+    """
+    An analysis function measuring all channels of a capture
+    with :py:func:`ds1054z.measurements.measure`.
+
+    :param Capture capture: The capture
+    :param list items: The items to measure, all if omitted
+    :return: the values by item by channel
+    :rtype: OrderedDict
+    """
+    from ds1054z.measurements import measure
+    xinc = capture.xinc or 1.0
+    return OrderedDict((channel, measure(np.asarray(samples, dtype=np.float64), xinc, items, capture.xorig))
+                       for channel, samples in capture.channels.items())
+
+_function = None
+_xinfo = None
+
+def _init_worker(function, xinfo):
+    global _function, _xinfo
+    _function, _xinfo = function, xinfo
+
+def _analyze(filename):
+    capture = load_capture(filename)
+    if _xinfo is not None:
+        capture = capture._replace(xinc=_xinfo[0], xorig=_xinfo[1])
+    nbytes = sum(samples.nbytes for samples in capture.channels.values())
+    return filename, _function(capture), nbytes
+
+def iter_analyze(filenames, function, processes=None, progress=None, _xinfo=None):
+    """
+    Analyses captures in a pool of processes (see :py:func:`analyze`).
+
+    :return: an iterator over (filename, result) in the order the workers finish
+    """
+    filenames = list(filenames)
+    start = time.time()
+    total_bytes = 0
+    if processes == 1:
+        _init_worker(function, _xinfo)
+        results = (_analyze(filename) for filename in filenames)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, (function, _xinfo))
+        results = pool.imap_unordered(_analyze, filenames)
+    try:
+        for done, (filename, result, nbytes) in enumerate(results, 1):
+            total_bytes += nbytes
+            if progress:
+                progress(BatchProgress(done, len(filenames), total_bytes, time.time() - start))
+            yield filename, result
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def analyze(filenames, function, reducer=None, initial=None, processes=None, progress=None):
+    """
+    Analyses saved captures in a pool of processes.
+
+    :param list filenames: The capture files (see :py:func:`load_capture`)
+    :param function: The analysis function, called with a :py:class:`Capture`
+    :param reducer: Called with the reduced value so far (initially ``initial``)
+                    and each result as it arrives, returning the new reduced value.
+                    If omitted, the results are collected in a dict by filename.
+    :param initial: The initial value for the reducer
+    :param int processes: The number of worker processes (default: the number of CPUs,
+                          1 analyses in this process)
+    :param progress: A callable called with a :py:class:`BatchProgress` after every capture
+    :return: the reduced value
+    """
+    return _reduce(iter_analyze(filenames, function, processes, progress), reducer, initial)
+
+def analyze_array(captures, function, xinc=None, xorig=0.0, reducer=None, initial=None,
+                  processes=None, progress=None):
+    """
+    Analyses the rows of a 2-dimensional array of captures in a pool of processes,
+    sharing the array with the workers through a memory-mapped file
+    (see :py:func:`analyze` for the other arguments).
+
+    :param numpy.ndarray captures: The captures (one per row)
+    :param float xinc: The time between two samples (in s)
+    :param float xorig: The time of the first sample (in s)
+    :return: the reduced value (by default a dict by row index)
+    """
+    tmpdir = tempfile.mkdtemp(prefix='ds1054z-batch-')
+    filename = os.path.join(tmpdir, 'captures.npy')
+    try:
+        np.save(filename, np.asarray(captures))
+        names = ['{0}#{1}'.format(filename, i) for i in range(len(captures))]
+        results = iter_analyze(names, function, processes, progress, _xinfo=(xinc, xorig))
+        if reducer is None:
+            return _reduce(((int(name.rsplit('#', 1)[1]), result) for name, result in results), None, None)
+        return _reduce(results, reducer, initial)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def _reduce(results, reducer, initial):
+    if reducer is None:
+        return dict(results)
+    value = initial
+    for name, result in results:
+        value = reducer(value, result)
+    return value
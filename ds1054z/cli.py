@@ -14,13 +14,17 @@ import textwrap
 import logging
 import time
 import io
-import pkg_resources
 import sys
 import os
 import itertools
 import errno
+import signal
+import contextlib
 
-from ds1054z import DS1054Z
+# Further imports (the submodules, PIL, pkg_resources, ...) are done where
+# needed. Note that vxi11 is always imported, by ds1054z/__init__.py.
+
+logger = logging.getLogger(__name__)
 
 # Py2 fix for input()
 try: input = raw_input
@@ -39,9 +43,35 @@ will be read from the device.
 Quit the shell with  'quit'  or by pressing Ctrl-C
 """
 
+# Actions which may be served by a running ds1054z daemon.
+# (Actions writing files or interacting with the user always run locally.)
+DAEMON_ACTIONS = ('info', 'cmd', 'run', 'stop', 'single', 'tforce',
+                  'settings', 'properties', 'measure')
+
+MEASUREMENT_ITEMS = ('vmax', 'vmin', 'vpp', 'vtop', 'vbase', 'vamp', 'vavg', 'vrms', 'overshoot', 'preshoot',
+                     'marea', 'mparea', 'period', 'frequency', 'rtime', 'ftime', 'pwidth', 'nwidth', 'pduty',
+                     'nduty', 'rdelay', 'fdelay', 'rphase', 'fphase', 'tvmax', 'tvmin', 'pslewrate', 'nslewrate',
+                     'vupper', 'vmid', 'vlower', 'variance', 'pvrms')
+
 def comma_sep(s):
     return s.split(',')
 
+def comma_sep_choices(choices, convert=str):
+    """ Creates an argparse type for comma separated values, each of them one of choices """
+    def parse(s):
+        values = []
+        for value in s.split(','):
+            try:
+                value = convert(value)
+            except ValueError:
+                value = None
+            if value not in choices:
+                raise argparse.ArgumentTypeError('invalid choice: {0!r} (choose from {1})'.format(
+                    s, ', '.join(str(c) for c in choices)))
+            values.append(value)
+        return values
+    return parse
+
 def late_parents(self, parents):
     """
     Hack to add a positional argument before the parents[]
@@ -56,7 +86,8 @@ def late_parents(self, parents):
         else:
             self._defaults.update(defaults)
 
-def main():
+def build_parser():
+    """ Creates the argument parser of the command line tool """
     parser = argparse.ArgumentParser(
         description=textwrap.dedent(__doc__),
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -70,6 +101,18 @@ def main():
         #help='Enable debugging output',
         help=argparse.SUPPRESS,
         )
+    parser.add_argument('--no-daemon', action='store_true',
+        help='Connect to the scope directly even if a ds1054z daemon is running')
+    parser.add_argument('--daemon-socket', metavar='PATH',
+        help='The Unix socket of the ds1054z daemon (default: $DS1054Z_DAEMON_SOCKET '
+             'or a per-user socket in the temp directory)')
+    parser.add_argument('--record', metavar='SESSION_FILE',
+        help='Record all communication with the scope to this session file '
+             '(gzip compressed if it ends with .gz)')
+    parser.add_argument('--replay', metavar='SESSION_FILE',
+        help='Play back a recorded session instead of connecting to a scope')
+    parser.add_argument('--replay-realtime', action='store_true',
+        help='Take as long for every transaction as it took when recording (with --replay)')
 
     device_parser = argparse.ArgumentParser(add_help=False)
     device_parser.add_argument('device', nargs='?',
@@ -123,6 +166,13 @@ def main():
     save_data_parser.add_argument('--without-time', action='store_false', dest='with_time',
         help="If specified, it will save the data without the extra column "
              "of time values that's being added by default")
+    save_data_parser.add_argument('--count', '-n', metavar='N', type=positive_int,
+        help='Save N captures over the same connection, writing each file while '
+             'the next capture is acquired. The filename template may contain {n} '
+             'for the number of the capture, otherwise _{n:04d} is appended.')
+    save_data_parser.add_argument('--until', metavar='TIME', type=deadline,
+        help='Save captures (like --count) until this time of day (HH:MM or HH:MM:SS) '
+             'or for this many seconds')
     # ds1054z settings
     action_desc = 'View and change settings of the oscilloscope'
     settings_parser = subparsers.add_parser('settings', parents=[device_parser],
@@ -155,22 +205,87 @@ def main():
     tforce_parser = subparsers.add_parser('tforce', parents=[device_parser],
         description=action_desc, help=action_desc)
     # ds1054z shell
-    action_desc = 'Start an interactive shell to control your scope.'
-    tforce_parser = subparsers.add_parser('shell', parents=[device_parser],
+    action_desc = 'Start an interactive shell to control your scope (or run a script of commands).'
+    shell_parser = subparsers.add_parser('shell', parents=[device_parser],
         description=action_desc, help=action_desc)
+    shell_parser.add_argument('--script', '-s', metavar='FILE',
+        help='Run the SCPI commands in this file (one per line, - for stdin) instead of '
+             'an interactive shell. The commands and queries are sent as compound '
+             'messages and the answers of the queries are printed in order.')
     # ds1054z measure
-    action_desc = 'Measure a value on a channel'
+    action_desc = 'Measure values on one or more channels'
     measure_parser = subparsers.add_parser('measure', parents=[device_parser],
         description=action_desc, help=action_desc)
-    measure_parser.add_argument('--channel', '-c', choices=(1, 2, 3, 4), type=int, required=True,
-        help='Channel from which to take the measurement')
+    measure_parser.add_argument('--channel', '-c', metavar='CHANNELS', type=comma_sep_choices((1, 2, 3, 4), int), required=True,
+        help='Channel(s) from which to take the measurement, comma separated (like 1,2)')
     measure_parser.add_argument('--type', '-t', choices=('CURRent', 'MAXimum', 'MINimum', 'AVERages', 'DEViation'), default='CURRent')
-    measure_parser.add_argument('item', choices=('vmax', 'vmin', 'vpp', 'vtop', 'vbase', 'vamp', 'vavg', 'vrms', 'overshoot', 'preshoot', 'marea', 'mparea', 'period', 'frequency', 'rtime', 'ftime', 'pwidth', 'nwidth', 'pduty', 'nduty', 'rdelay', 'fdelay', 'rphase', 'fphase', 'tvmax', 'tvmin', 'pslewrate', 'nslewrate', 'vupper', 'vmid', 'vlower', 'variance', 'pvrms'),
-        help='Value to measure')
+    measure_parser.add_argument('item', metavar='ITEMS', type=comma_sep_choices(MEASUREMENT_ITEMS),
+        help='Value(s) to measure, comma separated (like vpp,frequency). '
+             'Choose from: ' + ', '.join(MEASUREMENT_ITEMS))
+    # ds1054z stream
+    action_desc = 'Acquire continuously and write the captures to stdout (or a file/FIFO)'
+    stream_parser = subparsers.add_parser('stream', parents=[device_parser],
+        description=action_desc, help=action_desc)
+    stream_parser.add_argument('--channel', '-c', metavar='CHANNELS', type=comma_sep_choices((1, 2, 3, 4), int),
+        help='Channel(s) to stream, comma separated (default: the displayed channels)')
+    stream_parser.add_argument('--mode', default='NORMal', choices=('NORMal', 'MAXimum', 'RAW'),
+        help='NORMal streams the 1200 displayed samples while the scope is running, '
+             'RAW makes a single acquisition each time and reads the full memory. '
+             'Defaults to NORMal.')
+    stream_parser.add_argument('--format', dest='stream_format', default='binary', choices=('binary', 'ndjson'),
+        help='Binary records (see ds1054z.stream) or a JSON object per line. Defaults to binary.')
+    stream_parser.add_argument('--output', '-o', metavar='FILE',
+        help='Write to this file or FIFO instead of stdout')
+    stream_parser.add_argument('--count', '-n', metavar='N', type=int,
+        help='Stop after N acquisitions (default: stream until interrupted)')
+    stream_parser.add_argument('--buffer', metavar='N', type=int, default=4,
+        help='The number of acquisitions waiting to be written before '
+             'the acquisition waits for the consumer (default: 4)')
+    stream_parser.add_argument('--drop', action='store_true',
+        help='Drop the oldest waiting acquisitions instead of waiting for a slow consumer')
+    # ds1054z publish
+    action_desc = 'Acquire continuously and publish the captures to subscribers over TCP'
+    publish_parser = subparsers.add_parser('publish', parents=[device_parser],
+        description=action_desc, help=action_desc)
+    publish_parser.add_argument('--channel', '-c', metavar='CHANNELS', type=comma_sep_choices((1, 2, 3, 4), int),
+        help='Channel(s) to acquire, comma separated (default: the displayed channels)')
+    publish_parser.add_argument('--mode', default='NORMal', choices=('NORMal', 'MAXimum', 'RAW'),
+        help='The acquisition mode as for the stream action. Defaults to NORMal.')
+    publish_parser.add_argument('--host', default='127.0.0.1',
+        help='The address to listen on (default: 127.0.0.1)')
+    publish_parser.add_argument('--port', type=int, default=5556,
+        help='The TCP port to listen on (default: 5556)')
+    publish_parser.add_argument('--queue', metavar='N', type=int, default=4,
+        help='The number of acquisitions kept per subscriber; if a subscriber '
+             'falls behind, the oldest ones are dropped (default: 4)')
+    # ds1054z analyze
+    action_desc = 'Measure saved captures in parallel (needs NumPy)'
+    analyze_parser = subparsers.add_parser('analyze',
+        description=action_desc, help=action_desc)
+    analyze_parser.add_argument('files', metavar='FILE', nargs='+',
+        help='Captures saved with save-data (.csv, .txt) or as NumPy arrays (.npy, .npz)')
+    analyze_parser.add_argument('--measure', '-m', metavar='ITEMS', type=comma_sep_choices(MEASUREMENT_ITEMS),
+        default=['vpp', 'vavg', 'vrms', 'frequency'],
+        help='Value(s) to measure on every channel, comma separated (default: vpp,vavg,vrms,frequency)')
+    analyze_parser.add_argument('--processes', '-j', metavar='N', type=int,
+        help='The number of worker processes (default: the number of CPUs)')
+    # ds1054z daemon
+    action_desc = 'Keep connections to scopes open and serve other ds1054z calls.'
+    daemon_parser = subparsers.add_parser('daemon',
+        description=action_desc, help=action_desc)
+    daemon_parser.add_argument('devices', metavar='DEVICE', nargs='*',
+        help='Devices to connect to right away. '
+             'Further devices will be connected to on their first use.')
+    daemon_parser.add_argument('--stop', action='store_true',
+        help='Ask the daemon running on the socket to shut down.')
+    return parser
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
     if args.version:
-        print(pkg_resources.get_distribution("ds1054z").version)
+        print(get_version())
         sys.exit(0)
 
     if args.debug:
@@ -195,26 +310,85 @@ def main():
                 print("{ip}".format(**device))
         sys.exit(0)
 
-    if not args.device:
+    if args.action == 'analyze':
+        sys.exit(run_analyze(args))
+
+    if args.action == 'daemon':
+        from ds1054z import daemon
+        if args.stop:
+            sys.exit(0 if daemon.stop_daemon(args.daemon_socket) else 1)
+        daemon.serve(args.devices, socket_path=args.daemon_socket, verbose=args.verbose)
+        sys.exit(0)
+
+    if args.replay:
+        from ds1054z.recording import replay
+        perform_action(args, replay(args.replay, realtime=args.replay_realtime), parser)
+        sys.exit(0)
+
+    if args.action in DAEMON_ACTIONS and not (args.no_daemon or args.record):
+        from ds1054z import daemon
         try:
-            from ds1054z.discovery import discover_devices
-        except:
-            print("Please specify a device to connect to. Auto-discovery doesn't "
-                  "work because the zeroconf Python package is missing.")
-            sys.exit(1)
-        devices = discover_devices()
-        if len(devices) < 1:
-            print("Couln't discover any device on the network. Exiting.")
+            response = daemon.forward(sys.argv[1:], socket_path=args.daemon_socket)
+        except daemon.DaemonError as e:
+            # the daemon may still perform the action, don't repeat it
+            logger.error('{0} (use --no-daemon to bypass the daemon)'.format(e))
             sys.exit(1)
-        elif len(devices) > 1:
-            print("Discovered multiple devices on the network:")
-            print("\n".join("{model} {ip}".format(**dev) for dev in devices))
-            print("Please specify the device you would like to connect to.")
-            sys.exit(1)
-        else: # len(devices) == 0
-            if args.verbose: print("Found a scope: {model} @ {ip}".format(**devices[0]))
-            args.device = devices[0]['ip']
+        if response is not None:
+            sys.stdout.write(response['stdout'])
+            sys.stderr.write(response['stderr'])
+            sys.exit(response['exit_code'])
+
+    from ds1054z import DS1054Z
+    resolve_device(args)
     ds = DS1054Z(args.device)
+    if args.record:
+        with ds.record(args.record):
+            perform_action(args, ds, parser)
+    else:
+        perform_action(args, ds, parser)
+
+def get_version():
+    """ The version of the installed ds1054z package """
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+        return pkg_resources.get_distribution("ds1054z").version
+    return version("ds1054z")
+
+def resolve_device(args):
+    """
+    Makes sure ``args.device`` is set.
+    Performs the zeroconf discovery of a single scope if it is not.
+    """
+    if args.device:
+        return
+    try:
+        from ds1054z.discovery import discover_devices
+    except:
+        print("Please specify a device to connect to. Auto-discovery doesn't "
+              "work because the zeroconf Python package is missing.")
+        sys.exit(1)
+    devices = discover_devices()
+    if len(devices) < 1:
+        print("Couln't discover any device on the network. Exiting.")
+        sys.exit(1)
+    elif len(devices) > 1:
+        print("Discovered multiple devices on the network:")
+        print("\n".join("{model} {ip}".format(**dev) for dev in devices))
+        print("Please specify the device you would like to connect to.")
+        sys.exit(1)
+    else: # len(devices) == 0
+        if args.verbose: print("Found a scope: {model} @ {ip}".format(**devices[0]))
+        args.device = devices[0]['ip']
+
+def perform_action(args, ds, parser):
+    """
+    Performs the action requested on the command line
+    with the (already connected) DS1054Z instance ds.
+    """
+    from ds1054z import DS1054Z
 
     if args.action == 'info':
         fmt = "\nVendor:   {0}\nProduct:  {1}\nSerial:   {2}\nFirmware: {3}\n"
@@ -283,7 +457,9 @@ def main():
         ext = os.path.splitext(filename)[1]
         if not ext: parser.error('could not detect the image file type extension from the filename')
         # getting and saving the image
-        im = Image.open(io.BytesIO(ds.display_data))
+        with cancel_on_interrupt() as token:
+            im = Image.open(io.BytesIO(ds.get_display_data(progress=progress_printer('screen'), cancel=token)))
+        import pkg_resources
         overlay_filename = pkg_resources.resource_filename("ds1054z","resources/overlay.png")
         overlay = Image.open(overlay_filename)
         alpha_100_percent =  Image.new(overlay.mode, overlay.size, color=(0,0,0,0))
@@ -306,47 +482,42 @@ def main():
 
     if args.action == 'save-data':
         ts = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
-        filename = args.filename.format(ts=ts)
+        filename = args.filename.format(ts=ts, n=0)
         ext = os.path.splitext(filename)[1]
         if not ext: parser.error('could not detect the file type extension from the filename')
         kind = ext[1:]
+        if args.count is not None or args.until is not None:
+            if kind not in ('csv', 'txt'):
+                parser.error('--count and --until are only supported for .csv and .txt files')
+            sys.exit(run_burst(args, ds))
         if kind in ('csv', 'txt'):
-            import csv
             data = []
             channels = ds.displayed_channels
-            for channel in channels:
-                data.append(ds.get_waveform_samples(channel, mode=args.mode))
+            with cancel_on_interrupt() as token:
+                for channel in channels:
+                    data.append(ds.get_waveform_samples(channel, mode=args.mode,
+                                                        progress=progress_printer(channel), cancel=token))
             if args.with_time:
                 data.insert(0, ds.waveform_time_values_decimal)
             lengths = [len(samples) for samples in data]
             if len(set(lengths)) != 1:
                 logger.error('Different number of samples read for different channels!')
                 sys.exit(1)
-            zip_longest
-            def csv_open(filename):
-                if sys.version_info >= (3, 0):
-                    return open(filename, 'w', newline='')
-                else:
-                    return open(filename, 'wb')
-            with csv_open(filename) as csv_file:
-                delimiter = ',' if kind == 'csv' else '\t'
-                csv_writer = csv.writer(csv_file, delimiter=delimiter)
-                if args.with_time:
-                    csv_writer.writerow(['TIME'] + channels)
-                else:
-                    csv_writer.writerow(channels)
-                for vals in zip_longest(*data):
-                    if args.with_time:
-                        vals = [vals[0]] + ['{:.2e}'.format(val) for val in vals[1:]]
-                    else:
-                        vals = ['{:.2e}'.format(val) for val in vals]
-                    csv_writer.writerow(vals)
+            delimiter = ',' if kind == 'csv' else '\t'
+            write_csv(filename, channels, data, with_time=args.with_time, delimiter=delimiter)
         else:
             parser.error('This tool cannot handle the requested --type')
         if not args.verbose: print(filename)
         else: print("Saved file: " + filename)
 
     if args.action == 'shell':
+        if args.script:
+            if args.script == '-':
+                exit_code = run_script(ds, sys.stdin)
+            else:
+                with open(args.script) as script:
+                    exit_code = run_script(ds, script)
+            sys.exit(exit_code)
         try:
             import atexit
             import readline
@@ -361,10 +532,329 @@ def main():
             pass
         run_shell(ds)
 
+    if args.action == 'stream':
+        sys.exit(run_stream(args, ds))
+
+    if args.action == 'publish':
+        from ds1054z import publish
+        publish.serve(ds, args.channel or ds.displayed_channels, mode=args.mode, host=args.host,
+                      port=args.port, queue_size=args.queue, verbose=args.verbose)
+
     if args.action == 'measure':
-        v = ds.get_channel_measurement(args.channel, args.item, type=args.type)
-        if v is not None:
-            print(v)
+        results = ds.get_measurements(args.channel, args.item, types=args.type)
+        if len(args.channel) == 1 and len(args.item) == 1:
+            v = results['CHAN{0}'.format(args.channel[0])][args.item[0]]
+            if v is not None:
+                print(v)
+        else:
+            # a table with a row per item and a column per channel
+            print('\t'.join(['item'] + list(results)))
+            for item in args.item:
+                values = ['' if row[item] is None else str(row[item]) for row in results.values()]
+                print('\t'.join([item] + values))
+
+def progress_printer(label):
+    """
+    A progress callback showing the progress of a transfer
+    on stderr (None if stderr isn't a terminal).
+    """
+    if not sys.stderr.isatty():
+        return None
+    def progress(p):
+        sys.stderr.write('\r{0}: {1}\033[K'.format(label, p))
+        if p.done >= p.total:
+            sys.stderr.write('\n')
+        sys.stderr.flush()
+    return progress
+
+@contextlib.contextmanager
+def cancel_on_interrupt():
+    """
+    Context manager yielding a cancellation token which is cancelled by
+    the first Ctrl-C (a second one interrupts right away). A cancelled
+    transfer ends the tool with an error message.
+    """
+    from ds1054z import CancellationToken, TransferCancelled
+    token = CancellationToken()
+    def cancel(signum, frame):
+        signal.signal(signal.SIGINT, previous)
+        sys.stderr.write('\nCancelling...\n')
+        token.cancel()
+    try:
+        previous = signal.signal(signal.SIGINT, cancel)
+    except ValueError:
+        # not in the main thread
+        previous = None
+    try:
+        yield token
+    except TransferCancelled:
+        logger.error('The transfer was cancelled.')
+        sys.exit(1)
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGINT, previous)
+
+def run_stream(args, ds):
+    """
+    Streams captures until interrupted (or --count acquisitions),
+    showing the rates on stderr. Ends quietly when the consumer
+    closes the pipe.
+    """
+    from ds1054z.stream import iter_records, StreamWriter
+    channels = args.channel or ds.displayed_channels
+    if args.output:
+        output = open(args.output, 'wb')
+    else:
+        output = getattr(sys.stdout, 'buffer', sys.stdout)
+    show_progress = sys.stderr.isatty()
+    writer = StreamWriter(output, fmt=args.stream_format, buffer=args.buffer, drop=args.drop)
+    shown = time.time()
+    exit_code = 0
+    try:
+        for records in iter_records(ds, channels, mode=args.mode, count=args.count):
+            writer.put(records)
+            if show_progress and time.time() - shown >= 1.0:
+                shown = time.time()
+                sys.stderr.write('\r{0}\033[K'.format(writer.stats))
+                sys.stderr.flush()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        # the error which stopped the writer is reported below
+        if e is not writer.error:
+            raise
+    writer.close()
+    if writer.error is not None:
+        if getattr(writer.error, 'errno', None) != errno.EPIPE:
+            logger.error('Writing the stream failed: {0}'.format(writer.error))
+            exit_code = 1
+        elif not args.output:
+            # keep the interpreter from complaining about stdout at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    if args.output:
+        try:
+            output.close()
+        except (IOError, OSError):
+            pass
+    if show_progress:
+        sys.stderr.write('\r\033[K')
+    sys.stderr.write('Streamed {0}\n'.format(writer.stats))
+    return exit_code
+
+def positive_int(s):
+    """ argparse type for an integer of at least 1 """
+    try:
+        value = int(s)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError('invalid count: {0!r} (use a whole number of at least 1)'.format(s))
+    return value
+
+def deadline(s):
+    """ argparse type for a point in time: a time of day (HH:MM or HH:MM:SS) or seconds from now """
+    import math
+    now = time.time()
+    try:
+        if ':' not in s:
+            seconds = float(s)
+            if not math.isfinite(seconds) or seconds <= 0:
+                raise ValueError(s)
+            return now + seconds
+        parts = [int(part) for part in s.split(':')]
+        if len(parts) not in (2, 3):
+            raise ValueError(s)
+        if not 0 <= parts[0] <= 23 or not all(0 <= part <= 59 for part in parts[1:]):
+            raise ValueError(s)
+        t = time.localtime(now)
+        until = time.mktime(t[:3] + tuple(parts + [0])[:3] + (0, 0, -1))
+    except (ValueError, OverflowError):
+        raise argparse.ArgumentTypeError('invalid time: {0!r} (use HH:MM, HH:MM:SS or a positive number of seconds)'.format(s))
+    # a time of day which has passed already means tomorrow
+    return until if until > now else until + 24 * 3600
+
+def run_burst(args, ds):
+    """
+    Saves captures over the same connection until --count captures were saved
+    or the --until time has come. A writer thread converts and writes each
+    capture while the next one is acquired (in RAW mode, the next single
+    acquisition is armed before the capture is handed to the writer).
+    Prints the achieved rate and where the time was spent on stderr.
+    """
+    import threading
+    try:
+        import queue
+    except ImportError:
+        import Queue as queue
+    from ds1054z import DS1054Z, TransferCancelled, clock
+    fmt = args.filename
+    if '{n' not in fmt:
+        root, ext = os.path.splitext(fmt)
+        fmt = root + '_{n:04d}' + ext
+    delimiter = ',' if fmt.lower().endswith('.csv') else '\t'
+    raw = args.mode.upper().startswith('RAW')
+    channels = ds.displayed_channels
+    pending = queue.Queue(2)
+    spent = {'trigger': 0.0, 'read': 0.0, 'queue': 0.0, 'write': 0.0}
+    errors = []
+
+    def write():
+        while True:
+            capture = pending.get()
+            if capture is None:
+                break
+            if errors:
+                continue
+            filename, captured = capture
+            t0 = clock()
+            try:
+                data = [DS1054Z.bytes_to_samples(buff, preamble, mask) for buff, preamble, mask in captured]
+                if args.with_time:
+                    keys = 'fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref'.split(', ')
+                    data.insert(0, DS1054Z.decimal_time_values(dict(zip(keys, captured[0][1]))))
+                write_csv(filename, channels, data, with_time=args.with_time, delimiter=delimiter)
+            except Exception as e:
+                errors.append(e)
+                continue
+            spent['write'] += clock() - t0
+            if not args.verbose: print(filename)
+            else: print("Saved file: " + filename)
+            sys.stdout.flush()
+
+    writer = threading.Thread(target=write, name='ds1054z-save-data-writer')
+    writer.daemon = True
+    writer.start()
+    start = clock()
+    n = 0
+
+    def more():
+        return (args.count is None or n < args.count) and (args.until is None or time.time() < args.until)
+
+    with cancel_on_interrupt() as token:
+        try:
+            if raw:
+                ds.single()
+            go = more()
+            while go:
+                t0 = clock()
+                while raw and ds.running and not token.cancelled:
+                    if args.until is not None and time.time() >= args.until:
+                        break
+                    time.sleep(0.005)
+                if token.cancelled or (raw and ds.running):
+                    break
+                t1 = clock()
+                ts = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+                captured = []
+                for channel in channels:
+                    buff = ds.get_waveform_bytes(channel, mode=args.mode, cancel=token)
+                    captured.append((buff, ds.last_waveform_preamble, ds.mask_begin_num))
+                n += 1
+                go = more()
+                if raw and go:
+                    # the scope acquires the next capture while this one is written
+                    ds.single()
+                t2 = clock()
+                pending.put((fmt.format(ts=ts, n=n - 1), captured))
+                t3 = clock()
+                spent['trigger'] += t1 - t0
+                spent['read'] += t2 - t1
+                spent['queue'] += t3 - t2
+                if errors:
+                    break
+        except TransferCancelled:
+            # Ctrl-C ends the burst, the captures read so far are written
+            pass
+        finally:
+            pending.put(None)
+            writer.join()
+    elapsed = clock() - start
+    if errors:
+        logger.error('Writing the captures failed: {0}'.format(errors[0]))
+        return 1
+    sys.stderr.write('Saved {0} captures in {1:.1f} s ({2:.2f} captures/s)\n'.format(
+        n, elapsed, n / elapsed if elapsed > 0 else 0.0))
+    sys.stderr.write('  waiting for triggers {trigger:.2f} s, reading {read:.2f} s, '
+                     'waiting for the writer {queue:.2f} s, writing (in parallel) {write:.2f} s\n'.format(**spent))
+    return 0
+
+def run_analyze(args):
+    """
+    Measures saved captures in a pool of processes: prints a row per
+    capture and channel as they are done, followed by the minimum, mean
+    and maximum of every item per channel over all captures.
+    """
+    import functools
+    try:
+        from ds1054z.batch import iter_analyze, measure_capture
+    except ImportError:
+        print('The analyze action depends on the numpy Python package which is missing.')
+        return 1
+    show_progress = sys.stderr.isatty()
+    last_progress = [None]
+    def progress(p):
+        last_progress[0] = p
+        if show_progress:
+            sys.stderr.write('\r{0}  '.format(p))
+            sys.stderr.flush()
+    summary = {}
+    print('\t'.join(['file', 'channel'] + args.measure))
+    results = iter_analyze(args.files, functools.partial(measure_capture, items=args.measure),
+                           processes=args.processes, progress=progress)
+    for filename, result in results:
+        if show_progress:
+            sys.stderr.write('\r\033[K')
+        for channel, values in result.items():
+            print('\t'.join([filename, channel] + ['' if values[item] is None else str(values[item])
+                                                   for item in args.measure]))
+            # running minimum, sum, count and maximum of every item
+            for item in args.measure:
+                value = values[item]
+                if value is None:
+                    continue
+                lo, total, n, hi = summary.get((channel, item), (value, 0.0, 0, value))
+                summary[(channel, item)] = (min(lo, value), total + value, n + 1, max(hi, value))
+        sys.stdout.flush()
+    channels = sorted(set(channel for channel, item in summary))
+    for name, stat in (('(min)', lambda s: s[0]), ('(mean)', lambda s: s[1] / s[2]), ('(max)', lambda s: s[3])):
+        for channel in channels:
+            print('\t'.join([name, channel] + [str(stat(summary[(channel, item)])) if (channel, item) in summary
+                                                else '' for item in args.measure]))
+    p = last_progress[0]
+    if p is not None and (args.verbose or show_progress):
+        sys.stderr.write('Analyzed {0} captures ({1:.1f} MB of samples) in {2:.1f} s ({3:.1f} MB/s)\n'.format(
+            p.done, p.bytes / 1e6, p.elapsed, p.rate / 1e6))
+    return 0
+
+def write_csv(filename, channels, data, with_time=True, delimiter=','):
+    """
+    Writes waveform data to a CSV file.
+
+    :param str filename: The file to write to
+    :param list channels: The channel names (used for the header row)
+    :param list data: The columns: lists of samples for each channel,
+                      preceded by the time values if with_time is set.
+    :param bool with_time: Whether the first column contains the time values
+    :param str delimiter: The delimiter between the values of a row
+    """
+    import csv
+    def csv_open(filename):
+        if sys.version_info >= (3, 0):
+            return open(filename, 'w', newline='')
+        else:
+            return open(filename, 'wb')
+    with csv_open(filename) as csv_file:
+        csv_writer = csv.writer(csv_file, delimiter=delimiter)
+        if with_time:
+            csv_writer.writerow(['TIME'] + channels)
+        else:
+            csv_writer.writerow(channels)
+        for vals in zip_longest(*data):
+            if with_time:
+                vals = [vals[0]] + ['{:.2e}'.format(val) for val in vals[1:]]
+            else:
+                vals = ['{:.2e}'.format(val) for val in vals]
+            csv_writer.writerow(vals)
 
 def run_shell(ds):
     """ ds : DS1054Z instance """
@@ -395,6 +885,100 @@ def run_shell(ds):
         pass
     print('Exiting...')
 
+def run_script(ds, lines):
+    """
+    Runs a script of SCPI commands (one per line, empty lines and lines
+    starting with ``#`` are skipped, ``quit`` or ``exit`` end the script).
+
+    Commands and queries are not sent one by one: they are joined with
+    semicolons into compound messages of up to
+    :py:attr:`ds1054z.DS1054Z.setting_batch_size` commands each, and the
+    answers of the queries of a message (joined with semicolons by the
+    scope) are split and printed in order. Queries answered with a binary
+    block (like ``:WAVeform:DATA?``) end a message of their own.
+    Afterwards, the time taken by each message is printed to stderr.
+
+    :param ds: The DS1054Z instance
+    :param lines: The lines of the script (like an open file)
+    :return: the exit code (1 if a query went unanswered)
+    """
+    from vxi11.vxi11 import Vxi11Exception
+    from ds1054z import clock
+    from ds1054z.metrics import command_header, transfer_type
+    messages = []
+    pending = []
+    stats = {'commands': 0, 'failed': 0}
+    start = clock()
+
+    def is_query(cmd):
+        return '?' in cmd
+
+    def is_block_query(cmd):
+        header = command_header(cmd).upper()
+        return transfer_type(header) != 'query' or header.lstrip(':').startswith('SYST:SET')
+
+    def send():
+        """ Sends the pending commands and queries as one message """
+        if not pending:
+            return
+        commands = [cmd for lineno, cmd in pending]
+        queries = [(lineno, cmd) for lineno, cmd in pending if is_query(cmd)]
+        message = ';'.join(cmd if cmd[0] in ':*' else ':' + cmd for cmd in commands)
+        t0 = clock()
+        if queries:
+            try:
+                ret = ds.query_raw(message)
+            except Vxi11Exception:
+                for query in queries:
+                    sys.stderr.write('line {0}: no response from the scope to {1}\n'.format(*query))
+                stats['failed'] += len(queries)
+            else:
+                try:
+                    answers = ret.decode('utf-8').strip().split(';')
+                except UnicodeDecodeError:
+                    answers = None
+                if answers is None or ret.startswith(b'#'):
+                    print('binary message:', ret)
+                elif len(answers) != len(queries):
+                    sys.stderr.write('lines {0}-{1}: expected {2} answers, got: {3}\n'.format(
+                        pending[0][0], pending[-1][0], len(queries), ret.decode('utf-8').strip()))
+                    stats['failed'] += len(queries)
+                else:
+                    for answer in answers:
+                        print(answer)
+        else:
+            ds.write(message)
+        messages.append((pending[0][0], pending[-1][0], len(commands), len(queries), clock() - t0))
+        stats['commands'] += len(commands)
+        del pending[:]
+
+    for lineno, line in enumerate(lines, 1):
+        cmd = line.strip()
+        if not cmd or cmd.startswith('#'):
+            continue
+        if cmd in ('quit', 'exit'):
+            break
+        if is_query(cmd) and is_block_query(cmd):
+            # the binary answer can't be split from other answers
+            if any(is_query(other) for _, other in pending):
+                send()
+            pending.append((lineno, cmd))
+            send()
+            continue
+        pending.append((lineno, cmd))
+        if len(pending) >= ds.setting_batch_size:
+            send()
+    send()
+    sys.stdout.flush()
+    elapsed = clock() - start
+    sys.stderr.write('{0} commands in {1} messages, {2:.3f} s\n'.format(
+        stats['commands'], len(messages), elapsed))
+    sys.stderr.write('{0:>7}  {1:>11}  {2:>8}  {3:>7}  {4:>10}\n'.format('message', 'lines', 'commands', 'queries', 'ms'))
+    for number, (first, last, commands, queries, seconds) in enumerate(messages, 1):
+        sys.stderr.write('{0:>7}  {1:>11}  {2:>8}  {3:>7}  {4:>10.1f}\n'.format(
+            number, '{0}-{1}'.format(first, last), commands, queries, seconds * 1e3))
+    return 1 if stats['failed'] else 0
+
 if __name__ == "__main__":
     main()
 
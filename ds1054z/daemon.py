@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.daemon` - Persistent connections for the CLI
+============================================================================
+
+Every invocation of the ``ds1054z`` command line tool has to create a new
+VXI-11 link to the scope, identify the device and possibly run the zeroconf
+discovery first. When calling the tool many times in a row (from shell scripts,
+for example), this connection setup dominates the run time.
+
+The daemon started with ``ds1054z daemon`` keeps the connections to one or more
+scopes open and serves the actions listed in :py:data:`ds1054z.cli.DAEMON_ACTIONS`
+over a local Unix socket. The command line tool automatically forwards those
+actions to a running daemon and falls back to a direct connection otherwise.
+
+The protocol is simple: the client sends a single line of JSON such as
+``{"argv": ["measure", "-c", "1", "vpp"]}`` and the daemon answers with a single
+line of JSON containing ``stdout``, ``stderr``, and ``exit_code``.
+"""
+
+import os
+import io
+import json
+import socket
+import logging
+import tempfile
+import threading
+import contextlib
+import socketserver
+
+import vxi11
+
+logger = logging.getLogger(__name__)
+
+SOCKET_ENV_VAR = 'DS1054Z_DAEMON_SOCKET'
+
+#: Errors of the connection to a scope, after which it is made anew
+_TRANSPORT_ERRORS = (vxi11.vxi11.Vxi11Exception, socket.error, IOError, OSError)
+
+#: Seconds to wait for the daemon to answer a ping or a shutdown request
+CONTROL_TIMEOUT = 2.0
+#: Seconds to wait for the daemon to serve a forwarded CLI call
+#: (the call fails afterwards, it isn't repeated with a direct connection)
+FORWARD_TIMEOUT = 30.0
+
+def default_socket_path():
+    """
+    The path of the Unix socket used when none is specified explicitly.
+
+    This is the content of the environment variable ``DS1054Z_DAEMON_SOCKET``
+    if set, or a per-user socket in the temporary directory otherwise.
+    """
+    path = os.environ.get(SOCKET_ENV_VAR)
+    if path:
+        return path
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(tempfile.gettempdir(), 'ds1054z-daemon-{0}.sock'.format(uid))
+
+class DaemonError(IOError):
+    """
+    The daemon accepted a request but didn't answer it (in time or completely).
+    It may still be serving the request, so it must not be repeated elsewhere.
+    """
+    pass
+
+def _request(message, socket_path=None, timeout=CONTROL_TIMEOUT):
+    """
+    Sends a message (dict) to the daemon and returns its answer (dict).
+
+    Returns None if there is no daemon listening on the socket.
+    Raises :py:exc:`DaemonError` if the message was sent but the daemon
+    doesn't answer within timeout seconds or its answer is incomplete.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    socket_path = socket_path or default_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        # no daemon running (socket file missing or stale)
+        sock.close()
+        return None
+    try:
+        sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.timeout:
+        raise DaemonError('the daemon on {0} did not answer within {1} s'.format(socket_path, timeout))
+    except socket.error as e:
+        raise DaemonError('the connection to the daemon on {0} failed: {1}'.format(socket_path, e))
+    finally:
+        sock.close()
+    try:
+        return json.loads(b''.join(chunks).decode('utf-8'))
+    except ValueError:
+        # the daemon went away while serving the request
+        raise DaemonError('incomplete answer from the daemon on {0}'.format(socket_path))
+
+def forward(argv, socket_path=None, timeout=FORWARD_TIMEOUT):
+    """
+    Forwards the command line arguments argv to a running daemon.
+
+    :param list argv: The command line arguments (without the program name)
+    :param str socket_path: The Unix socket of the daemon
+    :param float timeout: Seconds to wait for the answer of the daemon
+    :return: The answer of the daemon with the keys ``stdout``, ``stderr``,
+             and ``exit_code`` or None if no daemon is running.
+    :rtype: dict
+    :raises DaemonError: if the daemon accepted the request but didn't answer
+             it in time or completely (it may still perform the action)
+    """
+    return _request({'argv': list(argv)}, socket_path=socket_path, timeout=timeout)
+
+def stop_daemon(socket_path=None):
+    """
+    Asks the daemon listening on socket_path to shut down.
+
+    :return: True if a daemon was running and acknowledged the request
+    :rtype: bool
+    """
+    try:
+        return _request({'command': 'shutdown'}, socket_path=socket_path) is not None
+    except DaemonError as e:
+        logger.warning(str(e))
+        return False
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            message = json.loads(line.decode('utf-8'))
+        except ValueError:
+            return
+        if message.get('command') == 'ping':
+            self._reply({'stdout': '', 'stderr': '', 'exit_code': 0})
+            return
+        if message.get('command') == 'shutdown':
+            self._reply({'stdout': '', 'stderr': '', 'exit_code': 0})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        self._reply(self.server.run_cli(message.get('argv', [])))
+
+    def _reply(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    The server holding the connections to the scopes.
+
+    Requests are accepted concurrently but executed one after the other,
+    as each of them has exclusive access to the process' stdout/stderr
+    (and usually to the single scope being used, anyway).
+
+    :ivar scopes: dictionary of the connected :py:class:`ds1054z.DS1054Z`
+                  instances, with the device string as key.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        self.scopes = {}
+        self._lock = threading.Lock()
+        socketserver.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+
+    def server_bind(self):
+        old_umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(old_umask)
+
+    def get_scope(self, device):
+        """ Returns the (possibly cached) connection to the scope device """
+        if device not in self.scopes:
+            from ds1054z import DS1054Z
+            logger.info('connecting to {0}'.format(device))
+            self.scopes[device] = DS1054Z(device)
+        return self.scopes[device]
+
+    def drop_scope(self, device):
+        """ Forgets about a connection (after an error, for example) """
+        ds = self.scopes.pop(device, None)
+        if ds is not None:
+            try:
+                ds.close()
+            except Exception:
+                pass
+
+    def run_cli(self, argv):
+        """
+        Runs a ds1054z CLI call with the arguments argv in the daemon
+        and returns a dict containing the output and the exit code.
+        """
+        from ds1054z import cli
+        out, err = io.StringIO(), io.StringIO()
+        exit_code = 0
+        with self._lock, contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            args = None
+            try:
+                parser = cli.build_parser()
+                args = parser.parse_args(argv)
+                if args.action not in cli.DAEMON_ACTIONS:
+                    parser.error('the action {0} is not served by the daemon'.format(args.action))
+                if not args.device and len(self.scopes) == 1:
+                    args.device = list(self.scopes)[0]
+                cli.resolve_device(args)
+                ds = self.get_scope(args.device)
+                cli.perform_action(args, ds, parser)
+            except SystemExit as e:
+                if e.code is None:
+                    exit_code = 0
+                elif isinstance(e.code, int):
+                    exit_code = e.code
+                else:
+                    err.write('{0}\n'.format(e.code))
+                    exit_code = 1
+            except Exception as e:
+                logger.debug('error while serving {0!r}'.format(argv), exc_info=True)
+                if args is not None and args.device and isinstance(e, _TRANSPORT_ERRORS):
+                    # the connection might be broken, reconnect next time
+                    self.drop_scope(args.device)
+                err.write('ERROR: {0}: {1}\n'.format(type(e).__name__, e))
+                exit_code = 1
+        return {'stdout': out.getvalue(), 'stderr': err.getvalue(), 'exit_code': exit_code}
+
+def serve(devices=(), socket_path=None, verbose=False):
+    """
+    Runs the daemon in the foreground until it is stopped
+    via :py:func:`stop_daemon` or by pressing Ctrl-C.
+
+    :param list devices: Devices to connect to right away
+    :param str socket_path: The Unix socket to listen on
+    :param bool verbose: Print information about the daemon to stdout
+    """
+    socket_path = socket_path or default_socket_path()
+    if os.path.exists(socket_path):
+        try:
+            if _request({'command': 'ping'}, socket_path=socket_path) is not None:
+                raise RuntimeError('A daemon is already listening on ' + socket_path)
+        except DaemonError as e:
+            # a hung daemon is replaced like a dead one
+            logger.warning(str(e))
+        # stale socket of a daemon which didn't shut down cleanly (or hung)
+        os.unlink(socket_path)
+    server = DaemonServer(socket_path)
+    try:
+        for device in devices:
+            server.get_scope(device)
+        if verbose:
+            print("ds1054z daemon listening on {0}".format(socket_path))
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for device in list(server.scopes):
+            server.drop_scope(device)
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
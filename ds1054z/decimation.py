@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.decimation` - Decimation for plotting
+====================================================================
+
+Plotting the millions of samples of a deep capture is slow, and taking
+every n-th sample hides glitches. This module reduces a capture to the
+number of points a plot can show:
+
+* :py:func:`minmax` keeps the minimum and maximum of every bucket of
+  samples, so no glitch gets lost.
+* :py:func:`lttb` selects one sample per bucket with the
+  Largest-Triangle-Three-Buckets algorithm, which preserves the visual
+  shape of the waveform well.
+* :py:class:`Pyramid` precomputes the minima and maxima at several
+  resolutions once, so that any window of the capture can be
+  decimated in time proportional to the points returned, which keeps
+  zooming into deep captures interactive.
+
+>>> from ds1054z.decimation import Pyramid
+>>> samples = scope.get_waveform_samples(1, mode='RAW')
+>>> pyramid = Pyramid(samples, xinc=scope.waveform_preamble_dict['xinc'])
+>>> times, values = pyramid.window(0.0, 0.01, 2000)
+
+All functions return the time and voltage values of the points to plot.
+NaN samples (like the masked samples of :py:meth:`ds1054z.DS1054Z.get_waveform_samples`)
+are ignored. It depends on NumPy (``pip install ds1054z[analysis]``).
+"""
+
+import numpy as np
+
+def _buckets(x, size):
+    """ Reshapes x to rows of size samples, padding the last row with NaN """
+    pad = -len(x) % size
+    if pad:
+        x = np.concatenate([x, np.full(pad, np.nan, dtype=x.dtype)])
+    return x.reshape(-1, size)
+
+def minmax(samples, n_points, xinc=1.0, xorig=0.0):
+    """
+    Decimates samples to (at most) n_points: the minimum and the maximum
+    of each of n_points/2 buckets, in the order they occur.
+
+    :param samples: The samples of a capture
+    :type samples: list or numpy.ndarray
+    :param int n_points: The number of points to return
+    :param float xinc: The time between two samples (in s)
+    :param float xorig: The time of the first sample (in s)
+    :return: the times and values of the points
+    :rtype: tuple of numpy.ndarray
+    """
+    x = np.asarray(samples, dtype=np.float64)
+    if len(x) <= n_points:
+        return xorig + np.arange(len(x)) * xinc, x
+    size = -(-len(x) // max(n_points // 2, 1))
+    buckets = _buckets(x, size)
+    nan = np.isnan(buckets)
+    lo = np.argmin(np.where(nan, np.inf, buckets), axis=1)
+    hi = np.argmax(np.where(nan, -np.inf, buckets), axis=1)
+    start = np.arange(len(buckets)) * size
+    idx = np.sort(np.stack([start + lo, start + hi], axis=1), axis=1).ravel()
+    return xorig + idx * xinc, x[idx]
+
+def lttb(samples, n_points, xinc=1.0, xorig=0.0):
+    """
+    Decimates samples to n_points with the Largest-Triangle-Three-Buckets algorithm:
+    the first and last sample and, of every bucket in between, the sample forming the
+    largest triangle with the point selected in the previous bucket and the mean of
+    the next bucket.
+
+    :param samples: The samples of a capture
+    :type samples: list or numpy.ndarray
+    :param int n_points: The number of points to return (at least 3)
+    :param float xinc: The time between two samples (in s)
+    :param float xorig: The time of the first sample (in s)
+    :return: the times and values of the points
+    :rtype: tuple of numpy.ndarray
+    """
+    x = np.asarray(samples, dtype=np.float64)
+    n = len(x)
+    if n <= n_points or n_points < 3:
+        return xorig + np.arange(n) * xinc, x
+    # the bucket boundaries of the samples between the first and the last one
+    edges = (1 + np.arange(n_points - 1) * (n - 2) / float(n_points - 2)).astype(np.intp)
+    edges[-1] = n - 1
+    # the means of all buckets (the last bucket's successor is the last sample)
+    inner = x[:n - 1]
+    valid = ~np.isnan(inner)
+    sums = np.add.reduceat(np.where(valid, inner, 0), edges[:-1])
+    counts = np.add.reduceat(valid.astype(np.intp), edges[:-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_y = np.append(sums / counts, x[-1])
+    mean_t = np.append((edges[:-1] + edges[1:] - 1) / 2.0, n - 1)
+    selected = np.empty(n_points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        t = np.arange(lo, hi)
+        # twice the area of the triangles: point a, the candidates and the mean of the next bucket
+        area = np.abs((a - mean_t[i + 1]) * (x[lo:hi] - x[a]) - (a - t) * (mean_y[i + 1] - x[a]))
+        if np.isnan(area).all():
+            # a gap: keep the last valid point for the next triangle
+            selected[i + 1] = lo
+            continue
+        selected[i + 1] = a = lo + np.nanargmax(area)
+    return xorig + selected * xinc, x[selected]
+
+class Pyramid(object):
+    """
+    Minima and maxima of a capture at several resolutions.
+
+    Level k holds the minimum and maximum of buckets of ``factor**(k+1)`` samples.
+    Building the pyramid takes a single pass over the samples (plus the
+    levels) and needs about ``2/(factor-1)`` times the memory of the samples.
+
+    :param samples: The samples of a capture
+    :type samples: list or numpy.ndarray
+    :param float xinc: The time between two samples (in s)
+    :param float xorig: The time of the first sample (in s)
+    :param int factor: The ratio of the bucket sizes of consecutive levels
+    """
+
+    def __init__(self, samples, xinc=1.0, xorig=0.0, factor=8):
+        self.samples = np.asarray(samples, dtype=np.float64)
+        self.xinc = float(xinc)
+        self.xorig = float(xorig)
+        self.factor = factor
+        self.levels = []
+        lo = hi = self.samples
+        while len(lo) > factor:
+            lo = np.fmin.reduce(_buckets(lo, factor), axis=1)
+            hi = np.fmax.reduce(_buckets(hi, factor), axis=1)
+            self.levels.append((lo, hi))
+
+    def bucket_size(self, level):
+        """ The number of samples per bucket on level """
+        return self.factor ** (level + 1)
+
+    def window(self, start, end, n_points):
+        """
+        Decimates the samples between the times start and end to about n_points
+        (the minimum and maximum of n_points/2 buckets) using the coarsest level
+        with enough resolution. If the window holds n_points samples or less,
+        they are returned as they are.
+
+        :param float start: The time of the beginning of the window (in s)
+        :param float end: The time of the end of the window (in s)
+        :param int n_points: The maximum number of points to return
+        :return: the times and values of the points. The minimum of a bucket is placed
+                 at the first quarter of the bucket, its maximum at the third quarter.
+        :rtype: tuple of numpy.ndarray
+        """
+        first = max(int(np.floor((start - self.xorig) / self.xinc)), 0)
+        last = min(int(np.ceil((end - self.xorig) / self.xinc)) + 1, len(self.samples))
+        count = last - first
+        if count <= n_points:
+            return self.xorig + np.arange(first, max(last, first)) * self.xinc, self.samples[first:last]
+        buckets = max(n_points // 2, 1)
+        level = -1
+        while level + 1 < len(self.levels) and count // self.bucket_size(level + 1) >= buckets:
+            level += 1
+        if level < 0:
+            return minmax(self.samples[first:last], n_points, self.xinc, self.xorig + first * self.xinc)
+        size = self.bucket_size(level)
+        lo, hi = self.levels[level]
+        b_first, b_last = first // size, -(-last // size)
+        lo, hi = lo[b_first:b_last], hi[b_first:b_last]
+        # combine groups of buckets to end up with n_points/2 buckets at most
+        group = -(-len(lo) // buckets)
+        if group > 1:
+            lo = np.fmin.reduce(_buckets(lo, group), axis=1)
+            hi = np.fmax.reduce(_buckets(hi, group), axis=1)
+        width = size * group
+        t = self.xorig + (b_first * size + np.arange(len(lo)) * width) * self.xinc
+        times = np.stack([t + 0.25 * width * self.xinc, t + 0.75 * width * self.xinc], axis=1).ravel()
+        return times, np.stack([lo, hi], axis=1).ravel()
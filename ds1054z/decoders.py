@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.decoders` - Serial protocol decoders
+===================================================================
+
+The decoders of the scope only work on the screen. The decoders in this
+module work on the raw bytes of deep captures
+(:py:meth:`ds1054z.DS1054Z.get_waveform_bytes` with ``mode='RAW'``):
+
+>>> from ds1054z.decoders import decode_uart, decode_i2c
+>>> data = scope.get_waveform_bytes(1, mode='RAW')
+>>> frames = decode_uart(data, scope.waveform_preamble_dict, baudrate=115200)
+>>> frames['data'].tobytes()
+>>> scl, sda = scope.get_waveform_bytes(1, mode='RAW'), scope.get_waveform_bytes(2, mode='RAW')
+>>> frames = decode_i2c(scl, sda, scope.waveform_preamble_dict)
+
+The signals are converted to logic levels with a threshold (in V; by
+default halfway between the lowest and the highest sample of the first
+chunk). Edges and sample points are found with vectorized operations.
+The decoders work chunk by chunk (:py:meth:`Decoder.feed`), so
+that only a chunk of a 24 Mpts capture needs to be converted at a time.
+Frames which are not complete at the end of a chunk are decoded with
+the following one.
+
+The decoded frames are returned as NumPy structured arrays (see
+:py:data:`UART_DTYPE`, :py:data:`I2C_DTYPE` and :py:data:`SPI_DTYPE`);
+their times are computed from ``xorig`` and ``xinc`` of the preamble.
+It depends on NumPy (``pip install ds1054z[analysis]``).
+"""
+
+import numpy as np
+
+#: UART frames: start time, data and errors (:py:data:`FRAMING_ERROR`, :py:data:`PARITY_ERROR`)
+UART_DTYPE = np.dtype([('time', '<f8'), ('data', '<u2'), ('error', 'u1')])
+#: I2C events: time, kind (:py:data:`I2C_START`, ...), data (the byte, for addresses incl. the R/W bit) and ack
+I2C_DTYPE = np.dtype([('time', '<f8'), ('kind', 'u1'), ('data', 'u1'), ('ack', '?')])
+#: SPI words: time of the first bit and the words on MOSI and MISO
+SPI_DTYPE = np.dtype([('time', '<f8'), ('mosi', '<u4'), ('miso', '<u4')])
+
+FRAMING_ERROR = 1
+PARITY_ERROR = 2
+
+I2C_START, I2C_STOP, I2C_ADDRESS, I2C_DATA = 0, 1, 2, 3
+
+DEFAULT_CHUNK_SIZE = 1000000
+
+def _rising(line):
+    """ The indices of the first high samples after a low one """
+    return np.flatnonzero(~line[:-1] & line[1:]) + 1
+
+def _falling(line):
+    """ The indices of the first low samples after a high one """
+    return np.flatnonzero(line[:-1] & ~line[1:]) + 1
+
+def _rank(groups):
+    """ The position of every element within its group (groups must be sorted) """
+    first = np.searchsorted(groups, groups, 'left')
+    return np.arange(len(groups)) - first
+
+def _bits_to_words(bits, msb_first=True):
+    """ Combines the rows of a 2-dimensional array of bits to integers """
+    n = bits.shape[1]
+    weights = 1 << (np.arange(n - 1, -1, -1) if msb_first else np.arange(n))
+    return (bits.astype(np.int64) * weights).sum(axis=1)
+
+class Decoder(object):
+    """
+    The base class of the decoders: digitizes the channels and
+    carries incomplete frames over from one chunk to the next.
+
+    :param preamble: The :py:attr:`ds1054z.DS1054Z.waveform_preamble_dict`
+                     of the captures (or a list with one for each channel)
+    :param thresholds: The logic threshold (in V), or a list with one for each channel
+    """
+
+    dtype = None
+    channels = ()
+
+    def __init__(self, preamble, thresholds=None):
+        n = len(self.channels)
+        self.preambles = list(preamble) if isinstance(preamble, (list, tuple)) else [preamble] * n
+        self.xinc = self.preambles[0]['xinc']
+        self.xorig = self.preambles[0]['xorig']
+        if not isinstance(thresholds, (list, tuple)):
+            thresholds = [thresholds] * n
+        self._codes = [None if t is None else t / p['yinc'] + p['yorig'] + p['yref']
+                       for t, p in zip(thresholds, self.preambles)]
+        self._carry = None
+        self._offset = 0
+
+    @staticmethod
+    def _as_codes(data):
+        return np.frombuffer(data, dtype=np.uint8) if isinstance(data, bytes) else np.asarray(data)
+
+    def _default_threshold(self, i, codes):
+        if self._codes[i] is None:
+            self._codes[i] = (int(codes.min()) + int(codes.max())) / 2.0
+
+    def _digitize(self, i, chunk):
+        codes = self._as_codes(chunk)
+        self._default_threshold(i, codes)
+        return codes >= self._codes[i]
+
+    def feed(self, *chunks):
+        """
+        Decodes the next chunk of each channel (raw bytes or uint8 arrays of the same length).
+        Without thresholds, they are derived from the first chunk, which therefore
+        should contain both levels.
+
+        :return: the frames completed with this chunk
+        :rtype: numpy.ndarray
+        """
+        lines = [self._digitize(i, chunk) for i, chunk in enumerate(chunks)]
+        if self._carry is not None:
+            lines = [np.concatenate([carry, line]) for carry, line in zip(self._carry, lines)]
+        return self._run(lines, final=False)
+
+    def finish(self):
+        """ Decodes the frames left at the end of the capture """
+        if self._carry is None:
+            return np.empty(0, dtype=self.dtype)
+        return self._run(self._carry, final=True)
+
+    def _run(self, lines, final):
+        frames, keep = self._decode(lines, final)
+        frames['time'] = self.xorig + (self._offset + frames['time']) * self.xinc
+        self._carry = None if final else [line[keep:] for line in lines]
+        self._offset += keep
+        return frames
+
+    def decode(self, *datas, **kwargs):
+        """
+        Decodes complete captures chunk by chunk.
+
+        :param datas: The raw bytes of each channel
+        :param int chunk_size: The number of samples per chunk
+        :rtype: numpy.ndarray
+        """
+        chunk_size = kwargs.get('chunk_size', DEFAULT_CHUNK_SIZE)
+        for i, data in enumerate(datas):
+            self._default_threshold(i, self._as_codes(data))
+        parts = [self.feed(*[data[i:i + chunk_size] for data in datas])
+                 for i in range(0, len(datas[0]), chunk_size)]
+        parts.append(self.finish())
+        return np.concatenate(parts)
+
+    def _decode(self, lines, final):
+        """
+        Decodes the digitized lines.
+
+        :return: the frames (with their time as sample index in lines)
+                 and the index of the first sample to keep for the next chunk
+        """
+        raise NotImplementedError()
+
+class UartDecoder(Decoder):
+    """
+    Decodes UART frames (idle high, least significant bit first).
+
+    :param preamble: see :py:class:`Decoder`
+    :param float baudrate: The baud rate
+    :param int bits: The number of data bits
+    :param str parity: None, 'even' or 'odd'
+    :param int stop_bits: The number of stop bits
+    :param float threshold: see :py:class:`Decoder`
+    """
+
+    dtype = UART_DTYPE
+    channels = ('rx',)
+
+    def __init__(self, preamble, baudrate, bits=8, parity=None, stop_bits=1, threshold=None):
+        super(UartDecoder, self).__init__(preamble, threshold)
+        self.samples_per_bit = 1.0 / (baudrate * self.xinc)
+        self.bits = bits
+        self.parity = parity
+        self.stop_bits = stop_bits
+
+    def _decode(self, lines, final):
+        line = lines[0]
+        n = len(line)
+        spb = self.samples_per_bit
+        parity_bits = 1 if self.parity else 0
+        nbits = 1 + self.bits + parity_bits + self.stop_bits
+        points = (np.arange(nbits) + 0.5) * spb
+        # a new frame can start after the sample point of the first stop bit
+        gap = (1 + self.bits + parity_bits + 0.5) * spb
+        falls = _falling(line)
+        nxt = np.searchsorted(falls, falls + gap, 'left').tolist()
+        complete = (falls + points[-1] < n - 0.5).tolist()
+        starts = []
+        i = 0
+        while i < len(falls) and complete[i]:
+            starts.append(falls[i])
+            i = nxt[i]
+        keep = falls[i] - 1 if i < len(falls) else n - 1
+        starts = np.array(starts, dtype=np.int64)
+        frames = np.empty(len(starts), dtype=UART_DTYPE)
+        if len(starts):
+            bits = line[np.rint(starts[:, None] + points).astype(np.int64)]
+            data = _bits_to_words(bits[:, 1:1 + self.bits], msb_first=False)
+            error = np.where(bits[:, 0] | ~bits[:, -self.stop_bits:].all(axis=1), FRAMING_ERROR, 0)
+            if self.parity:
+                ones = bits[:, 1:2 + self.bits].sum(axis=1) % 2
+                error |= np.where(ones != (0 if self.parity == 'even' else 1), PARITY_ERROR, 0)
+            frames['time'], frames['data'], frames['error'] = starts, data, error
+        return frames, max(keep, 0)
+
+class I2cDecoder(Decoder):
+    """
+    Decodes I2C transactions: start/stop conditions, addresses and data bytes with their acknowledge bits.
+
+    :param preamble: see :py:class:`Decoder`
+    :param thresholds: see :py:class:`Decoder`
+    """
+
+    dtype = I2C_DTYPE
+    channels = ('scl', 'sda')
+
+    def _decode(self, lines, final):
+        scl, sda = lines
+        n = len(scl)
+        # start and stop conditions: SDA changing while SCL is high
+        falls, rises = _falling(sda), _rising(sda)
+        starts = falls[scl[falls] & scl[falls - 1]]
+        stops = rises[scl[rises] & scl[rises - 1]]
+        events = np.concatenate([starts, stops])
+        kinds = np.concatenate([np.full(len(starts), I2C_START), np.full(len(stops), I2C_STOP)])
+        order = np.argsort(events, kind='stable')
+        events, kinds = events[order], kinds[order]
+        end = n
+        if not final and len(events) and kinds[-1] == I2C_START:
+            # the last transaction may continue in the next chunk
+            end = events[-1]
+            events, kinds = events[:-1], kinds[:-1]
+        clocks = _rising(scl)
+        clocks = clocks[clocks < end]
+        # the bits of every transaction (since the last start condition)
+        transaction = np.searchsorted(events, clocks, 'right') - 1
+        inside = transaction >= 0
+        inside[inside] = kinds[transaction[inside]] == I2C_START
+        clocks, transaction = clocks[inside], transaction[inside]
+        position = _rank(transaction)
+        # complete bytes: 8 data bits and the acknowledge bit
+        last = np.flatnonzero(position % 9 == 8)
+        bits = sda[clocks[last[:, None] - 8 + np.arange(9)]]
+        data = np.empty(len(last) + len(events), dtype=I2C_DTYPE)
+        data['time'][:len(last)] = clocks[last - 8]
+        data['kind'][:len(last)] = np.where(position[last] == 8, I2C_ADDRESS, I2C_DATA)
+        data['data'][:len(last)] = _bits_to_words(bits[:, :8])
+        data['ack'][:len(last)] = ~bits[:, 8]
+        data['time'][len(last):] = events
+        data['kind'][len(last):] = kinds
+        data['data'][len(last):] = 0
+        data['ack'][len(last):] = False
+        data = data[np.argsort(data['time'], kind='stable')]
+        keep = end - 1 if end < n else n - 1
+        return data, max(keep, 0)
+
+class SpiDecoder(Decoder):
+    """
+    Decodes SPI words.
+
+    :param preamble: see :py:class:`Decoder`
+    :param int mode: The SPI mode (0-3: CPOL * 2 + CPHA)
+    :param int bits: The number of bits per word
+    :param bool msb_first: Whether the most significant bit is transferred first
+    :param bool miso: Whether a MISO channel is decoded (passed after MOSI)
+    :param bool cs: Whether a chip select channel (active low) is used to align
+                    the words (passed last). Without it, the words are counted from
+                    the first clock edge of the capture.
+    :param thresholds: see :py:class:`Decoder`
+    """
+
+    dtype = SPI_DTYPE
+
+    def __init__(self, preamble, mode=0, bits=8, msb_first=True, miso=False, cs=False, thresholds=None):
+        self.channels = ('sclk', 'mosi') + (('miso',) if miso else ()) + (('cs',) if cs else ())
+        super(SpiDecoder, self).__init__(preamble, thresholds)
+        self.sample_on_rising = mode in (0, 3)
+        self.bits = bits
+        self.msb_first = msb_first
+
+    def _decode(self, lines, final):
+        named = dict(zip(self.channels, lines))
+        sclk = named['sclk']
+        n = len(sclk)
+        edges = _rising(sclk) if self.sample_on_rising else _falling(sclk)
+        if 'cs' in named:
+            cs = named['cs']
+            selects = _falling(cs)
+            end = n
+            if not final and len(selects) and not cs[-1]:
+                # the last transfer may continue in the next chunk
+                end = selects[-1]
+            edges = edges[(edges < end) & ~cs[edges]]
+            transfer = np.searchsorted(selects, edges, 'right') - 1
+            edges, transfer = edges[transfer >= 0], transfer[transfer >= 0]
+            position = _rank(transfer)
+            keep = end - 1 if end < n else n - 1
+        else:
+            position = np.arange(len(edges))
+            complete = len(edges) - len(edges) % self.bits
+            keep = edges[complete] - 1 if complete < len(edges) else n - 1
+            if not final:
+                edges, position = edges[:complete], position[:complete]
+        last = np.flatnonzero(position % self.bits == self.bits - 1)
+        samples = edges[last[:, None] - self.bits + 1 + np.arange(self.bits)]
+        words = np.zeros(len(last), dtype=SPI_DTYPE)
+        words['time'] = edges[last - self.bits + 1]
+        words['mosi'] = _bits_to_words(named['mosi'][samples], self.msb_first)
+        if 'miso' in named:
+            words['miso'] = _bits_to_words(named['miso'][samples], self.msb_first)
+        return words, max(keep, 0)
+
+def decode_uart(data, preamble, baudrate, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Decodes the UART frames of a capture (see :py:class:`UartDecoder` for the keyword arguments).
+
+    :param bytes data: The raw bytes of the capture
+    :rtype: numpy.ndarray of :py:data:`UART_DTYPE`
+    """
+    return UartDecoder(preamble, baudrate, **kwargs).decode(data, chunk_size=chunk_size)
+
+def decode_i2c(scl, sda, preamble, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Decodes the I2C transactions of a capture (see :py:class:`I2cDecoder` for the keyword arguments).
+
+    :param bytes scl: The raw bytes of the clock channel
+    :param bytes sda: The raw bytes of the data channel
+    :rtype: numpy.ndarray of :py:data:`I2C_DTYPE`
+    """
+    return I2cDecoder(preamble, **kwargs).decode(scl, sda, chunk_size=chunk_size)
+
+def decode_spi(sclk, mosi, preamble, miso=None, cs=None, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Decodes the SPI words of a capture (see :py:class:`SpiDecoder` for the keyword arguments).
+
+    :param bytes sclk: The raw bytes of the clock channel
+    :param bytes mosi: The raw bytes of the MOSI channel
+    :param bytes miso: The raw bytes of the MISO channel (optional)
+    :param bytes cs: The raw bytes of the chip select channel (optional)
+    :rtype: numpy.ndarray of :py:data:`SPI_DTYPE`
+    """
+    decoder = SpiDecoder(preamble, miso=miso is not None, cs=cs is not None, **kwargs)
+    datas = [sclk, mosi] + [d for d in (miso, cs) if d is not None]
+    return decoder.decode(*datas, chunk_size=chunk_size)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.edges` - Edge index of deep captures
+===================================================================
+
+Finding edges, pulses or glitches in millions of samples by iterating
+over them is slow. An :py:class:`EdgeIndex` finds all crossings of a
+threshold (with hysteresis) in a single vectorized pass over the raw
+bytes of a capture, before they are scaled to volts, and answers
+questions about them in logarithmic time:
+
+>>> from ds1054z.edges import EdgeIndex
+>>> data = scope.get_waveform_bytes(1, mode='RAW')
+>>> index = EdgeIndex(data, scope.waveform_preamble_dict, threshold=1.4, hysteresis=0.2)
+>>> index.next_edge(1e-3, 'rising')
+0.0010125
+>>> starts, widths = index.pulses(min_width=5e-6)
+
+The times are computed from ``xorig`` and ``xinc`` of the preamble and
+the crossings are interpolated between the samples.
+It depends on NumPy (``pip install ds1054z[analysis]``).
+"""
+
+import numpy as np
+
+KINDS = ('rising', 'falling', 'any')
+
+class EdgeIndex(object):
+    """
+    The edges of a capture: the crossings of a threshold. After a crossing,
+    the signal needs to cross the threshold by more than half the hysteresis
+    into the opposite direction for the next edge to count.
+
+    :param data: The raw bytes of a capture (as returned by
+                 :py:meth:`ds1054z.DS1054Z.get_waveform_bytes`)
+    :type data: bytes or numpy.ndarray
+    :param dict preamble: The :py:attr:`ds1054z.DS1054Z.waveform_preamble_dict`
+                          of the capture. If omitted, times are sample indices
+                          and the thresholds are given in raw codes.
+    :param float threshold: The threshold (in V), default: halfway between the minimum and the maximum
+    :param float hysteresis: The width of the hysteresis around the threshold (in V),
+                             default: 10 % of the difference between the minimum and the maximum
+
+    :ivar rising: The times of the rising edges (sorted array)
+    :ivar falling: The times of the falling edges (sorted array)
+    """
+
+    def __init__(self, data, preamble=None, threshold=None, hysteresis=None):
+        codes = np.frombuffer(data, dtype=np.uint8) if isinstance(data, bytes) else np.asarray(data)
+        preamble = preamble or {}
+        self.xinc = preamble.get('xinc', 1.0)
+        self.xorig = preamble.get('xorig', 0.0)
+        yinc = preamble.get('yinc', 1.0)
+        offset = preamble.get('yorig', 0) + preamble.get('yref', 0)
+        lo_code, hi_code = int(codes.min()), int(codes.max())
+        # the levels in codes
+        center = (lo_code + hi_code) / 2.0 if threshold is None else threshold / yinc + offset
+        half = 0.05 * (hi_code - lo_code) if hysteresis is None else hysteresis / yinc / 2.0
+        self.threshold = (center - offset) * yinc
+        self.hysteresis = 2 * half * yinc
+        self._build(codes, center, center - half, center + half)
+        self._pulses = {}
+
+    def _build(self, codes, center, low, high):
+        # the samples beyond the hysteresis band, and the state of a Schmitt trigger there
+        marks = np.flatnonzero((codes >= high) | (codes <= low))
+        states = codes[marks] >= high
+        flips = np.flatnonzero(states[1:] != states[:-1]) + 1
+        # the edges count where the opposite level is reached; their time
+        # is the last crossing of the threshold before that sample
+        below = codes < center
+        crossings = np.flatnonzero(below[1:] != below[:-1])
+        reached = marks[flips]
+        k = crossings[np.searchsorted(crossings, reached, 'left') - 1]
+        a = codes[k].astype(np.float64)
+        b = codes[k + 1].astype(np.float64)
+        times = self.xorig + (k + (center - a) / (b - a)) * self.xinc
+        rising = states[flips]
+        self.rising = times[rising]
+        self.falling = times[~rising]
+        self.edges = times
+
+    def __len__(self):
+        return len(self.edges)
+
+    def _times(self, kind):
+        if kind not in KINDS:
+            raise ValueError('Unknown kind of edge: {0} (choose from {1})'.format(kind, ', '.join(KINDS)))
+        return {'rising': self.rising, 'falling': self.falling, 'any': self.edges}[kind]
+
+    def next_edge(self, t, kind='any'):
+        """
+        The time of the first edge after t (or None).
+
+        :param float t: The time (in s)
+        :param str kind: rising, falling or any
+        """
+        times = self._times(kind)
+        pos = np.searchsorted(times, t, 'right')
+        return float(times[pos]) if pos < len(times) else None
+
+    def previous_edge(self, t, kind='any'):
+        """ The time of the last edge before t (or None), see :py:meth:`next_edge` """
+        times = self._times(kind)
+        pos = np.searchsorted(times, t, 'left')
+        return float(times[pos - 1]) if pos > 0 else None
+
+    def edges_between(self, start, end, kind='any'):
+        """ The times of the edges between start and end (array) """
+        times = self._times(kind)
+        return times[np.searchsorted(times, start, 'left'):np.searchsorted(times, end, 'right')]
+
+    def count(self, start=None, end=None, kind='any'):
+        """ The number of edges between start and end (the whole capture by default) """
+        times = self._times(kind)
+        lo = 0 if start is None else np.searchsorted(times, start, 'left')
+        hi = len(times) if end is None else np.searchsorted(times, end, 'right')
+        return int(max(hi - lo, 0))
+
+    def _pulse_table(self, polarity):
+        """ The pulses of a polarity: starts, widths, and their order by width (built on first use) """
+        if polarity not in self._pulses:
+            if polarity == 'positive':
+                begin, finish = self.rising, self.falling
+            elif polarity == 'negative':
+                begin, finish = self.falling, self.rising
+            else:
+                raise ValueError('Unknown polarity: {0} (choose from positive, negative)'.format(polarity))
+            pos = np.searchsorted(finish, begin, 'right')
+            ok = pos < len(finish)
+            starts = begin[ok]
+            widths = finish[pos[ok]] - starts
+            order = np.argsort(widths, kind='stable')
+            self._pulses[polarity] = (starts, widths, order, widths[order])
+        return self._pulses[polarity]
+
+    def pulses(self, min_width=None, max_width=None, polarity='positive'):
+        """
+        The pulses with a width in a range, like glitches shorter than max_width
+        or pulses wider than min_width. A positive pulse lasts from a rising
+        edge to the next falling edge, a negative one from a falling to a rising edge.
+
+        :param float min_width: The minimum width (in s)
+        :param float max_width: The maximum width (in s)
+        :param str polarity: positive or negative
+        :return: the start times and widths of the pulses, ordered by their start
+        :rtype: tuple of numpy.ndarray
+        """
+        starts, widths, order, sorted_widths = self._pulse_table(polarity)
+        lo = 0 if min_width is None else np.searchsorted(sorted_widths, min_width, 'left')
+        hi = len(sorted_widths) if max_width is None else np.searchsorted(sorted_widths, max_width, 'right')
+        selected = np.sort(order[lo:hi])
+        return starts[selected], widths[selected]
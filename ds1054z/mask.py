@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.mask` - Pass/fail mask testing
+=============================================================
+
+Tests captures against a mask on the host: an upper and/or a lower
+voltage limit over time. A mask is either defined by the corner points
+of its limits or derived from a golden capture with tolerances:
+
+>>> from ds1054z.mask import Mask
+>>> mask = Mask(upper=[(-6e-3, 1.2), (0, 1.2), (1e-3, 0.2), (6e-3, 0.2)])
+>>> golden = scope.get_waveform_samples(1)
+>>> preamble = scope.waveform_preamble_dict
+>>> mask = Mask.from_golden(golden, preamble['xinc'], preamble['xorig'], voltage=0.1, time=2e-6)
+
+Batches of captures (one per row of an array) are tested at once:
+
+>>> result = mask.test(captures, preamble['xinc'], preamble['xorig'])
+>>> result.counts        # violating samples per capture
+>>> result.failed        # captures with violations
+>>> result.violations    # (capture index, sample index) of all violations
+
+The limits are resolved for the time grid of the captures once and cached.
+Raw bytes as returned by :py:meth:`ds1054z.DS1054Z.get_waveform_bytes`
+can be tested without scaling them to volts (pass ``preamble``), which is
+the fastest way to keep up with polling captures.
+It depends on NumPy (``pip install ds1054z[analysis]``).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+class MaskResult(namedtuple('MaskResult', 'counts violations')):
+    """
+    The result of a mask test.
+
+    :ivar counts: The number of violating samples of every capture
+    :ivar violations: The capture and sample indices of all violating samples (tuple of two arrays)
+    """
+
+    @property
+    def failed(self):
+        """ Whether the captures violated the mask (boolean array) """
+        return self.counts > 0
+
+    @property
+    def first(self):
+        """ The index of the first violating sample of every capture (-1 if it passed) """
+        first = np.full(len(self.counts), -1)
+        captures, samples = self.violations
+        if len(captures):
+            starts = np.flatnonzero(np.r_[True, captures[1:] != captures[:-1]])
+            first[captures[starts]] = samples[starts]
+        return first
+
+class Mask(object):
+    """
+    A pass/fail mask: samples above the upper limit or below
+    the lower limit violate the mask.
+
+    The limits are piecewise linear, given by their corner points (time, voltage)
+    in ascending order of time. Outside of the time range of its points, a limit
+    doesn't apply.
+
+    :param list upper: The corner points of the upper limit (or None)
+    :param list lower: The corner points of the lower limit (or None)
+    """
+
+    def __init__(self, upper=None, lower=None):
+        self.upper = None if upper is None else np.asarray(upper, dtype=np.float64).reshape(-1, 2)
+        self.lower = None if lower is None else np.asarray(lower, dtype=np.float64).reshape(-1, 2)
+        self._grid = None
+        self._limits = None
+
+    @classmethod
+    def from_golden(cls, samples, xinc, xorig=0.0, voltage=0.1, time=0.0):
+        """
+        Derives a mask from a golden capture.
+
+        :param samples: The golden capture
+        :type samples: list or numpy.ndarray
+        :param float xinc: The time between two samples (in s)
+        :param float xorig: The time of the first sample (in s)
+        :param float voltage: The tolerance in voltage (in V)
+        :param float time: The tolerance in time (in s): the limits are the maximum/minimum
+                           of the golden capture within this time before and after each sample
+        :rtype: Mask
+        """
+        x = np.asarray(samples, dtype=np.float64)
+        upper, lower = x, x
+        k = int(round(time / xinc))
+        if k > 0:
+            pad = np.full(k, np.nan)
+            windows = np.lib.stride_tricks.sliding_window_view(np.concatenate([pad, x, pad]), 2 * k + 1)
+            upper = np.fmax.reduce(windows, axis=1)
+            lower = np.fmin.reduce(windows, axis=1)
+        t = xorig + np.arange(len(x)) * xinc
+        # NaN samples of the golden capture don't limit anything
+        upper = np.where(np.isnan(upper), np.inf, upper + voltage)
+        lower = np.where(np.isnan(lower), -np.inf, lower - voltage)
+        return cls(np.column_stack([t, upper]), np.column_stack([t, lower]))
+
+    def limits(self, xinc, xorig, points):
+        """
+        The lower and upper limit at every sample of captures with the given time grid.
+
+        :return: two arrays of points values (-inf/inf where there is no limit)
+        :rtype: tuple
+        """
+        grid = (float(xinc), float(xorig), int(points))
+        if grid != self._grid:
+            t = xorig + np.arange(points) * xinc
+            self._limits = (self._resolve(self.lower, t, -np.inf), self._resolve(self.upper, t, np.inf))
+            self._grid = grid
+        return self._limits
+
+    @staticmethod
+    def _resolve(corners, t, unlimited):
+        if corners is None:
+            return np.full(len(t), unlimited)
+        limit = np.interp(t, corners[:, 0], corners[:, 1], left=unlimited, right=unlimited)
+        # np.interp doesn't handle infinite values between two points
+        finite = np.isfinite(corners[:, 1])
+        if not finite.all():
+            blocked = np.interp(t, corners[:, 0], (~finite).astype(np.float64), left=0, right=0) > 0
+            limit[blocked] = unlimited
+        return limit
+
+    def test(self, captures, xinc=None, xorig=0.0, preamble=None):
+        """
+        Tests captures against the mask.
+
+        :param captures: A capture or a 2-dimensional array of captures (one per row): voltages,
+                         or the raw bytes of :py:meth:`ds1054z.DS1054Z.get_waveform_bytes`
+                         (bytes or uint8 arrays) if preamble is given
+        :param float xinc: The time between two samples (in s), taken from preamble if omitted
+        :param float xorig: The time of the first sample (in s), taken from preamble if given
+        :param dict preamble: The :py:attr:`ds1054z.DS1054Z.waveform_preamble_dict` of the captures
+        :rtype: MaskResult
+        """
+        if isinstance(captures, bytes):
+            captures = np.frombuffer(captures, dtype=np.uint8)
+        elif not isinstance(captures, np.ndarray) and len(captures) and isinstance(captures[0], bytes):
+            captures = np.stack([np.frombuffer(capture, dtype=np.uint8) for capture in captures])
+        x = np.atleast_2d(np.asarray(captures))
+        if preamble is not None:
+            xinc, xorig = preamble['xinc'], preamble['xorig']
+        lower, upper = self.limits(xinc, xorig, x.shape[1])
+        if x.dtype == np.uint8:
+            if preamble is None:
+                raise ValueError('The preamble is needed to test raw bytes')
+            # compare the codes with the limits converted to (integer) codes
+            offset = preamble['yorig'] + preamble['yref']
+            lower = np.clip(np.ceil(lower / preamble['yinc'] + offset), -1, 256).astype(np.int16)
+            upper = np.clip(np.floor(upper / preamble['yinc'] + offset), -1, 256).astype(np.int16)
+        bad = (x > upper) | (x < lower)
+        return MaskResult(bad.sum(axis=1), np.nonzero(bad))
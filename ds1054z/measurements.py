@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.measurements` - Measurements on the host
+=======================================================================
+
+Computes the measurements the scope offers via ``:MEASure:STATistic:item?``
+(see :py:meth:`ds1054z.DS1054Z.get_channel_measurement`) from waveform
+samples on the host: on all samples of deep RAW captures and on many
+captures at once. It depends on NumPy (``pip install ds1054z[analysis]``).
+
+>>> from ds1054z.measurements import measure
+>>> samples = scope.get_waveform_samples(1, mode='RAW')
+>>> values = measure(samples, scope.waveform_preamble_dict['xinc'])
+>>> values['frequency'], values['rtime']
+(1000.0003, 2.1e-05)
+
+The definitions follow the ones of the scope: the voltage thresholds of
+the time measurements are at 10 %, 50 % and 90 % of the amplitude between
+``vbase`` and ``vtop``. Edges are found with hysteresis between the lower
+and upper threshold, so noise around a threshold doesn't add edges.
+Time measurements are averaged over all edges/periods of a capture.
+Like on the scope, ``overshoot``, ``preshoot``, ``pduty`` and ``nduty``
+are in percent.
+
+Passing a 2-dimensional array (one capture per row) measures all captures
+at once. Samples which are NaN (like the masked samples of
+:py:meth:`ds1054z.DS1054Z.get_waveform_samples`) are ignored, which
+also allows to pad captures of different lengths to one array.
+"""
+
+import numpy as np
+
+#: The items which can be measured (as listed in :py:meth:`ds1054z.DS1054Z.get_channel_measurement`)
+ITEMS = ('vmax', 'vmin', 'vpp', 'vtop', 'vbase', 'vamp', 'vavg', 'vrms', 'overshoot', 'preshoot',
+         'marea', 'mparea', 'period', 'frequency', 'rtime', 'ftime', 'pwidth', 'nwidth', 'pduty',
+         'nduty', 'rdelay', 'fdelay', 'rphase', 'fphase', 'tvmax', 'tvmin', 'pslewrate', 'nslewrate',
+         'vupper', 'vmid', 'vlower', 'variance', 'pvrms')
+
+#: The items which need the samples of a reference channel (the argument ``reference``)
+REFERENCE_ITEMS = ('rdelay', 'fdelay', 'rphase', 'fphase')
+
+HISTOGRAM_BINS = 256
+
+def measure(samples, xinc, items=None, xorig=0.0, reference=None, thresholds=(0.1, 0.5, 0.9)):
+    """
+    Measures the items on the samples of one or many captures.
+
+    :param samples: The voltage samples of a capture (1-dimensional)
+                    or of many captures (2-dimensional, one per row)
+    :type samples: list or numpy.ndarray
+    :param float xinc: The time between two samples (in s)
+    :param list items: The items to measure (see :py:data:`ITEMS`), all if omitted
+    :param float xorig: The time of the first sample (in s)
+    :param reference: The samples of the reference channel for the items
+                      :py:data:`REFERENCE_ITEMS` (same shape as samples).
+                      The delays are the times from the first edge of samples
+                      to the closest edge of reference.
+    :param tuple thresholds: The lower, middle and upper threshold as fractions of vamp
+    :return: The values by item. For a single capture, values which cannot be
+             measured are None (like in :py:meth:`ds1054z.DS1054Z.get_channel_measurement`).
+             For many captures, the values are arrays with NaN where they cannot be measured.
+    :rtype: dict
+    """
+    x = np.asarray(samples, dtype=np.float64)
+    if x.size == 0:
+        raise ValueError('No samples to measure')
+    single = x.ndim == 1
+    x = np.atleast_2d(x)
+    if items is None:
+        items = ITEMS
+    unknown = set(items) - set(ITEMS)
+    if unknown:
+        raise ValueError('Unknown measurement item(s): ' + ', '.join(sorted(unknown)))
+    if reference is not None:
+        reference = np.atleast_2d(np.asarray(reference, dtype=np.float64))
+    wave = _Waveform(x, xinc, xorig, thresholds)
+    ref = _Waveform(reference, xinc, xorig, thresholds) if reference is not None else None
+    results = {}
+    for item in items:
+        if item in REFERENCE_ITEMS:
+            value = wave.reference_item(item, ref)
+        else:
+            value = getattr(wave, item)
+        results[item] = value
+    if single:
+        return dict((item, None if np.isnan(value[0]) else float(value[0])) for item, value in results.items())
+    return results
+
+def _interpolate(x, rows, i, level):
+    """ Fractional sample index at which the line from x[rows, i] to x[rows, i+1] crosses level[rows] """
+    a = x[rows, i]
+    b = x[rows, i + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return i + (level[rows] - a) / (b - a)
+
+def _last_index(condition, idx):
+    """ For every sample, the index of the last sample (up to it) fulfilling condition (or -1) """
+    return np.maximum.accumulate(np.where(condition, idx, -1), axis=1)
+
+def _per_row(rows, values, nrows, func='mean'):
+    """ Reduces values by row (the rows must be sorted); NaN for rows without values """
+    out = np.full(nrows, np.nan)
+    if len(rows) == 0:
+        return out
+    starts = np.searchsorted(rows, np.arange(nrows), 'left')
+    ends = np.searchsorted(rows, np.arange(nrows), 'right')
+    present = ends > starts
+    if func == 'mean':
+        sums = np.bincount(rows, weights=values, minlength=nrows)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[present] = sums[present] / (ends - starts)[present]
+    elif func == 'first':
+        out[present] = values[starts[present]]
+    elif func == 'last':
+        out[present] = values[ends[present] - 1]
+    elif func == 'count':
+        out = (ends - starts).astype(np.float64)
+    return out
+
+class _Edges(object):
+    """ The rising or falling edges of all captures: their rows and lower/mid/upper crossing times """
+
+    def __init__(self, rows, lower, mid, upper, n):
+        # edges interrupted by NaN samples can't be interpolated
+        ok = ~(np.isnan(lower) | np.isnan(mid) | np.isnan(upper))
+        self.rows = rows[ok]
+        self.lower = lower[ok]
+        self.mid = mid[ok]
+        self.upper = upper[ok]
+        # sort keys: the rows are sorted and within a row the times are
+        self._span = n + 2.
+        self._keys = self.rows * self._span + self.mid
+
+    def _neighbours(self, rows, times):
+        """ The mid crossing times of the last edge before and the first one after times (in the same row) """
+        before = np.full(len(times), np.nan)
+        after = np.full(len(times), np.nan)
+        n = len(self._keys)
+        pos = np.searchsorted(self._keys, rows * self._span + times, 'right')
+        ok = pos < n
+        ok[ok] = self.rows[pos[ok]] == rows[ok]
+        after[ok] = self.mid[pos[ok]]
+        ok = pos > 0
+        ok[ok] = self.rows[pos[ok] - 1] == rows[ok]
+        before[ok] = self.mid[pos[ok] - 1]
+        return before, after
+
+    def next_after(self, rows, times):
+        """ The mid crossing time of the first edge after times (in the same row), or NaN """
+        return self._neighbours(rows, times)[1]
+
+    def nearest(self, rows, times):
+        """ The mid crossing time of the edge closest to times (in the same row), or NaN """
+        before, after = self._neighbours(rows, times)
+        with np.errstate(invalid='ignore'):
+            take_after = np.isnan(before) | (after - times < times - before)
+        return np.where(take_after, after, before)
+
+class _Waveform(object):
+    """ Lazily computes the measurements of a 2-dimensional array of captures """
+
+    def __init__(self, x, xinc, xorig, thresholds):
+        self.x = x
+        self.xinc = float(xinc)
+        self.xorig = float(xorig)
+        self.thresholds = thresholds
+        self.nrows, self.n = x.shape
+        self.valid = ~np.isnan(x)
+        self.has_nan = not self.valid.all()
+        self._cache = {}
+
+    def _cached(self, name, func):
+        if name not in self._cache:
+            self._cache[name] = func()
+        return self._cache[name]
+
+    def _reduce(self, func, nanfunc, x=None):
+        """ Reduces the rows with func, or with nanfunc if there are NaN samples """
+        x = self.x if x is None else x
+        if not self.has_nan:
+            return func(x, axis=1)
+        return _nanreduce(nanfunc, x)
+
+    # --- voltages ---
+
+    @property
+    def vmax(self):
+        return self._cached('vmax', lambda: self._reduce(np.max, np.nanmax))
+
+    @property
+    def vmin(self):
+        return self._cached('vmin', lambda: self._reduce(np.min, np.nanmin))
+
+    @property
+    def vpp(self):
+        return self.vmax - self.vmin
+
+    def _top_base(self):
+        """ The most frequent voltages in the upper and lower half (from a histogram of each capture) """
+        bins = HISTOGRAM_BINS
+        vmin, vpp = self.vmin[:, None], self.vpp[:, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scaled = np.rint((self.x - vmin) * ((bins - 1) / vpp))
+        # one more bin per row collects the NaN samples
+        scaled[~self.valid | ~(vpp > 0)] = bins
+        flat = (scaled.astype(np.intp) + (np.arange(self.nrows) * (bins + 1))[:, None]).ravel()
+        shape = (self.nrows, bins + 1)
+        counts = np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape)[:, :bins]
+        weights = np.where(self.valid, self.x, 0).ravel() if self.has_nan else self.x.ravel()
+        sums = np.bincount(flat, weights=weights, minlength=shape[0] * shape[1]).reshape(shape)[:, :bins]
+        half = bins // 2
+        top_bin = half + np.argmax(counts[:, half:], axis=1)
+        base_bin = np.argmax(counts[:, :half], axis=1)
+        idx = np.arange(self.nrows)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            top = sums[idx, top_bin] / counts[idx, top_bin]
+            base = sums[idx, base_bin] / counts[idx, base_bin]
+        # constant captures don't have a histogram
+        flat_rows = ~(self.vpp > 0)
+        top[flat_rows] = self.vmax[flat_rows]
+        base[flat_rows] = self.vmin[flat_rows]
+        return top, base
+
+    @property
+    def vtop(self):
+        return self._cached('top_base', self._top_base)[0]
+
+    @property
+    def vbase(self):
+        return self._cached('top_base', self._top_base)[1]
+
+    @property
+    def vamp(self):
+        return self.vtop - self.vbase
+
+    @property
+    def vlower(self):
+        return self.vbase + self.thresholds[0] * self.vamp
+
+    @property
+    def vmid(self):
+        return self.vbase + self.thresholds[1] * self.vamp
+
+    @property
+    def vupper(self):
+        return self.vbase + self.thresholds[2] * self.vamp
+
+    @property
+    def vavg(self):
+        return self._reduce(np.mean, np.nanmean)
+
+    @property
+    def vrms(self):
+        return np.sqrt(self._reduce(np.mean, np.nanmean, self.x * self.x))
+
+    @property
+    def variance(self):
+        return self._reduce(np.var, np.nanvar)
+
+    @property
+    def overshoot(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.vamp > 0, (self.vmax - self.vtop) / self.vamp * 100., np.nan)
+
+    @property
+    def preshoot(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.vamp > 0, (self.vbase - self.vmin) / self.vamp * 100., np.nan)
+
+    @property
+    def marea(self):
+        area = np.nansum(self.x, axis=1) * self.xinc
+        area[~self.valid.any(axis=1)] = np.nan
+        return area
+
+    @property
+    def tvmax(self):
+        return self._time_of(np.argmax, np.nanargmax)
+
+    @property
+    def tvmin(self):
+        return self._time_of(np.argmin, np.nanargmin)
+
+    def _time_of(self, argfunc, nanargfunc):
+        if not self.has_nan:
+            return self.xorig + argfunc(self.x, axis=1) * self.xinc
+        out = np.full(self.nrows, np.nan)
+        ok = self.valid.any(axis=1)
+        if ok.any():
+            out[ok] = self.xorig + nanargfunc(self.x[ok], axis=1) * self.xinc
+        return out
+
+    # --- edges ---
+
+    def _edges(self):
+        """ Finds the rising and falling edges with hysteresis between vlower and vupper """
+        x, idx = self.x, np.arange(self.n, dtype=np.int32 if self.n < 2**31 else np.int64)
+        lower, mid, upper = self.vlower, self.vmid, self.vupper
+        with np.errstate(invalid='ignore'):
+            high = x >= upper[:, None]
+            low = x <= lower[:, None]
+            below_mid = x < mid[:, None]
+            above_mid = x > mid[:, None]
+        no_amplitude = ~(self.vamp > 0)
+        high[no_amplitude] = False
+        low[no_amplitude] = False
+        # the state of a Schmitt trigger: the last threshold reached
+        last_mark = _last_index(high | low, idx)
+        known = last_mark >= 0
+        state = np.take_along_axis(high, np.maximum(last_mark, 0), axis=1) & known
+        changed = np.zeros_like(known)
+        changed[:, 1:] = known[:, :-1] & (state[:, 1:] != state[:, :-1])
+        edges = []
+        for rising in (True, False):
+            rows, j = np.nonzero(changed & (state if rising else ~state))
+            # the last sample at the other threshold and the last one before crossing mid
+            m = last_mark[rows, j - 1]
+            k = _last_index(below_mid if rising else above_mid, idx)[rows, j - 1]
+            if rising:
+                edges.append(_Edges(rows, _interpolate(x, rows, m, lower), _interpolate(x, rows, k, mid),
+                                    _interpolate(x, rows, j - 1, upper), self.n))
+            else:
+                edges.append(_Edges(rows, _interpolate(x, rows, j - 1, lower), _interpolate(x, rows, k, mid),
+                                    _interpolate(x, rows, m, upper), self.n))
+        return edges
+
+    @property
+    def rising(self):
+        return self._cached('edges', self._edges)[0]
+
+    @property
+    def falling(self):
+        return self._cached('edges', self._edges)[1]
+
+    @property
+    def period(self):
+        def period():
+            edges = self.rising
+            first = _per_row(edges.rows, edges.mid, self.nrows, 'first')
+            last = _per_row(edges.rows, edges.mid, self.nrows, 'last')
+            count = _per_row(edges.rows, edges.mid, self.nrows, 'count')
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(count > 1, (last - first) / (count - 1), np.nan) * self.xinc
+        return self._cached('period', period)
+
+    @property
+    def frequency(self):
+        with np.errstate(divide='ignore'):
+            return 1.0 / self.period
+
+    @property
+    def rtime(self):
+        edges = self.rising
+        return _per_row(edges.rows, edges.upper - edges.lower, self.nrows) * self.xinc
+
+    @property
+    def ftime(self):
+        edges = self.falling
+        return _per_row(edges.rows, edges.lower - edges.upper, self.nrows) * self.xinc
+
+    def _width(self, start, end):
+        following = end.next_after(start.rows, start.mid)
+        ok = ~np.isnan(following)
+        return _per_row(start.rows[ok], following[ok] - start.mid[ok], self.nrows) * self.xinc
+
+    @property
+    def pwidth(self):
+        return self._cached('pwidth', lambda: self._width(self.rising, self.falling))
+
+    @property
+    def nwidth(self):
+        return self._cached('nwidth', lambda: self._width(self.falling, self.rising))
+
+    @property
+    def pduty(self):
+        return self.pwidth / self.period * 100.
+
+    @property
+    def nduty(self):
+        return self.nwidth / self.period * 100.
+
+    @property
+    def pslewrate(self):
+        return (self.vupper - self.vlower) / self.rtime
+
+    @property
+    def nslewrate(self):
+        return (self.vlower - self.vupper) / self.ftime
+
+    def _first_period(self):
+        """ The sample range (start, end) of the first full period of every capture (or -1, -1) """
+        edges = self.rising
+        start = np.full(self.nrows, -1)
+        end = np.full(self.nrows, -1)
+        count = _per_row(edges.rows, edges.mid, self.nrows, 'count')
+        ok = count > 1
+        first = np.searchsorted(edges.rows, np.arange(self.nrows))
+        start[ok] = np.ceil(edges.mid[first[ok]])
+        end[ok] = np.ceil(edges.mid[first[ok] + 1])
+        return start, end
+
+    def _per_period(self, func):
+        out = np.full(self.nrows, np.nan)
+        for row, (start, end) in enumerate(zip(*self._first_period())):
+            if end > start:
+                out[row] = func(self.x[row, start:end])
+        return out
+
+    @property
+    def mparea(self):
+        return self._per_period(np.nansum) * self.xinc
+
+    @property
+    def pvrms(self):
+        return self._per_period(lambda x: np.sqrt(np.nanmean(x * x)))
+
+    def reference_item(self, item, reference):
+        if reference is None:
+            return np.full(self.nrows, np.nan)
+        own, other = (self.rising, reference.rising) if item[0] == 'r' else (self.falling, reference.falling)
+        first = _per_row(own.rows, own.mid, self.nrows, 'first')
+        ok = ~np.isnan(first)
+        rows = np.arange(self.nrows)[ok]
+        delay = np.full(self.nrows, np.nan)
+        delay[ok] = other.nearest(rows, first[ok]) - first[ok]
+        delay *= self.xinc
+        if item.endswith('phase'):
+            return delay / self.period * 360.
+        return delay
+
+def _nanreduce(func, x):
+    """ Applies a nan-ignoring reduction along the rows without warnings for all-NaN rows """
+    out = np.full(x.shape[0], np.nan)
+    ok = ~np.isnan(x).all(axis=1)
+    if ok.any():
+        out[ok] = func(x[ok], axis=1)
+    return out
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.metrics` - Transaction metrics
+=============================================================
+
+Collects counters, latency histograms and throughput figures of the
+SCPI transactions of a :py:class:`ds1054z.DS1054Z` instance.
+Metrics are disabled by default and don't cost anything then.
+Enable them like this:
+
+>>> metrics = scope.enable_metrics()
+>>> scope.get_waveform_samples(1)
+>>> metrics.snapshot()['transfers']['waveform_chunk']['throughput']
+1843213.1
+
+The collected data can be exported as a :py:class:`dict`
+(:py:meth:`Metrics.snapshot`), in the Prometheus text exposition format
+(:py:meth:`Metrics.prometheus`), or as a JSON log line written periodically
+(:py:meth:`Metrics.start_logging`).
+"""
+
+import json
+import time
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+#: upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+#: the kinds of transfers the throughput is tracked for
+TRANSFER_TYPES = ('write', 'query', 'waveform_chunk', 'screenshot')
+
+def command_header(cmd):
+    """
+    The header of an SCPI command (the command without its parameters),
+    like ``':WAVeform:STARt'`` for ``b':WAVeform:STARt 1'``.
+    """
+    if isinstance(cmd, bytes):
+        cmd = cmd.decode('ascii', 'replace')
+    cmd = cmd.strip()
+    return cmd.split(None, 1)[0] if cmd else ''
+
+def transfer_type(header):
+    """
+    Classifies an SCPI command header as one of :py:data:`TRANSFER_TYPES`.
+    """
+    upper = header.upper()
+    if '?' not in upper:
+        return 'write'
+    if upper.endswith(':DATA?'):
+        if upper.lstrip(':').startswith('WAV'):
+            return 'waveform_chunk'
+        if upper.lstrip(':').startswith('DISP'):
+            return 'screenshot'
+    return 'query'
+
+class _Histogram(object):
+
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def cumulative(self):
+        """ (upper bound, cumulative count) pairs as used by Prometheus """
+        total = 0
+        result = []
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        return {
+          'count': self.count,
+          'sum': self.sum,
+          'min': self.min,
+          'max': self.max,
+          'buckets': dict(('{0:g}'.format(bound), count) for bound, count in self.cumulative()),
+        }
+
+class Metrics(object):
+    """
+    Collects the metrics of the SCPI transactions with one or more scopes.
+
+    A transaction is a write (possibly followed by a read of the answer).
+    Its latency is the time from the beginning of the write until the end
+    of the read (or the write, for commands without an answer).
+
+    :param dict labels: Labels added to every metric in the Prometheus export
+                        (like ``{'host': '192.168.0.23'}``)
+    """
+
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self._lock = threading.Lock()
+        self._logging_thread = None
+        self._logging_stop = None
+        self.reset()
+
+    def reset(self):
+        """ Clears all data collected so far """
+        with self._lock:
+            self.started = time.time()
+            self._commands = {}
+            self._transfers = dict((kind, [0, 0, 0.0]) for kind in TRANSFER_TYPES)
+
+    def record(self, cmd, latency, bytes_out, bytes_in):
+        """
+        Records a single transaction.
+
+        :param cmd: The SCPI command sent to the scope
+        :type cmd: bytes or str
+        :param float latency: The duration of the transaction in seconds
+        :param int bytes_out: The number of bytes written
+        :param int bytes_in: The number of bytes read
+        """
+        header = command_header(cmd)
+        kind = transfer_type(header)
+        with self._lock:
+            entry = self._commands.get(header)
+            if entry is None:
+                entry = self._commands[header] = {'bytes_out': 0, 'bytes_in': 0, 'latency': _Histogram()}
+            entry['bytes_out'] += bytes_out
+            entry['bytes_in'] += bytes_in
+            entry['latency'].add(latency)
+            transfer = self._transfers[kind]
+            transfer[0] += 1
+            transfer[1] += bytes_out + bytes_in
+            transfer[2] += latency
+
+    def snapshot(self):
+        """
+        The metrics collected so far.
+
+        :return: a dictionary with the keys ``started`` (Unix timestamp),
+                 ``commands`` (statistics per SCPI command header) and
+                 ``transfers`` (count, bytes, seconds and throughput in bytes/s
+                 per transfer type)
+        :rtype: dict
+        """
+        with self._lock:
+            commands = {}
+            for header, entry in self._commands.items():
+                commands[header] = {
+                  'count': entry['latency'].count,
+                  'bytes_out': entry['bytes_out'],
+                  'bytes_in': entry['bytes_in'],
+                  'latency': entry['latency'].as_dict(),
+                }
+            transfers = {}
+            for kind, (count, nbytes, seconds) in self._transfers.items():
+                transfers[kind] = {
+                  'count': count,
+                  'bytes': nbytes,
+                  'seconds': seconds,
+                  'throughput': nbytes / seconds if seconds else None,
+                }
+            return {'started': self.started, 'labels': dict(self.labels),
+                    'commands': commands, 'transfers': transfers}
+
+    def prometheus(self):
+        """
+        The metrics collected so far in the Prometheus text exposition format.
+
+        :rtype: str
+        """
+        snap = self.snapshot()
+        lines = []
+        def metric(name, value, **labels):
+            labels = dict(self.labels, **labels)
+            label_str = ','.join('{0}="{1}"'.format(k, _escape_label(v)) for k, v in sorted(labels.items()))
+            lines.append('{0}{{{1}}} {2}'.format(name, label_str, _format_value(value)) if label_str
+                         else '{0} {1}'.format(name, _format_value(value)))
+        lines.append('# HELP ds1054z_scpi_commands_total Number of SCPI transactions per command.')
+        lines.append('# TYPE ds1054z_scpi_commands_total counter')
+        for header, entry in sorted(snap['commands'].items()):
+            metric('ds1054z_scpi_commands_total', entry['count'], command=header)
+        lines.append('# HELP ds1054z_scpi_bytes_total Bytes transferred per command and direction.')
+        lines.append('# TYPE ds1054z_scpi_bytes_total counter')
+        for header, entry in sorted(snap['commands'].items()):
+            metric('ds1054z_scpi_bytes_total', entry['bytes_out'], command=header, direction='out')
+            metric('ds1054z_scpi_bytes_total', entry['bytes_in'], command=header, direction='in')
+        lines.append('# HELP ds1054z_scpi_latency_seconds Latency of the SCPI transactions.')
+        lines.append('# TYPE ds1054z_scpi_latency_seconds histogram')
+        for header, entry in sorted(snap['commands'].items()):
+            latency = entry['latency']
+            for bound, count in latency['buckets'].items():
+                metric('ds1054z_scpi_latency_seconds_bucket', count, command=header,
+                       le='+Inf' if bound == 'inf' else bound)
+            metric('ds1054z_scpi_latency_seconds_sum', latency['sum'], command=header)
+            metric('ds1054z_scpi_latency_seconds_count', latency['count'], command=header)
+        lines.append('# HELP ds1054z_transfers_total Number of transactions per transfer type.')
+        lines.append('# TYPE ds1054z_transfers_total counter')
+        for kind in TRANSFER_TYPES:
+            metric('ds1054z_transfers_total', snap['transfers'][kind]['count'], type=kind)
+        lines.append('# HELP ds1054z_transfer_bytes_total Bytes transferred per transfer type.')
+        lines.append('# TYPE ds1054z_transfer_bytes_total counter')
+        for kind in TRANSFER_TYPES:
+            metric('ds1054z_transfer_bytes_total', snap['transfers'][kind]['bytes'], type=kind)
+        lines.append('# HELP ds1054z_transfer_seconds_total Time spent per transfer type.')
+        lines.append('# TYPE ds1054z_transfer_seconds_total counter')
+        for kind in TRANSFER_TYPES:
+            metric('ds1054z_transfer_seconds_total', snap['transfers'][kind]['seconds'], type=kind)
+        return '\n'.join(lines) + '\n'
+
+    def log_json(self, log=None, level=logging.INFO):
+        """ Writes the current :py:meth:`snapshot` as a single JSON line to the log """
+        (log or logger).log(level, json.dumps(self.snapshot(), sort_keys=True))
+
+    def start_logging(self, interval=60.0, log=None, level=logging.INFO):
+        """
+        Starts a background thread writing the :py:meth:`snapshot`
+        as a JSON line to the log every interval seconds.
+
+        :param float interval: seconds between two log lines
+        :param log: The logger to use (default: the logger of this module)
+        :type log: logging.Logger
+        """
+        self.stop_logging()
+        stop = threading.Event()
+        def run():
+            while not stop.wait(interval):
+                self.log_json(log=log, level=level)
+        thread = threading.Thread(target=run, name='ds1054z-metrics-logging')
+        thread.daemon = True
+        self._logging_stop, self._logging_thread = stop, thread
+        thread.start()
+
+    def stop_logging(self):
+        """ Stops the periodic logging started with :py:meth:`start_logging` """
+        if self._logging_thread is None:
+            return
+        self._logging_stop.set()
+        self._logging_thread.join()
+        self._logging_thread = self._logging_stop = None
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
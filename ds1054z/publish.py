@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.publish` - Publishing live captures
+==================================================================
+
+Only one client can sensibly drive a scope. The server started with
+``ds1054z publish`` owns the connection, acquires continuously and
+publishes every capture to any number of subscribers over TCP:
+
+>>> from ds1054z.publish import subscribe
+>>> for record in subscribe('127.0.0.1', channels=['CHAN1'], decimate=10):
+...     print(record.sequence, len(record.samples))
+
+A subscriber connects and sends a single line of JSON with its options,
+like ``{"channels": ["CHAN1"], "decimate": 10, "every": 2}`` (``{}`` for
+all channels of every acquisition at full resolution):
+
+* ``channels``: the channels to receive,
+* ``decimate``: keep every n-th sample only (the preamble is adjusted),
+* ``every``: receive every n-th acquisition only.
+
+The server then sends a frame per channel and acquisition: the length of
+the record as unsigned 32 bit integer (little-endian) followed by the
+binary record as described in :py:mod:`ds1054z.stream`.
+
+Every subscriber has a queue of its own holding the latest acquisitions
+(by default 4). If a subscriber can't keep up, the oldest acquisitions
+in its queue are dropped, so a slow subscriber neither slows down the
+acquisition nor the other subscribers.
+"""
+
+from collections import deque
+import threading
+import logging
+import socket
+import struct
+import json
+import time
+import io
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from ds1054z.stream import iter_records, read_record
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 5556
+#: The length prefix of a frame
+FRAME_HEADER = struct.Struct('<I')
+
+class Subscriber(object):
+    """
+    The queue of a subscriber.
+
+    :param list channels: The channels to receive (all if None)
+    :param int decimate: Keep every n-th sample only
+    :param int every: Receive every n-th acquisition only
+    :param int queue_size: The number of acquisitions kept for the subscriber
+    """
+
+    def __init__(self, channels=None, decimate=1, every=1, queue_size=4):
+        self.channels = None if channels is None else [
+            'CHAN{0}'.format(channel) if isinstance(channel, int) else channel.upper() for channel in channels]
+        self.decimate = max(1, int(decimate))
+        self.every = max(1, int(every))
+        #: The acquisitions sent
+        self.sent = 0
+        #: The acquisitions dropped because the subscriber was too slow
+        self.dropped = 0
+        self._queue = deque(maxlen=max(1, queue_size))
+        self._condition = threading.Condition()
+        self._offered = 0
+        self._closed = False
+
+    def offer(self, records):
+        """ Queues the records of an acquisition (dropping the oldest one if the queue is full) """
+        self._offered += 1
+        if (self._offered - 1) % self.every:
+            return
+        if self.channels is not None:
+            records = [record for record in records if record.channel in self.channels]
+        if not records:
+            return
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(records)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Waits for the next acquisition.
+
+        :return: the (decimated) records, None if the subscription was closed
+                 (or nothing arrived within the timeout)
+        """
+        with self._condition:
+            if not self._queue and not self._closed:
+                self._condition.wait(timeout)
+            if not self._queue:
+                return None
+            records = self._queue.popleft()
+        if self.decimate > 1:
+            records = [decimate_record(record, self.decimate) for record in records]
+        return records
+
+    def close(self):
+        """ Ends the subscription, :py:meth:`get` returns None """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+def decimate_record(record, factor):
+    """ Keeps every factor-th sample of a record and adjusts the preamble """
+    samples = record.samples[::factor]
+    p = tuple(record.preamble)
+    preamble = p[:2] + (len(samples), p[3], p[4] * factor) + p[5:]
+    return record._replace(samples=samples, preamble=preamble)
+
+class _SubscriberHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            options = json.loads(self.rfile.readline().decode('utf-8') or '{}')
+            subscriber = Subscriber(options.get('channels'), options.get('decimate', 1),
+                                    options.get('every', 1), self.server.queue_size)
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning('invalid subscription from {0}: {1}'.format(self.client_address, e))
+            return
+        self.server.add_subscriber(subscriber)
+        try:
+            while True:
+                records = subscriber.get()
+                if records is None:
+                    break
+                frames = []
+                for record in records:
+                    data = record.pack()
+                    frames += [FRAME_HEADER.pack(len(data)), data]
+                self.wfile.write(b''.join(frames))
+                subscriber.sent += 1
+        except (IOError, OSError):
+            # the subscriber went away
+            pass
+        finally:
+            self.server.remove_subscriber(subscriber)
+
+class PublishServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    The server acquiring captures and publishing them to the subscribers.
+    The acquisition runs in a thread of its own (started by :py:meth:`start`)
+    and pauses while nobody is subscribed.
+
+    :param scope: The scope
+    :type scope: ds1054z.DS1054Z
+    :param list channels: The channels to acquire
+    :param str mode: NORMal, MAXimum or RAW (see :py:func:`ds1054z.stream.iter_records`)
+    :param tuple address: The (host, port) to listen on
+    :param int queue_size: The number of acquisitions kept per subscriber
+
+    :ivar acquisitions: The number of acquisitions published
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, scope, channels, mode='NORMal', address=('127.0.0.1', DEFAULT_PORT), queue_size=4):
+        self.scope = scope
+        self.channels = channels
+        self.mode = mode
+        self.queue_size = queue_size
+        self.acquisitions = 0
+        #: The exception which ended the acquisition, if any
+        self.error = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._subscribed = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        socketserver.TCPServer.__init__(self, address, _SubscriberHandler)
+
+    @property
+    def subscribers(self):
+        """ The current subscribers (list of :py:class:`Subscriber`) """
+        with self._lock:
+            return list(self._subscribers)
+
+    def add_subscriber(self, subscriber):
+        with self._lock:
+            self._subscribers.append(subscriber)
+            self._subscribed.set()
+        logger.info('{0} subscriber(s)'.format(len(self._subscribers)))
+
+    def remove_subscriber(self, subscriber):
+        subscriber.close()
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+            if not self._subscribers:
+                self._subscribed.clear()
+        logger.info('{0} subscriber(s)'.format(len(self._subscribers)))
+
+    def publish(self, records):
+        """ Offers the records of an acquisition to all subscribers """
+        for subscriber in self.subscribers:
+            subscriber.offer(records)
+        self.acquisitions += 1
+
+    def start(self):
+        """ Starts the acquisition thread """
+        self._thread = threading.Thread(target=self._acquire, name='ds1054z-publish-acquisition')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _acquire(self):
+        try:
+            records = iter_records(self.scope, self.channels, mode=self.mode)
+            while not self._stop.is_set():
+                if not self._subscribed.wait(0.5):
+                    continue
+                self.publish(next(records))
+        except Exception as e:
+            logger.error('the acquisition failed: {0}'.format(e))
+            self.error = e
+            threading.Thread(target=self.shutdown).start()
+
+    def server_close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for subscriber in self.subscribers:
+            subscriber.close()
+        socketserver.TCPServer.server_close(self)
+
+def serve(scope, channels, mode='NORMal', host='127.0.0.1', port=DEFAULT_PORT, queue_size=4, verbose=False):
+    """
+    Publishes captures in the foreground until Ctrl-C is pressed
+    (see :py:class:`PublishServer` for the arguments).
+
+    :param bool verbose: Print the rates and the subscribers to stderr every few seconds
+    """
+    import sys
+    server = PublishServer(scope, channels, mode, (host, port), queue_size)
+    server.start()
+    if verbose:
+        sys.stderr.write('publishing {0} on {1}:{2}\n'.format(','.join(
+            scope._interpret_channel(channel) for channel in channels), *server.server_address[:2]))
+        def report():
+            last, shown = 0, time.time()
+            while True:
+                time.sleep(5)
+                now = time.time()
+                acquisitions, subscribers = server.acquisitions, server.subscribers
+                sys.stderr.write('{0:.1f} acquisitions/s, {1} subscriber(s), sent/dropped: {2}\n'.format(
+                    (acquisitions - last) / (now - shown), len(subscribers),
+                    ' '.join('{0}/{1}'.format(s.sent, s.dropped) for s in subscribers) or '-'))
+                last, shown = acquisitions, now
+        reporter = threading.Thread(target=report, name='ds1054z-publish-report')
+        reporter.daemon = True
+        reporter.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    if server.error is not None:
+        raise server.error
+
+def subscribe(host='127.0.0.1', port=DEFAULT_PORT, channels=None, decimate=1, every=1, timeout=None):
+    """
+    Subscribes to a :py:class:`PublishServer`.
+
+    :param list channels: The channels to receive (like ``['CHAN1']``), all if omitted
+    :param int decimate: Keep every n-th sample only
+    :param int every: Receive every n-th acquisition only
+    :param float timeout: The socket timeout (in s)
+    :return: an iterator over the records (:py:class:`ds1054z.stream.Record`)
+    """
+    options = {'decimate': decimate, 'every': every}
+    if channels is not None:
+        options['channels'] = ['CHAN{0}'.format(channel) if isinstance(channel, int) else channel
+                               for channel in channels]
+    sock = socket.create_connection((host, port), timeout)
+    try:
+        sock.sendall(json.dumps(options).encode('utf-8') + b'\n')
+        stream = sock.makefile('rb')
+        while True:
+            header = stream.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                break
+            length, = FRAME_HEADER.unpack(header)
+            data = stream.read(length)
+            if len(data) < length:
+                break
+            yield read_record(io.BytesIO(data))
+    finally:
+        sock.close()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.recording` - Record and replay sessions
+======================================================================
+
+A session file contains every transaction with the scope: the commands
+written, the answers read and their timing. It is written while recording
+is active on a :py:class:`ds1054z.DS1054Z` instance:
+
+>>> with scope.record('session.ds1054z.gz'):
+...     samples = scope.get_waveform_samples(1, mode='RAW')
+
+and can be played back later through the same API without the scope:
+
+>>> from ds1054z.recording import replay
+>>> scope = replay('session.ds1054z.gz')
+>>> samples == scope.get_waveform_samples(1, mode='RAW')
+True
+
+This is useful to reproduce problems seen in the field, to profile the
+host-side cost of an operation alone and to check that optimizations
+still produce byte-identical results.
+
+The file format is compact and binary: a magic line, a length-prefixed
+JSON header and the records (kind, start and duration of the transaction,
+length and payload). Files ending with ``.gz`` are compressed with gzip.
+"""
+
+import io
+import json
+import time
+import gzip
+import struct
+from collections import namedtuple, deque
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+MAGIC = b'DS1054Z-SESSION\n'
+VERSION = 1
+_RECORD = struct.Struct('<cddI')
+
+#: A recorded transaction: kind (``b'W'`` or ``b'R'``), start (seconds since the
+#: beginning of the recording), duration (seconds), and payload (bytes)
+Record = namedtuple('Record', 'kind start duration payload')
+
+class ReplayError(Exception):
+    """ Raised when the replayed session doesn't match the commands sent """
+
+def _open(filename, mode):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    return io.open(filename, mode)
+
+class SessionWriter(object):
+    """
+    Writes the transactions of a session to a file.
+    (Usually created via :py:meth:`ds1054z.DS1054Z.start_recording`.)
+
+    :param str filename: The session file (compressed if ending with ``.gz``)
+    :param dict meta: Information stored in the header of the file
+    """
+
+    def __init__(self, filename, meta=None):
+        self.filename = filename
+        self.meta = dict(meta or {})
+        self.meta.setdefault('version', VERSION)
+        self.meta.setdefault('created', time.strftime('%Y-%m-%dT%H:%M:%S'))
+        self.file = _open(filename, 'wb')
+        header = json.dumps(self.meta, sort_keys=True).encode('utf-8')
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self.start = clock()
+
+    def add(self, kind, start, end, payload):
+        """
+        Adds a transaction to the file.
+
+        :param bytes kind: ``b'W'`` for writes and ``b'R'`` for reads
+        :param float start: start of the transaction (:py:func:`time.perf_counter`)
+        :param float end: end of the transaction (:py:func:`time.perf_counter`)
+        :param bytes payload: The data written or read
+        """
+        self.file.write(_RECORD.pack(kind, start - self.start, end - start, len(payload)))
+        self.file.write(payload)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def read_session(filename):
+    """
+    Reads a session file.
+
+    :return: the header (dict) and the list of :py:class:`Record` entries
+    :rtype: tuple
+    """
+    with _open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ReplayError('Not a ds1054z session file: ' + filename)
+        header_len = struct.unpack('<I', f.read(4))[0]
+        meta = json.loads(f.read(header_len).decode('utf-8'))
+        records = []
+        while True:
+            head = f.read(_RECORD.size)
+            if not head:
+                break
+            kind, start, duration, length = _RECORD.unpack(head)
+            records.append(Record(kind, start, duration, f.read(length)))
+    return meta, records
+
+class ReplayTransport(object):
+    """
+    A transport playing back a recorded session
+    (see :py:mod:`ds1054z.transport`).
+
+    :param str filename: The session file
+    :param bool realtime: Take as long for every transaction as it took when
+                          recording (otherwise replay as fast as possible)
+    :param bool strict: Require the very same sequence of commands as recorded.
+                        If False, answers are looked up by their command instead
+                        (in the recorded order), and writes of commands without
+                        an answer are accepted without checking them. This allows
+                        to replay a session with code sending commands differently.
+    """
+
+    def __init__(self, filename, realtime=False, strict=True):
+        self.meta, self.records = read_session(filename)
+        self.realtime = realtime
+        self.strict = strict
+        self._pos = 0
+        self._answer = None
+        self._answers = {}
+        if not strict:
+            last_write = None
+            for record in self.records:
+                if record.kind == b'W':
+                    last_write = record
+                elif last_write is not None:
+                    self._answers.setdefault(last_write.payload.strip(), deque()).append((last_write, record))
+
+    def _next(self, kind):
+        if self._pos >= len(self.records):
+            raise ReplayError('The recorded session has ended')
+        record = self.records[self._pos]
+        if record.kind != kind:
+            raise ReplayError('Expected a {0} at record {1} of the session'.format(
+                'write' if record.kind == b'W' else 'read', self._pos))
+        self._pos += 1
+        return record
+
+    def write_raw(self, data):
+        if self.strict:
+            record = self._next(b'W')
+            if record.payload != data:
+                raise ReplayError('Sent {0!r} but the session recorded {1!r} (record {2})'.format(
+                    data, record.payload, self._pos - 1))
+            self._delay(record)
+            return
+        if b'?' not in data:
+            return
+        try:
+            write, self._answer = self._answers[data.strip()].popleft()
+        except (KeyError, IndexError):
+            raise ReplayError('No (further) answer to {0!r} in the session'.format(data))
+        self._delay(write)
+
+    def read_raw(self, num=-1):
+        if self.strict:
+            record = self._next(b'R')
+        else:
+            record, self._answer = self._answer, None
+            if record is None:
+                raise ReplayError('Read without a preceding query')
+        self._delay(record)
+        return record.payload
+
+    def _delay(self, record):
+        if self.realtime and record.duration > 0:
+            time.sleep(record.duration)
+
+    def close(self):
+        pass
+
+def replay(filename, realtime=False, strict=True):
+    """
+    Creates a :py:class:`ds1054z.DS1054Z` instance playing back
+    the session recorded in filename.
+
+    :param str filename: The session file
+    :param bool realtime: see :py:class:`ReplayTransport`
+    :param bool strict: see :py:class:`ReplayTransport`
+    :rtype: ds1054z.DS1054Z
+    """
+    from ds1054z import DS1054Z
+    transport = ReplayTransport(filename, realtime=realtime, strict=strict)
+    scope = DS1054Z(transport.meta.get('host', 'replay'), transport=transport, verify_identity=False)
+    if transport.meta.get('idn'):
+        scope._identity = (transport.meta['idn'].split(',') + [''] * 4)[:4]
+    return scope
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.shared` - Sharing a scope between threads
+========================================================================
+
+A :py:class:`ds1054z.DS1054Z` instance must not be used by several threads
+at once: a waveform read is a sequence of commands (``:WAVeform:SOURce``,
+``:WAVeform:MODE``, ``:WAVeform:STARt``, ...), and the instance keeps
+state between them. A :py:class:`SharedScope` serializes all operations
+in a worker thread which owns the scope, so every high-level operation
+runs atomically:
+
+>>> from ds1054z.shared import SharedScope, URGENT
+>>> shared = SharedScope(ds1054z.DS1054Z('192.168.0.23'))
+>>> shared.get_waveform_bytes(1, mode='RAW')          # in one thread
+>>> shared.running                                    # in another one
+>>> shared.get_channel_measurement(1, 'vpp', priority=URGENT)
+>>> shared.call(lambda scope: (scope.timebase_scale, scope.timebase_offset))
+
+The operations are scheduled by priority (:py:data:`URGENT`, :py:data:`HIGH`,
+:py:data:`NORMAL`, :py:data:`BULK`), then in the order they were requested.
+Reading the internal memory (by default a :py:data:`BULK` operation) takes
+many seconds; between two of its chunks, pending operations of a higher
+priority are run, so trigger polling and measurements don't have to wait
+for the whole transfer. The waveform settings of the transfer are sent
+again before it continues. If the operations in between started the scope
+or changed the acquisition, the transfer fails with a
+:py:exc:`ds1054z.TransferError` instead of mixing bytes of two acquisitions.
+"""
+
+import threading
+import itertools
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+URGENT, HIGH, NORMAL, BULK = 0, 10, 20, 30
+
+#: The default priorities of the operations (by name), others are :py:data:`NORMAL`
+DEFAULT_PRIORITIES = {
+    'get_waveform_bytes': BULK,
+    'get_waveform_samples': BULK,
+    'get_display_data': BULK,
+    'display_data': BULK,
+}
+
+class Request(object):
+    """ An operation requested from a :py:class:`SharedScope` """
+
+    def __init__(self, func, args, kwargs, priority):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def done(self):
+        """ Whether the operation has finished """
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits for the operation to finish and returns its result
+        (or raises the exception it raised).
+
+        :param float timeout: The maximum time to wait (in s)
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('The operation did not finish within {0} s'.format(timeout))
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def _run(self):
+        try:
+            self._result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self._error = e
+        self._done.set()
+
+class SharedScope(object):
+    """
+    Makes a scope usable from several threads.
+
+    Methods and properties of the scope can be used on the shared scope
+    directly; they are run by the worker thread, which blocks the calling
+    thread until they are done. Methods accept the additional keyword
+    argument ``priority``.
+
+    :param scope: The scope
+    :type scope: ds1054z.DS1054Z
+    :param dict priorities: Priorities of operations (by name) overriding :py:data:`DEFAULT_PRIORITIES`
+    """
+
+    def __init__(self, scope, priorities=None):
+        self.scope = scope
+        self.priorities = dict(DEFAULT_PRIORITIES)
+        self.priorities.update(priorities or {})
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._current = None
+        self._preempting = False
+        self._closed = False
+        scope._between_chunks = self._between_chunks
+        self._thread = threading.Thread(target=self._serve, name='ds1054z-shared-scope')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Requests an operation without waiting for it.
+
+        :param func: The name of a method or property of the scope,
+                     or a callable which is called with the scope as its first argument
+        :param args: The arguments of the operation
+        :param int priority: The priority (keyword argument), default: depending on the operation
+        :rtype: Request
+        """
+        priority = kwargs.pop('priority', None)
+        if callable(func):
+            name = getattr(func, '__name__', None)
+            call, args = func, (self.scope,) + args
+        else:
+            name = func
+            if isinstance(getattr(type(self.scope), name, None), property):
+                call = lambda: getattr(self.scope, name)
+            else:
+                call = getattr(self.scope, name)
+        if priority is None:
+            priority = self.priorities.get(name, NORMAL)
+        request = Request(call, args, kwargs, priority)
+        if threading.current_thread() is self._thread:
+            # requested by an operation (or a callback of it): run it right away
+            request._run()
+        elif self._closed:
+            raise RuntimeError('The shared scope has been closed')
+        else:
+            self._queue.put((priority, next(self._counter), request))
+        return request
+
+    def call(self, func, *args, **kwargs):
+        """ Runs an operation and returns its result (see :py:meth:`submit`) """
+        return self.submit(func, *args, **kwargs).result()
+
+    def set(self, name, value, priority=None):
+        """ Sets a property of the scope (like ``shared.set('memory_depth', 120000)``) """
+        self.call(lambda scope: setattr(scope, name, value), priority=self.priorities.get(name, NORMAL)
+                  if priority is None else priority)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if isinstance(getattr(type(self.scope), name, None), property):
+            return self.call(name)
+        attr = getattr(self.scope, name)
+        if not callable(attr):
+            return attr
+        def method(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+
+    def _serve(self):
+        while True:
+            priority, _, request = self._queue.get()
+            if request is None:
+                break
+            self._current = priority
+            request._run()
+            self._current = None
+
+    def _between_chunks(self):
+        """ Runs the pending requests of a higher priority than the current one """
+        if self._preempting or self._current is None:
+            return False
+        ran = False
+        # state of the scope belonging to the interrupted operation
+        mask_begin_num = self.scope.mask_begin_num
+        self._preempting = True
+        try:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item[2] is None or item[0] >= self._current:
+                    self._queue.put(item)
+                    break
+                item[2]._run()
+                ran = True
+        finally:
+            self._preempting = False
+            self.scope.mask_begin_num = mask_begin_num
+        return ran
+
+    def close(self, close_scope=True):
+        """
+        Finishes the pending operations, stops the worker thread
+        and closes the connection to the scope.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put((float('inf'), next(self._counter), None))
+            self._thread.join()
+            self.scope._between_chunks = None
+        if close_scope:
+            self.scope.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
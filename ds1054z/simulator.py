@@ -0,0 +1,694 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.simulator` - A simulated DS1000Z scope
+=====================================================================
+
+A simulated instrument speaking the subset of SCPI commands used by
+:py:class:`ds1054z.DS1054Z`, meant for development, tests and benchmarks
+without tying up lab hardware. It covers ``*IDN?``, the ``:WAVeform:``
+commands (including STARt/STOP windows and IEEE binary blocks),
+``:ACQuire:MDEPth``, ``:TRIGger:STATus?``, ``:MEASure:STATistic:item?``,
+``:DISPlay:DATA?``, ``:SYSTem:SETup`` (with a JSON setup instead of the
+binary one of the real scope) and the channel and timebase settings.
+Changing the timebase offset of a stopped scope scrolls the waveform on
+the screen, which then doesn't fill it any more (like on the real scope).
+
+The waveforms of the channels can be configured, as can the latency
+of each command and the bandwidth of the link, to get realistic timing.
+
+The simulator can be used in the same process:
+
+>>> from ds1054z import DS1054Z
+>>> from ds1054z.simulator import SimulatedScope, SimulatorTransport
+>>> sim = SimulatedScope(memory_depth=24000000, bandwidth=1.5e6)
+>>> scope = DS1054Z('simulator', transport=SimulatorTransport(sim))
+
+or be served over VXI-11 and raw TCP (SCPI over a socket as on port 5555
+of the real scope) on localhost::
+
+    python -m ds1054z.simulator --vxi11-port 9009 --raw-port 5555
+
+>>> scope = DS1054Z('127.0.0.1', vxi11_port=9009)
+
+The simulator only supports the BYTE waveform format.
+Periodic waveforms are generated from a whole number of samples
+per period, so their frequency is quantized accordingly.
+"""
+
+import math
+import time
+import random
+import socket
+import struct
+import logging
+import threading
+import json
+import zlib
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+logger = logging.getLogger(__name__)
+
+IDN = 'RIGOL TECHNOLOGIES,DS1104Z,DS1ZA000000001,00.04.04.SP3'
+SCREEN_SAMPLES = 1200
+H_GRID = 12
+MAX_BYTES_PER_READ = 250000
+INVALID_MEASUREMENT = '9.9E37'
+CHANNELS = ('CHAN1', 'CHAN2', 'CHAN3', 'CHAN4', 'MATH')
+
+def short_form(header):
+    """
+    Normalizes an SCPI command header to its (upper case) short form,
+    like ``':WAVeform:STARt?'`` to ``'WAV:STAR?'``
+    """
+    query = header.endswith('?')
+    parts = []
+    for part in header.rstrip('?').strip(':').split(':'):
+        digits = ''
+        while part and part[-1].isdigit():
+            digits = part[-1] + digits
+            part = part[:-1]
+        part = part.upper()
+        if len(part) > 4:
+            part = part[:4]
+            if part[3] in 'AEIOU':
+                part = part[:3]
+        parts.append(part + digits)
+    return ':'.join(parts) + ('?' if query else '')
+
+def ieee_block(data):
+    """ Wraps data as IEEE 488.2 definite length block (with a trailing newline) """
+    length = str(len(data)).encode('ascii')
+    return b'#' + str(len(length)).encode('ascii') + length + data + b'\n'
+
+def from_ieee_block(block):
+    """ The data of an IEEE 488.2 definite length block """
+    n_digits = int(block[1:2].decode('ascii'))
+    length = int(block[2:2 + n_digits].decode('ascii'))
+    return block[2 + n_digits:2 + n_digits + length]
+
+def _png(width, height, rgb=(0, 0, 0)):
+    """ A valid PNG image of a single color """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    row = b'\x00' + bytes(bytearray(rgb)) * width
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(row * height)) +
+            chunk(b'IEND', b''))
+
+class Waveform(object):
+    """
+    The signal connected to a channel of the simulated scope.
+
+    :param str shape: ``'sine'``, ``'square'``, ``'triangle'``, or ``'dc'``
+    :param float frequency: in Hz
+    :param float amplitude: in V (half of the peak-to-peak voltage)
+    :param float offset: DC offset in V
+    :param float duty: duty cycle of the square wave (0...1)
+    :param float noise: standard deviation of added Gaussian noise in V
+    """
+
+    def __init__(self, shape='sine', frequency=1e3, amplitude=1.0, offset=0.0, duty=0.5, noise=0.0):
+        if shape not in ('sine', 'square', 'triangle', 'dc'):
+            raise ValueError('Unknown waveform shape: ' + shape)
+        self.shape = shape
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.offset = offset
+        self.duty = duty
+        self.noise = noise
+
+    def value(self, phase):
+        """ The voltage at the phase (0...1) of a period (without noise) """
+        if self.shape == 'dc':
+            val = 0.0
+        elif self.shape == 'sine':
+            val = math.sin(2 * math.pi * phase)
+        elif self.shape == 'square':
+            val = 1.0 if phase < self.duty else -1.0
+        else:
+            val = 4 * phase - 1 if phase < 0.5 else 3 - 4 * phase
+        return self.offset + self.amplitude * val
+
+    def period_samples(self, xinc):
+        """ Number of samples per period at the sample spacing xinc """
+        if self.shape == 'dc' or not self.frequency:
+            return 1
+        return max(1, int(round(1.0 / (self.frequency * xinc))))
+
+    def codes(self, num, xinc, yinc, yorig, yref=127):
+        """ num samples (as bytes) as read back from the scope's memory """
+        period = self.period_samples(xinc)
+        # with noise, the pattern must be longer than a single period not to look periodic
+        length = min(num, period * max(1, int(math.ceil(8191.0 / period))) if self.noise else period)
+        rnd = random.Random(0)
+        pattern = bytearray(length)
+        for i in range(length):
+            volts = self.value((i % period) / float(period))
+            if self.noise:
+                volts += rnd.gauss(0.0, self.noise)
+            pattern[i] = min(255, max(0, int(round(volts / yinc + yorig + yref))))
+        pattern = bytes(pattern)
+        return (pattern * (num // length + 1))[:num]
+
+    def measure(self, item):
+        """ The (ideal) value of a measurement item or None if not available """
+        amp, off = self.amplitude, self.offset
+        if self.shape == 'dc':
+            values = {'vmax': off, 'vmin': off, 'vpp': 0.0, 'vavg': off, 'vrms': abs(off),
+                      'vtop': off, 'vbase': off, 'vamp': 0.0}
+            return values.get(item)
+        rms = {'sine': amp / math.sqrt(2), 'square': amp, 'triangle': amp / math.sqrt(3)}[self.shape]
+        duty = self.duty if self.shape == 'square' else 0.5
+        period = 1.0 / self.frequency
+        values = {
+          'vmax': off + amp, 'vmin': off - amp, 'vpp': 2 * amp,
+          'vtop': off + amp, 'vbase': off - amp, 'vamp': 2 * amp,
+          'vavg': off + (amp * (2 * duty - 1) if self.shape == 'square' else 0.0),
+          'vrms': math.sqrt(rms ** 2 + off ** 2),
+          'period': period, 'frequency': self.frequency,
+          'pwidth': duty * period, 'nwidth': (1 - duty) * period,
+          'pduty': duty * 100, 'nduty': (1 - duty) * 100,
+          'overshoot': 0.0, 'preshoot': 0.0,
+        }
+        return values.get(item)
+
+class SimulatedScope(object):
+    """
+    The state and the SCPI command handling of a simulated DS1000Z scope.
+
+    :param int memory_depth: The number of samples in the deep memory while
+                             the memory depth is set to AUTO
+    :param dict waveforms: :py:class:`Waveform` instances by channel name
+                           (default: a 1 kHz sine wave on CHAN1)
+    :param float latency: Time in seconds the scope needs to process a command
+    :param dict latencies: Latencies for specific commands, given by their short form
+                           (like ``{'WAV:DATA?': 0.05, 'DISP:DATA?': 0.8}``)
+    :param float bandwidth: The link speed in bytes/s or None for unlimited
+    :param str idn: The answer to ``*IDN?``
+    """
+
+    def __init__(self, memory_depth=12000, waveforms=None, latency=0.0, latencies=None,
+                 bandwidth=None, idn=IDN):
+        self.auto_memory_depth = memory_depth
+        self.waveforms = waveforms if waveforms is not None else {'CHAN1': Waveform()}
+        self.latency = latency
+        self.latencies = dict(latencies or {})
+        self.bandwidth = bandwidth
+        self.idn = idn
+        self.lock = threading.RLock()
+        self.memory_depth = 'AUTO'
+        self.running = True
+        self.timebase_scale = 1e-3
+        self.timebase_offset = 0.0
+        # the timebase offset of the last acquisition (the screen of a
+        # stopped scope scrolls over it when the offset is changed)
+        self.acquired_offset = 0.0
+        self.channels = {}
+        for channel in CHANNELS:
+            self.channels[channel] = {'DISP': int(channel in self.waveforms), 'SCAL': 1.0, 'OFFS': 0.0, 'PROB': 1.0}
+        self.wav = {'SOUR': 'CHAN1', 'MODE': 'NORM', 'FORM': 'BYTE', 'STAR': 1, 'STOP': SCREEN_SAMPLES}
+        self._cache = {}
+
+    # --- timing ---
+
+    def command_latency(self, header):
+        """ The time in seconds the scope needs to process the command header (short form) """
+        return self.latencies.get(header, self.latency)
+
+    def transfer_time(self, nbytes):
+        """ The time in seconds needed to transfer nbytes over the link """
+        return nbytes / float(self.bandwidth) if self.bandwidth else 0.0
+
+    # --- acquisition model ---
+
+    @property
+    def depth(self):
+        """ The number of samples in the deep memory """
+        if self.memory_depth == 'AUTO':
+            return self.auto_memory_depth
+        return self.memory_depth
+
+    @property
+    def sample_rate(self):
+        return self.depth / (H_GRID * self.timebase_scale)
+
+    def _on_screen(self):
+        """ Whether the waveform commands access the screen (or the deep memory) """
+        mode = self.wav['MODE']
+        return mode == 'NORM' or (mode == 'MAX' and self.running)
+
+    def _scroll(self):
+        """ The screen columns the stopped waveform was scrolled by (to the left if positive) """
+        if self.running:
+            return 0
+        column = H_GRID * self.timebase_scale / SCREEN_SAMPLES
+        shift = int(round((self.timebase_offset - self.acquired_offset) / column))
+        return max(1 - SCREEN_SAMPLES, min(SCREEN_SAMPLES - 1, shift))
+
+    def _screen_range(self):
+        """ The first and last screen column (from 1) showing the waveform """
+        shift = self._scroll()
+        if shift >= 0:
+            return 1, SCREEN_SAMPLES - shift
+        return 1 - shift, SCREEN_SAMPLES
+
+    def _points(self):
+        if self._on_screen():
+            first, last = self._screen_range()
+            return last - first + 1
+        return self.depth
+
+    def _vertical(self, channel):
+        """ yinc, yorig, yref of the channel """
+        settings = self.channels.get(channel, self.channels['CHAN1'])
+        yinc = settings['SCAL'] / 25.0
+        return yinc, -int(round(settings['OFFS'] / yinc)), 127
+
+    def preamble(self):
+        pnts = self._points()
+        typ = {'NORM': 0, 'MAX': 1, 'RAW': 2}.get(self.wav['MODE'], 0)
+        if self._on_screen():
+            xinc = H_GRID * self.timebase_scale / SCREEN_SAMPLES
+        else:
+            xinc = 1.0 / self.sample_rate
+        xorig = self.timebase_offset - H_GRID / 2.0 * self.timebase_scale
+        yinc, yorig, yref = self._vertical(self.wav['SOUR'])
+        return '0,{0},{1},1,{2:e},{3:e},0,{4:e},{5},{6}'.format(typ, pnts, xinc, xorig, yinc, yorig, yref)
+
+    def memory(self, channel):
+        """ The bytes in the deep memory of the channel """
+        depth = self.depth
+        yinc, yorig, yref = self._vertical(channel)
+        key = (channel, depth, self.timebase_scale, yinc, yorig)
+        if key not in self._cache:
+            waveform = self.waveforms.get(channel, Waveform('dc', amplitude=0.0))
+            # keep the memory of the other channels, streaming reads them in turn
+            self._cache = dict((k, v) for k, v in self._cache.items() if k[0] != channel)
+            self._cache[key] = waveform.codes(depth, 1.0 / self.sample_rate, yinc, yorig, yref)
+        return self._cache[key]
+
+    def screen(self, channel):
+        """ The 1200 bytes of the channel shown on the screen """
+        memory = self.memory(channel)
+        step = len(memory) / float(SCREEN_SAMPLES)
+        return bytes(bytearray(memory[int(i * step)] for i in range(SCREEN_SAMPLES)))
+
+    # --- command handling ---
+
+    def handle(self, command):
+        """
+        Handles a SCPI command or several of them joined with semicolons
+        (the answers of compound queries are joined with semicolons as well).
+
+        :param str command: The command (like ``':WAVeform:STARt 1'``)
+        :return: the answer or None if the command doesn't have one
+        :rtype: bytes
+        """
+        answers = []
+        with self.lock:
+            for single in command.strip().split(';'):
+                header, _, arg = single.strip().partition(' ')
+                answer = self._handle(short_form(header), arg.strip())
+                if answer is not None:
+                    answers.append(answer)
+        if not answers:
+            return None
+        if len(answers) == 1 and isinstance(answers[0], bytes):
+            return answers[0]
+        return (';'.join(answers) + '\n').encode('utf-8')
+
+    def _handle(self, header, arg):
+        if header == '*IDN?':
+            return self.idn
+        if header in ('*OPC?',):
+            return '1'
+        if header in ('*RST', '*CLS', 'TFOR'):
+            return None
+        if header in ('RUN', 'STOP', 'SING'):
+            if self.running:
+                self.acquired_offset = self.timebase_offset
+            self.running = header == 'RUN'
+            return None
+        if header == 'TRIG:STAT?':
+            return 'AUTO' if self.running else 'STOP'
+        if header.startswith('WAV:'):
+            return self._handle_waveform(header[4:], arg)
+        if header == 'ACQ:MDEP':
+            if self.running:
+                self.memory_depth = 'AUTO' if arg.upper() == 'AUTO' else int(float(arg))
+            return None
+        if header == 'ACQ:MDEP?':
+            return str(self.memory_depth)
+        if header == 'ACQ:SRAT?':
+            return '{0:e}'.format(self.sample_rate)
+        if header in ('TIM:MAIN:SCAL', 'TIM:SCAL'):
+            self.timebase_scale = float(arg)
+            return None
+        if header in ('TIM:MAIN:SCAL?', 'TIM:SCAL?'):
+            return '{0:e}'.format(self.timebase_scale)
+        if header in ('TIM:MAIN:OFFS', 'TIM:OFFS'):
+            self.timebase_offset = float(arg)
+            return None
+        if header in ('TIM:MAIN:OFFS?', 'TIM:OFFS?'):
+            return '{0:e}'.format(self.timebase_offset)
+        if header == 'MEAS:STAT:ITEM?':
+            return self._measure(arg)
+        if header == 'DISP:DATA?':
+            return ieee_block(_png(800, 480))
+        if header == 'SYST:SET?':
+            return ieee_block(self.setup())
+        if header == 'SYST:SET':
+            self.restore_setup(from_ieee_block(arg.encode('utf-8')))
+            return None
+        channel, _, key = header.partition(':')
+        channel = 'CHAN' + channel[4:] if channel.startswith('CHAN') else channel
+        if channel in self.channels and key.rstrip('?') in ('DISP', 'SCAL', 'OFFS', 'PROB'):
+            settings = self.channels[channel]
+            if key.endswith('?'):
+                value = settings[key[:-1]]
+                return str(value) if key == 'DISP?' else '{0:e}'.format(value)
+            settings[key] = int(arg in ('1', 'ON')) if key == 'DISP' else float(arg)
+            return None
+        logger.debug('unsupported command: ' + header)
+        return None
+
+    def setup(self):
+        """ The settings as returned by ``:SYSTem:SETup?`` (JSON instead of Rigol's binary format) """
+        state = {'memory_depth': self.memory_depth, 'timebase_scale': self.timebase_scale,
+                 'timebase_offset': self.timebase_offset, 'channels': self.channels}
+        return json.dumps(state, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    def restore_setup(self, setup):
+        """ Restores settings returned by :py:meth:`setup` """
+        state = json.loads(setup.decode('utf-8'))
+        self.memory_depth = state['memory_depth']
+        self.timebase_scale = state['timebase_scale']
+        self.timebase_offset = state['timebase_offset']
+        self.channels = state['channels']
+
+    def _handle_waveform(self, key, arg):
+        if key == 'PRE?':
+            return self.preamble()
+        if key == 'DATA?':
+            source = self.wav['SOUR']
+            start, stop = self.wav['STAR'], self.wav['STOP']
+            if self._on_screen():
+                first, last = self._screen_range()
+                start, stop = max(start, first), min(stop, last)
+                # the screen columns show the acquisition shifted by the scrolling
+                data = self.screen(source)
+                return ieee_block(data[start - 1 + self._scroll():max(start - 1, stop) + self._scroll()])
+            data = self.memory(source)
+            stop = min(stop, len(data), start + MAX_BYTES_PER_READ - 1)
+            return ieee_block(data[start - 1:stop])
+        if key.endswith('?'):
+            return str(self.wav.get(key[:-1], ''))
+        if key in ('STAR', 'STOP'):
+            if self._on_screen():
+                # like the scope, ignore columns not showing the waveform
+                first, last = self._screen_range()
+                if first <= int(arg) <= last:
+                    self.wav[key] = int(arg)
+            else:
+                self.wav[key] = max(1, min(int(arg), self._points()))
+        elif key == 'SOUR':
+            self.wav[key] = 'CHAN' + arg[-1] if arg.upper().startswith('CHAN') else arg.upper()
+        else:
+            self.wav[key] = short_form(arg)
+        return None
+
+    def _measure(self, arg):
+        params = [param.strip() for param in arg.split(',')]
+        if len(params) == 2:
+            item, source = params
+        else:
+            _, item, source = params[:3]
+        source = 'CHAN' + source[-1] if source.upper().startswith('CHAN') else source.upper()
+        waveform = self.waveforms.get(source)
+        if waveform is None or not self.channels[source]['DISP']:
+            return INVALID_MEASUREMENT
+        value = waveform.measure(item.lower())
+        return INVALID_MEASUREMENT if value is None else '{0:e}'.format(value)
+
+class SimulatorTransport(object):
+    """
+    Transport connecting a :py:class:`ds1054z.DS1054Z` instance
+    directly to a :py:class:`SimulatedScope` in the same process.
+
+    The latency and bandwidth configured for the simulated scope
+    are applied (by sleeping).
+    """
+
+    def __init__(self, scope=None):
+        self.scope = scope if scope is not None else SimulatedScope()
+        self._answer = None
+
+    def write_raw(self, data):
+        command = data.decode('utf-8')
+        _sleep(self.scope.transfer_time(len(data)))
+        answer = self.scope.handle(command)
+        _sleep(self.scope.command_latency(short_form(command.strip().partition(' ')[0])))
+        if answer is not None:
+            self._answer = answer
+
+    def read_raw(self, num=-1):
+        answer, self._answer = self._answer, None
+        if answer is None:
+            raise IOError('No answer available from the simulated scope')
+        _sleep(self.scope.transfer_time(len(answer)))
+        return answer
+
+    def close(self):
+        pass
+
+def _sleep(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
+
+# --- network servers ---
+
+class _RpcRequestHandler(socketserver.BaseRequestHandler):
+    """ Handles an ONC RPC connection with a protocol created by the server """
+
+    def handle(self):
+        from vxi11 import rpc
+        protocol = self.server.protocol_factory()
+        while True:
+            try:
+                call = rpc.recvrecord(self.request)
+            except (EOFError, socket.error):
+                break
+            reply = protocol.handle(call)
+            if reply is not None:
+                rpc.sendrecord(self.request, reply)
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def _vxi11_core_protocol(scope):
+    """ Creates the VXI-11 core channel protocol for a single connection """
+    from vxi11 import rpc, vxi11
+
+    class Vxi11CoreProtocol(rpc.Server):
+
+        def __init__(self):
+            rpc.Server.__init__(self, '', vxi11.DEVICE_CORE_PROG, vxi11.DEVICE_CORE_VERS, 0)
+            self.incoming = b''
+            self.answer = b''
+
+        def addpackers(self):
+            self.packer = vxi11.Packer()
+            self.unpacker = vxi11.Unpacker('')
+
+        def handle_10(self): # create_link
+            self.unpacker.unpack_create_link_parms()
+            self.turn_around()
+            self.packer.pack_create_link_resp((vxi11.ERR_NO_ERROR, 1, 0, 1024 * 1024))
+
+        def handle_11(self): # device_write
+            link, timeout, lock_timeout, flags, data = self.unpacker.unpack_device_write_parms()
+            self.turn_around()
+            self.incoming += data
+            _sleep(scope.transfer_time(len(data)))
+            if flags & vxi11.OP_FLAG_END:
+                command, self.incoming = self.incoming.decode('utf-8'), b''
+                answer = scope.handle(command)
+                _sleep(scope.command_latency(short_form(command.strip().partition(' ')[0])))
+                if answer is not None:
+                    self.answer = answer
+            self.packer.pack_device_write_resp((vxi11.ERR_NO_ERROR, len(data)))
+
+        def handle_12(self): # device_read
+            link, request_size, timeout, lock_timeout, flags, term_char = self.unpacker.unpack_device_read_parms()
+            self.turn_around()
+            if not self.answer:
+                self.packer.pack_device_read_resp((vxi11.ERR_IO_TIMEOUT, 0, b''))
+                return
+            data, self.answer = self.answer[:request_size], self.answer[request_size:]
+            _sleep(scope.transfer_time(len(data)))
+            reason = vxi11.RX_REQCNT if self.answer else vxi11.RX_END
+            self.packer.pack_device_read_resp((vxi11.ERR_NO_ERROR, reason, data))
+
+        def _generic(self):
+            self.unpacker.unpack_device_generic_parms()
+            self.turn_around()
+            self.packer.pack_device_error(vxi11.ERR_NO_ERROR)
+
+        handle_14 = handle_15 = handle_16 = handle_17 = _generic # trigger, clear, remote, local
+
+        def handle_23(self): # destroy_link
+            self.unpacker.unpack_device_link()
+            self.turn_around()
+            self.packer.pack_device_error(vxi11.ERR_NO_ERROR)
+
+    return Vxi11CoreProtocol()
+
+def _portmapper_protocol(ports):
+    """ Creates a minimal portmapper protocol answering GETPORT requests from ports """
+    from vxi11 import rpc
+
+    class PortmapperProtocol(rpc.Server):
+
+        def __init__(self):
+            rpc.Server.__init__(self, '', rpc.PMAP_PROG, rpc.PMAP_VERS, 0)
+
+        def addpackers(self):
+            self.packer = rpc.PortMapperPacker()
+            self.unpacker = rpc.PortMapperUnpacker('')
+
+        def handle_3(self): # getport
+            prog, vers, prot, port = self.unpacker.unpack_mapping()
+            self.turn_around()
+            self.packer.pack_uint(ports.get((prog, vers, prot), 0))
+
+    return PortmapperProtocol()
+
+class _RawRequestHandler(socketserver.StreamRequestHandler):
+    """ Handles SCPI commands sent line by line over a TCP connection """
+
+    def handle(self):
+        scope = self.server.scope
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            _sleep(scope.transfer_time(len(line)))
+            command = line.decode('utf-8').strip()
+            if not command:
+                continue
+            answer = scope.handle(command)
+            _sleep(scope.command_latency(short_form(command.partition(' ')[0])))
+            if answer is not None:
+                _sleep(scope.transfer_time(len(answer)))
+                self.wfile.write(answer)
+                self.wfile.flush()
+
+class SimulatorServer(object):
+    """
+    Serves a :py:class:`SimulatedScope` over the network.
+
+    :param scope: The simulated scope (a new one with default settings if omitted)
+    :type scope: SimulatedScope
+    :param str host: The address to listen on
+    :param int vxi11_port: Port of the VXI-11 core channel (0: any free port)
+    :param int raw_port: Port for SCPI over raw TCP (0: any free port, None: disabled)
+    :param int portmapper_port: Port of the portmapper (111 for regular VXI-11 clients,
+                                None: disabled)
+
+    :ivar ports: The ports actually used, by service (``'vxi11'``, ``'raw'``, ``'portmapper'``)
+    """
+
+    def __init__(self, scope=None, host='127.0.0.1', vxi11_port=0, raw_port=None, portmapper_port=None):
+        self.scope = scope if scope is not None else SimulatedScope()
+        self.host = host
+        self.ports = {}
+        self._servers = []
+        self._requested = {'vxi11': vxi11_port, 'raw': raw_port, 'portmapper': portmapper_port}
+
+    def start(self):
+        """ Starts serving in background threads """
+        from vxi11 import rpc, vxi11
+        core = _ThreadingTCPServer((self.host, self._requested['vxi11']), _RpcRequestHandler)
+        core.protocol_factory = lambda: _vxi11_core_protocol(self.scope)
+        self._add(core, 'vxi11')
+        if self._requested['portmapper'] is not None:
+            mapping = {(vxi11.DEVICE_CORE_PROG, vxi11.DEVICE_CORE_VERS, rpc.IPPROTO_TCP): self.ports['vxi11']}
+            pmap = _ThreadingTCPServer((self.host, self._requested['portmapper']), _RpcRequestHandler)
+            pmap.protocol_factory = lambda: _portmapper_protocol(mapping)
+            self._add(pmap, 'portmapper')
+        if self._requested['raw'] is not None:
+            raw = _ThreadingTCPServer((self.host, self._requested['raw']), _RawRequestHandler)
+            raw.scope = self.scope
+            self._add(raw, 'raw')
+        return self
+
+    def _add(self, server, name):
+        self.ports[name] = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever, name='ds1054z-simulator-' + name)
+        thread.daemon = True
+        thread.start()
+        self._servers.append(server)
+
+    def stop(self):
+        """ Stops all servers """
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulated Rigol DS1000Z oscilloscope')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--vxi11-port', type=int, default=0,
+        help='Port of the VXI-11 core channel (default: any free port)')
+    parser.add_argument('--raw-port', type=int, default=5555,
+        help='Port for SCPI commands over raw TCP (default: 5555)')
+    parser.add_argument('--portmapper-port', type=int, default=111,
+        help='Port of the portmapper needed by regular VXI-11 clients (default: 111). '
+             'Use 0 to disable it.')
+    parser.add_argument('--memory-depth', type=int, default=12000000,
+        help='Samples in the deep memory (default: 12000000)')
+    parser.add_argument('--latency', type=float, default=0.0,
+        help='Processing time of each command in seconds (default: 0)')
+    parser.add_argument('--bandwidth', type=float, default=None,
+        help='Link speed in bytes/s (default: unlimited)')
+    parser.add_argument('--channels', type=int, default=1, choices=(1, 2, 3, 4),
+        help='Number of channels with a signal (sine waves of 1, 2, 3, 4 kHz)')
+    args = parser.parse_args()
+
+    waveforms = dict(('CHAN{0}'.format(i), Waveform(frequency=1e3 * i)) for i in range(1, args.channels + 1))
+    scope = SimulatedScope(memory_depth=args.memory_depth, waveforms=waveforms,
+                           latency=args.latency, bandwidth=args.bandwidth)
+    server = SimulatorServer(scope, host=args.host, vxi11_port=args.vxi11_port, raw_port=args.raw_port,
+                             portmapper_port=args.portmapper_port or None)
+    try:
+        server.start()
+    except socket.error as e:
+        parser.error('Could not start the servers: {0} (the portmapper port 111 '
+                     'requires elevated privileges, try --portmapper-port 0)'.format(e))
+    for name, port in sorted(server.ports.items()):
+        print('{0:<10s} {1}:{2}'.format(name, args.host, port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+
+if __name__ == "__main__":
+    main()
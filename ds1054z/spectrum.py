@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.spectrum` - Spectrum analysis
+============================================================
+
+The FFT of the scope works on the screen data only. This module
+estimates the power spectral density of deep RAW captures with the
+method of Welch (averaging the spectra of overlapping, windowed segments)
+and analyzes it for peaks, total harmonic distortion and signal-to-noise
+ratio:
+
+>>> from ds1054z.spectrum import welch
+>>> samples = scope.get_waveform_samples(1, mode='RAW')
+>>> spectrum = welch(samples, scope.waveform_preamble_dict['xinc'], nperseg=8192)
+>>> spectrum.peaks(3)
+[(1000.0..., 0.810...), (3000.0..., 0.090...), (5000.0..., 0.032...)]
+>>> spectrum.thd(), spectrum.snr()
+(0.388..., 61.2...)
+
+The samples can also be passed in chunks (like the ones of a streaming
+read) to :py:meth:`Welch.add`; only a segment's worth of samples is kept
+between the chunks. The segments are transformed in blocks of bounded
+size, in parallel threads. It depends on NumPy (``pip install ds1054z[analysis]``).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+def _window(name, n):
+    """ The periodic window function name of n samples """
+    if name in ('rect', 'boxcar'):
+        return np.ones(n)
+    windows = {'hann': np.hanning, 'hamming': np.hamming, 'blackman': np.blackman}
+    if name not in windows:
+        raise ValueError('Unknown window: {0} (choose from rect, {1})'.format(name, ', '.join(sorted(windows))))
+    return windows[name](n + 1)[:-1]
+
+#: Half the width of the main lobe of the windows (in bins)
+MAIN_LOBE = {'rect': 1, 'boxcar': 1, 'hann': 2, 'hamming': 2, 'blackman': 3}
+
+class Welch(object):
+    """
+    Accumulates the averaged power spectral density of samples passed in chunks.
+
+    :param float xinc: The time between two samples (in s)
+    :param int nperseg: The number of samples per segment (the frequency resolution is 1/(nperseg*xinc))
+    :param float overlap: The overlap of consecutive segments (as a fraction of nperseg)
+    :param str window: The window function: rect, hann, hamming or blackman
+    :param int workers: The number of threads transforming blocks of segments
+                        (default: the number of CPUs)
+    :param int block_segments: The number of segments transformed at once
+                               (limits the memory needed to about
+                               block_segments * nperseg * 16 bytes per worker)
+    """
+
+    def __init__(self, xinc, nperseg=4096, overlap=0.5, window='hann', workers=None, block_segments=256):
+        self.xinc = float(xinc)
+        self.nperseg = int(nperseg)
+        self.step = max(1, int(round(self.nperseg * (1 - overlap))))
+        self.window_name = window
+        self.window = _window(window, self.nperseg)
+        self.workers = workers or os.cpu_count() or 1
+        self.block_segments = block_segments
+        self.segments = 0
+        self.skipped = 0
+        self._sum = np.zeros(self.nperseg // 2 + 1)
+        self._tail = np.empty(0)
+
+    def add(self, samples):
+        """
+        Adds the next chunk of samples. Segments containing NaN samples are skipped.
+
+        :param samples: The samples following those of the previous call
+        :type samples: list or numpy.ndarray
+        :return: self
+        """
+        x = np.concatenate([self._tail, np.asarray(samples, dtype=np.float64)])
+        count = 0 if len(x) < self.nperseg else (len(x) - self.nperseg) // self.step + 1
+        if count:
+            segments = np.lib.stride_tricks.as_strided(x, shape=(count, self.nperseg),
+                                                       strides=(x.strides[0] * self.step, x.strides[0]))
+            blocks = [segments[i:i + self.block_segments] for i in range(0, count, self.block_segments)]
+            if self.workers > 1 and len(blocks) > 1:
+                with ThreadPoolExecutor(self.workers) as executor:
+                    results = list(executor.map(self._transform, blocks))
+            else:
+                results = [self._transform(block) for block in blocks]
+            for power, used in results:
+                self._sum += power
+                self.segments += used
+            self.skipped += count - sum(used for _, used in results)
+        self._tail = x[count * self.step:].copy()
+        return self
+
+    def _transform(self, block):
+        """ The summed power spectra of the segments in block (without NaN) and their number """
+        ok = ~np.isnan(block).any(axis=1)
+        if not ok.all():
+            block = block[ok]
+        spectra = np.fft.rfft(block * self.window, axis=1)
+        power = spectra.real ** 2 + spectra.imag ** 2
+        return power.sum(axis=0), len(block)
+
+    def spectrum(self):
+        """
+        The spectrum of the samples added so far.
+
+        :rtype: Spectrum
+        """
+        fs = 1.0 / self.xinc
+        if self.segments:
+            psd = self._sum / (self.segments * fs * (self.window ** 2).sum())
+        else:
+            psd = np.full(len(self._sum), np.nan)
+        # one-sided: fold the power of the negative frequencies (except for DC and Nyquist)
+        psd[1:] *= 2
+        if self.nperseg % 2 == 0:
+            psd[-1] /= 2
+        freqs = np.fft.rfftfreq(self.nperseg, self.xinc)
+        return Spectrum(freqs, psd, self.segments, MAIN_LOBE.get(self.window_name, 2))
+
+def welch(samples, xinc, nperseg=4096, overlap=0.5, window='hann', workers=None):
+    """
+    The power spectral density of samples estimated with the method of Welch.
+    (See :py:class:`Welch` for the parameters.)
+
+    :rtype: Spectrum
+    """
+    return Welch(xinc, nperseg, overlap, window, workers).add(samples).spectrum()
+
+class Spectrum(object):
+    """
+    A one-sided power spectral density.
+
+    :ivar frequencies: The frequencies of the bins (in Hz)
+    :ivar psd: The power spectral density (in V²/Hz)
+    :ivar int segments: The number of segments averaged
+    :ivar int lobe: Half the width of the main lobe of the window (in bins),
+                    the power of a tone is summed over the bins of its main lobe
+    """
+
+    def __init__(self, frequencies, psd, segments, lobe=2):
+        self.frequencies = frequencies
+        self.psd = psd
+        self.segments = segments
+        self.lobe = lobe
+
+    @property
+    def resolution(self):
+        """ The width of a frequency bin (in Hz) """
+        return self.frequencies[1] - self.frequencies[0]
+
+    def _bin(self, frequency):
+        return int(round(frequency / self.resolution))
+
+    def _lobe_power(self, idx):
+        """ The power of a tone at bin idx: the PSD summed over the main lobe (in V²) """
+        lo, hi = max(idx - self.lobe, 0), min(idx + self.lobe + 1, len(self.psd))
+        return self.psd[lo:hi].sum() * self.resolution
+
+    def power(self, frequency):
+        """ The power of a tone at frequency (in V², the mean square of the tone) """
+        return self._lobe_power(self._bin(frequency))
+
+    def peaks(self, n=10, min_frequency=None):
+        """
+        The strongest tones in the spectrum.
+
+        :param int n: The maximum number of peaks
+        :param float min_frequency: Ignore peaks below this frequency
+                                    (default: the bins next to DC)
+        :return: (frequency, power) of the peaks, strongest first. The power is in V²;
+                 the frequency is interpolated between the bins of the main lobe.
+        :rtype: list of tuples
+        """
+        psd = self.psd
+        first = self.lobe + 1 if min_frequency is None else max(1, int(np.ceil(min_frequency / self.resolution)))
+        inner = psd[1:-1]
+        local = np.flatnonzero((inner > psd[:-2]) & (inner >= psd[2:])) + 1
+        local = local[local >= first]
+        local = local[np.argsort(psd[local])[::-1]]
+        peaks = []
+        taken = np.zeros(len(psd), dtype=bool)
+        for idx in local:
+            if taken[idx]:
+                continue
+            lo, hi = max(idx - self.lobe, 0), min(idx + self.lobe + 1, len(psd))
+            taken[lo:hi] = True
+            weights = psd[lo:hi]
+            frequency = (self.frequencies[lo:hi] * weights).sum() / weights.sum()
+            peaks.append((float(frequency), float(weights.sum() * self.resolution)))
+            if len(peaks) >= n:
+                break
+        return peaks
+
+    def _harmonics(self, fundamental, harmonics):
+        if fundamental is None:
+            fundamental = self.peaks(1)[0][0]
+        bins = []
+        for k in range(1, harmonics + 1):
+            idx = self._bin(k * fundamental)
+            if idx + self.lobe >= len(self.psd):
+                break
+            bins.append(idx)
+        return bins
+
+    def thd(self, fundamental=None, harmonics=5):
+        """
+        The total harmonic distortion: the RMS of the harmonics relative to the fundamental.
+
+        :param float fundamental: The frequency of the fundamental (default: the strongest peak)
+        :param int harmonics: The number of harmonics taken into account (including the fundamental)
+        :return: the ratio (multiply by 100 for %)
+        :rtype: float
+        """
+        bins = self._harmonics(fundamental, harmonics)
+        powers = [self._lobe_power(idx) for idx in bins]
+        return float(np.sqrt(sum(powers[1:]) / powers[0]))
+
+    def snr(self, fundamental=None, harmonics=5):
+        """
+        The signal-to-noise ratio: the power of the fundamental relative to the
+        power of everything else except DC and the harmonics.
+
+        :param float fundamental: The frequency of the fundamental (default: the strongest peak)
+        :param int harmonics: The number of harmonics excluded from the noise (including the fundamental)
+        :return: the ratio in dB
+        :rtype: float
+        """
+        bins = self._harmonics(fundamental, harmonics)
+        noise = np.ones(len(self.psd), dtype=bool)
+        noise[:self.lobe + 1] = False
+        for idx in bins:
+            noise[max(idx - self.lobe, 0):idx + self.lobe + 1] = False
+        # the median density isn't biased by the leakage of the tones into the bins next to them
+        noise_power = np.median(self.psd[noise]) * (len(self.psd) - 1) * self.resolution
+        return float(10 * np.log10(self._lobe_power(bins[0]) / noise_power))
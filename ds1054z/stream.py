@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.stream` - Streaming captures
+===========================================================
+
+Acquires captures continuously over one connection and writes them as
+a stream of records, one per channel and acquisition, to a file, a pipe
+or a FIFO (this is what ``ds1054z stream`` does):
+
+>>> from ds1054z.stream import iter_records, StreamWriter
+>>> with StreamWriter(sys.stdout.buffer) as writer:
+...     for records in iter_records(scope, [1, 2]):
+...         writer.put(records)
+
+A binary record is a fixed size header (:py:data:`RECORD_HEADER`)
+followed by the samples as unsigned bytes, as read from the scope::
+
+    magic      4s  b'DS1Z'
+    version    B   1
+    channel    B   1-4 (5 for MATH)
+    size       H   the size of the header
+    sequence   I   the number of the acquisition
+    timestamp  d   the time of the acquisition (Unix time)
+    preamble   4i 2d i d 2i  fmt, typ, pnts, cnt, xinc, xorig, xref, yinc, yorig, yref
+    length     I   the number of samples
+
+all little-endian. :py:func:`read_record` reads them back. In the NDJSON
+format, every record is a JSON object on a line of its own.
+
+The time of sample i is ``xorig + i * xinc``. If the waveform of a
+stopped scope was scrolled and doesn't fill the screen, the record holds
+only its ``pnts`` samples and ``xorig`` is the time of the first of them.
+
+The records are written by a separate thread, so the next acquisition
+is read from the scope while the previous one is written. If the
+consumer is slower than the scope, :py:class:`StreamWriter` either
+waits for it (slowing the acquisition down to the rate of the consumer)
+or, with ``drop=True``, drops the oldest acquisitions not written yet.
+"""
+
+from collections import namedtuple
+import threading
+import struct
+import json
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+RECORD_MAGIC = b'DS1Z'
+RECORD_VERSION = 1
+#: The header of a binary record
+RECORD_HEADER = struct.Struct('<4sBBHId4i2did2iI')
+
+PREAMBLE_KEYS = ('fmt', 'typ', 'pnts', 'cnt', 'xinc', 'xorig', 'xref', 'yinc', 'yorig', 'yref')
+CHANNELS = ('CHAN1', 'CHAN2', 'CHAN3', 'CHAN4', 'MATH')
+
+class Record(namedtuple('Record', 'sequence timestamp channel preamble samples')):
+    """
+    The samples of a channel from one acquisition.
+
+    :ivar sequence: The number of the acquisition (starting at 0)
+    :ivar timestamp: The time of the acquisition (Unix time)
+    :ivar channel: The channel name (like ``'CHAN1'``)
+    :ivar preamble: The waveform preamble (see :py:attr:`ds1054z.DS1054Z.waveform_preamble`)
+    :ivar samples: The samples (bytes)
+    """
+
+    def pack(self):
+        """ The binary record (bytes) """
+        header = RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, CHANNELS.index(self.channel) + 1,
+                                    RECORD_HEADER.size, self.sequence, self.timestamp,
+                                    *(tuple(self.preamble) + (len(self.samples),)))
+        return header + bytes(self.samples)
+
+    def to_json(self):
+        """ The record as a line of NDJSON (str, without the newline) """
+        return json.dumps({'sequence': self.sequence, 'timestamp': self.timestamp, 'channel': self.channel,
+                           'preamble': dict(zip(PREAMBLE_KEYS, self.preamble)),
+                           'samples': list(bytearray(self.samples))}, separators=(',', ':'))
+
+def read_record(stream):
+    """
+    Reads a binary record.
+
+    :param stream: A binary file object
+    :return: the record, None at the end of the stream
+    :rtype: Record
+    """
+    header = _read_exactly(stream, RECORD_HEADER.size)
+    if header is None:
+        return None
+    values = RECORD_HEADER.unpack(header)
+    if values[0] != RECORD_MAGIC:
+        raise ValueError('Not a ds1054z stream record')
+    # newer versions may have a longer header
+    if values[3] > RECORD_HEADER.size and _read_exactly(stream, values[3] - RECORD_HEADER.size) is None:
+        raise ValueError('Incomplete stream record')
+    samples = _read_exactly(stream, values[-1]) if values[-1] else b''
+    if samples is None:
+        raise ValueError('Incomplete stream record')
+    return Record(values[4], values[5], CHANNELS[values[2] - 1], values[6:16], samples)
+
+def _read_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            if data:
+                raise ValueError('Incomplete stream record')
+            return None
+        data += chunk
+    return data
+
+def read_records(stream):
+    """ Iterates over the binary records of a stream (see :py:func:`read_record`) """
+    while True:
+        record = read_record(stream)
+        if record is None:
+            break
+        yield record
+
+def iter_records(scope, channels, mode='NORMal', count=None):
+    """
+    Acquires captures continuously.
+
+    In NORMal mode, the 1200 samples on the screen are read while the
+    scope keeps running, with two round trips per channel. In RAW mode,
+    every acquisition is a single trigger and the whole memory is read.
+    In MAXimum mode, the samples are read as by
+    :py:meth:`ds1054z.DS1054Z.get_waveform_bytes`.
+
+    :param scope: The scope
+    :type scope: ds1054z.DS1054Z
+    :param list channels: The channels to read (like ``[1, 2]`` or ``['CHAN1']``)
+    :param str mode: NORMal, MAXimum or RAW
+    :param int count: The number of acquisitions, endless if omitted
+    :return: an iterator over lists of records (one per channel)
+    """
+    channels = [scope._interpret_channel(channel) for channel in channels]
+    raw = mode.upper().startswith('RAW')
+    screen = mode.upper().startswith('NOR')
+    sequence = 0
+    while count is None or sequence < count:
+        if raw:
+            scope.single()
+            while scope.running:
+                time.sleep(0.01)
+        timestamp = time.time()
+        records = []
+        for channel in channels:
+            if screen:
+                preamble, samples = _read_screen(scope, channel, mode)
+            else:
+                samples = scope.get_waveform_bytes(channel, mode=mode)
+                preamble = scope.waveform_preamble
+            records.append(Record(sequence, timestamp, channel, preamble, samples))
+        yield records
+        sequence += 1
+
+def _read_screen(scope, channel, mode):
+    """ Reads the screen samples and the preamble with two round trips """
+    preamble = scope.parse_waveform_preamble(scope.query(
+        ':WAVeform:SOURce {0};:WAVeform:FORMat BYTE;:WAVeform:MODE {1};'
+        ':WAVeform:STARt 1;:WAVeform:STOP {2};:WAVeform:PREamble?'.format(channel, mode, scope.SAMPLES_ON_DISPLAY)))
+    if preamble[2] < scope.SAMPLES_ON_DISPLAY:
+        # the waveform doesn't fill the screen, let get_waveform_bytes() find out where it is
+        samples = scope.get_waveform_bytes(channel, mode=mode)
+        at_begin, num = scope.mask_begin_num
+        # keep the pnts samples of the waveform only (not the padding)
+        if at_begin:
+            samples = samples[num:]
+            # the time of the first sample
+            preamble = preamble[:5] + (preamble[5] + num * preamble[4],) + preamble[6:]
+        else:
+            samples = samples[:-num]
+        return preamble, samples
+    return preamble, scope.decode_ieee_block(scope.query_raw(':WAVeform:DATA?'))
+
+class StreamStats(namedtuple('StreamStats', 'acquisitions records bytes dropped blocked elapsed')):
+    """
+    Statistics of a stream: acquisitions and records written, bytes written,
+    acquisitions dropped, the time the acquisition waited for the consumer
+    and the time elapsed (in s).
+    """
+
+    @property
+    def rate(self):
+        """ The acquisitions written per second """
+        return self.acquisitions / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def throughput(self):
+        """ The bytes written per second """
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return '{0} acquisitions, {1:.1f}/s, {2:.2f} MB/s, {3} dropped, {4:.1f} s waiting for the consumer'.format(
+            self.acquisitions, self.rate, self.throughput / 1e6, self.dropped, self.blocked)
+
+class StreamWriter(object):
+    """
+    Writes records in a separate thread.
+
+    :param stream: A binary file object (like ``sys.stdout.buffer`` or an open FIFO)
+    :param str fmt: ``'binary'`` or ``'ndjson'``
+    :param int buffer: The number of acquisitions which may wait to be written
+    :param bool drop: Whether to drop the oldest waiting acquisition instead of
+                      waiting when the buffer is full
+    """
+
+    def __init__(self, stream, fmt='binary', buffer=4, drop=False):
+        if fmt not in ('binary', 'ndjson'):
+            raise ValueError('Unknown stream format: {0}'.format(fmt))
+        self.stream = stream
+        self.fmt = fmt
+        self.drop = drop
+        #: The exception which stopped the writer (like a broken pipe), if any
+        self.error = None
+        self._queue = queue.Queue(max(1, buffer))
+        self._lock = threading.Lock()
+        self._counts = [0, 0, 0, 0, 0.0]
+        self._start = time.time()
+        self._thread = threading.Thread(target=self._write, name='ds1054z-stream-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, records):
+        """
+        Queues the records of an acquisition to be written.
+        Raises the error which stopped the writer, if any.
+
+        :param list records: The records
+        """
+        if self.error is not None:
+            raise self.error
+        if self.drop:
+            while True:
+                try:
+                    self._queue.put_nowait(records)
+                    break
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                    except queue.Empty:
+                        continue
+                    with self._lock:
+                        self._counts[3] += 1
+        else:
+            t0 = time.time()
+            self._queue.put(records)
+            with self._lock:
+                self._counts[4] += time.time() - t0
+
+    @property
+    def stats(self):
+        """ The statistics so far (:py:class:`StreamStats`) """
+        with self._lock:
+            return StreamStats(*(self._counts + [time.time() - self._start]))
+
+    def _write(self):
+        while True:
+            records = self._queue.get()
+            if records is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                nbytes = 0
+                for record in records:
+                    if self.fmt == 'binary':
+                        data = record.pack()
+                    else:
+                        data = (record.to_json() + '\n').encode('utf-8')
+                    self.stream.write(data)
+                    nbytes += len(data)
+                self.stream.flush()
+            except (IOError, OSError, ValueError) as e:
+                self.error = e
+                continue
+            with self._lock:
+                self._counts[0] += 1
+                self._counts[1] += len(records)
+                self._counts[2] += nbytes
+
+    def close(self):
+        """ Writes the acquisitions still waiting and stops the thread """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.tracing` - Tracing SCPI sessions
+===============================================================
+
+Reports every transaction with the scope to callbacks (tracers)
+registered with :py:meth:`ds1054z.DS1054Z.add_tracer`.
+A tracer is called with a :py:class:`Transaction` for every write
+and read and with an :py:class:`Operation` whenever a high-level
+operation of :py:class:`ds1054z.DS1054Z` (like
+``get_waveform_bytes(CHAN1, RAW)``) has finished.
+
+The :py:class:`TraceRecorder` collects those events and exports them
+in the Chrome trace event format which can be viewed as a timeline
+in ``chrome://tracing`` or https://ui.perfetto.dev :
+
+>>> with scope.trace() as recorder:
+...     scope.get_waveform_samples(1, mode='RAW')
+>>> recorder.save('session.trace.json')
+
+All timestamps are in seconds as returned by :py:func:`time.perf_counter`.
+"""
+
+import json
+import threading
+from collections import namedtuple
+
+#: A single write to or read from the scope.
+#:
+#: * ``command``: the SCPI command (for reads: the command being answered)
+#: * ``direction``: ``'write'`` or ``'read'``
+#: * ``nbytes``: the number of bytes transferred
+#: * ``start``, ``end``: timestamps in seconds
+#: * ``operation``: label of the innermost high-level operation or None
+#: * ``chunk``: index of the chunk of a chunked transfer or None
+Transaction = namedtuple('Transaction', 'command direction nbytes start end operation chunk')
+
+#: A high-level operation (reported when finished).
+#:
+#: * ``name``: label like ``'get_waveform_bytes(CHAN1, RAW)'``
+#: * ``start``, ``end``: timestamps in seconds
+#: * ``parent``: label of the enclosing operation or None
+Operation = namedtuple('Operation', 'name start end parent')
+
+class TraceRecorder(object):
+    """
+    A tracer collecting all events in memory.
+
+    :ivar events: list of :py:class:`Transaction` and :py:class:`Operation` events
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    @property
+    def transactions(self):
+        """ The :py:class:`Transaction` events recorded """
+        return [ev for ev in self.events if isinstance(ev, Transaction)]
+
+    @property
+    def operations(self):
+        """ The :py:class:`Operation` events recorded """
+        return [ev for ev in self.events if isinstance(ev, Operation)]
+
+    def summary(self):
+        """
+        Aggregates the transactions per operation.
+
+        :return: {operation: {'transactions': n, 'bytes': n, 'seconds': t}}
+        :rtype: dict
+        """
+        result = {}
+        for ev in self.transactions:
+            entry = result.setdefault(ev.operation, {'transactions': 0, 'bytes': 0, 'seconds': 0.0})
+            entry['transactions'] += 1
+            entry['bytes'] += ev.nbytes
+            entry['seconds'] += ev.end - ev.start
+        return result
+
+    def to_chrome_trace(self):
+        """
+        The recorded events in the Chrome trace event format.
+
+        Operations are shown on the track *operations*,
+        transactions on the track *transactions*.
+
+        :rtype: dict
+        """
+        events = list(self.events)
+        t0 = min([ev.start for ev in events] or [0.0])
+        trace_events = [
+          {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': 'operations'}},
+          {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 2, 'args': {'name': 'transactions'}},
+        ]
+        for ev in events:
+            entry = {
+              'ph': 'X',
+              'pid': 1,
+              'ts': (ev.start - t0) * 1e6,
+              'dur': (ev.end - ev.start) * 1e6,
+            }
+            if isinstance(ev, Operation):
+                entry.update({'name': ev.name, 'cat': 'operation', 'tid': 1,
+                              'args': {'parent': ev.parent}})
+            else:
+                entry.update({'name': '{0} {1}'.format(ev.direction, ev.command),
+                              'cat': ev.direction, 'tid': 2,
+                              'args': {'bytes': ev.nbytes, 'operation': ev.operation, 'chunk': ev.chunk}})
+            trace_events.append(entry)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def save(self, filename):
+        """ Writes the Chrome trace event JSON to a file """
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+The submodule :py:mod:`ds1054z.transport` - Alternative transports
+==================================================================
+
+By default, :py:class:`ds1054z.DS1054Z` talks to the scope via VXI-11.
+Any object with the methods ``write_raw(data)``, ``read_raw(num=-1)``
+and ``close()`` can be used instead by passing it as the keyword argument
+``transport``:
+
+>>> from ds1054z import DS1054Z
+>>> from ds1054z.transport import SocketTransport
+>>> scope = DS1054Z('192.168.0.23', transport=SocketTransport('192.168.0.23'))
+"""
+
+import socket
+
+class SocketTransport(object):
+    """
+    SCPI over a raw TCP socket, as offered on port 5555
+    by the DS1000Z scopes (and by :py:mod:`ds1054z.simulator`).
+
+    Commands are terminated with a newline. Answers are read until their
+    terminating newline or, for IEEE binary blocks, according to their header.
+
+    :param str host: The host name or IP address
+    :param int port: The TCP port
+    :param float timeout: Socket timeout in seconds
+    """
+
+    def __init__(self, host, port=5555, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.timeout = timeout
+        self._buffer = b''
+
+    @property
+    def timeout(self):
+        """ The socket timeout in seconds (can be changed while connected) """
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self._timeout = timeout
+        if self.sock is not None:
+            self.sock.settimeout(timeout)
+
+    def open(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._buffer = b''
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def write_raw(self, data):
+        self.open()
+        if not data.endswith(b'\n'):
+            data += b'\n'
+        self.sock.sendall(data)
+
+    def _fill(self, size):
+        """ Reads from the socket until the buffer holds at least size bytes """
+        chunks = [self._buffer]
+        have = len(self._buffer)
+        while have < size:
+            chunk = self.sock.recv(max(size - have, 65536))
+            if not chunk:
+                raise IOError('Connection closed by {0}:{1}'.format(self.host, self.port))
+            chunks.append(chunk)
+            have += len(chunk)
+        self._buffer = b''.join(chunks)
+
+    def _take(self, size):
+        self._fill(size)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def read_raw(self, num=-1):
+        self.open()
+        self._fill(1)
+        if self._buffer[:1] == b'#':
+            self._fill(2)
+            n_digits = int(self._buffer[1:2].decode('ascii'))
+            self._fill(2 + n_digits)
+            n_bytes = int(self._buffer[2:2 + n_digits].decode('ascii'))
+            # header, data and the terminating newline
+            return self._take(2 + n_digits + n_bytes + 1)
+        while b'\n' not in self._buffer:
+            self._fill(len(self._buffer) + 1)
+        idx = self._buffer.index(b'\n') + 1
+        return self._take(idx)
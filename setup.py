@@ -43,6 +43,7 @@ setup(name='ds1054z',
       extras_require = {
           'savescreen':  ["Pillow",],
           'discovery':   ["zeroconf",],
+          'analysis':    ["numpy",],
       },
       package_data = {
           '': ['resources/*.png'],
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import unittest, os, shutil, tempfile
+
+try:
+    import numpy as np
+    from ds1054z.accumulator import WaveformAccumulator
+except ImportError:
+    np = None
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class WaveformAccumulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.captures = rng.normal(3.0, 0.5, size=(200, 1200))
+        # masked samples at the beginning of some captures
+        self.captures[::7, :50] = np.nan
+
+    def assertStatistics(self, acc):
+        np.testing.assert_allclose(acc.mean, np.nanmean(self.captures, axis=0))
+        np.testing.assert_allclose(acc.std(ddof=1), np.nanstd(self.captures, axis=0, ddof=1))
+        np.testing.assert_array_equal(acc.min, np.nanmin(self.captures, axis=0))
+        np.testing.assert_array_equal(acc.max, np.nanmax(self.captures, axis=0))
+        np.testing.assert_array_equal(acc.count, (~np.isnan(self.captures)).sum(axis=0))
+
+    def test_one_by_one(self):
+        acc = WaveformAccumulator()
+        for capture in self.captures:
+            acc.add(list(capture))
+        self.assertEqual(acc.captures, 200)
+        self.assertStatistics(acc)
+
+    def test_batches_and_merge(self):
+        acc = WaveformAccumulator().add(self.captures[:50]).add(self.captures[50:120])
+        other = WaveformAccumulator()
+        other.add(self.captures[120:])
+        acc.merge(other).merge(WaveformAccumulator())
+        self.assertEqual(acc.captures, 200)
+        self.assertStatistics(acc)
+        self.assertRaises(ValueError, acc.add, np.zeros(100))
+
+    def test_save_load(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            acc = WaveformAccumulator(xinc=1e-6, xorig=-6e-4).add(self.captures)
+            acc.save(os.path.join(tmpdir, 'acc.npz'))
+            restored = WaveformAccumulator.load(os.path.join(tmpdir, 'acc.npz'))
+            self.assertEqual(restored.xinc, 1e-6)
+            self.assertStatistics(restored)
+            acc.save(os.path.join(tmpdir, 'acc.csv'))
+            table = np.genfromtxt(os.path.join(tmpdir, 'acc.csv'), delimiter=',', names=True)
+            self.assertEqual(table.dtype.names, ('time', 'min', 'max', 'mean', 'std', 'count'))
+            self.assertAlmostEqual(table['time'][0], -6e-4)
+            self.assertEqual(len(table), 1200)
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    unittest.main()
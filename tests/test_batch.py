@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import os
+
+try:
+    import numpy as np
+    from ds1054z.batch import analyze, analyze_array, load_capture, measure_capture
+except ImportError:
+    np = None
+
+def peak_to_peak(capture):
+    return max(float(samples.max() - samples.min()) for samples in capture.channels.values())
+
+def add(total, value):
+    return total + value
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.t = np.arange(2000) * 1e-5
+        self.filenames = []
+        for i in range(4):
+            x = (i + 1) * np.sin(2 * np.pi * 1e3 * self.t)
+            filename = os.path.join(self.tmpdir, 'capture-{0}.npy'.format(i))
+            np.save(filename, np.vstack([x, x / 2]))
+            self.filenames.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_capture(self):
+        capture = load_capture(self.filenames[1])
+        self.assertEqual(list(capture.channels), ['CHAN1', 'CHAN2'])
+        self.assertIsInstance(capture.channels['CHAN1'], np.memmap)
+        filename = os.path.join(self.tmpdir, 'capture.csv')
+        with open(filename, 'w') as f:
+            f.write('TIME,CHAN1\n')
+            for t, v in zip(self.t, np.sin(2 * np.pi * 1e3 * self.t)):
+                f.write('{0},{1:.2e}\n'.format(t, v))
+        capture = load_capture(filename)
+        self.assertAlmostEqual(capture.xinc, 1e-5)
+        self.assertEqual(len(capture.channels['CHAN1']), 2000)
+        filename = os.path.join(self.tmpdir, 'capture.npz')
+        np.savez(filename, CHAN3=self.t, xinc=1e-5, xorig=-1e-3)
+        capture = load_capture(filename)
+        self.assertEqual((list(capture.channels), capture.xinc, capture.xorig), (['CHAN3'], 1e-5, -1e-3))
+
+    def test_analyze(self):
+        progress = []
+        results = analyze(self.filenames, peak_to_peak, processes=2, progress=progress.append)
+        self.assertEqual(sorted(results.values()), [2.0, 4.0, 6.0, 8.0])
+        self.assertEqual(results[self.filenames[3]], 8.0)
+        self.assertEqual([p.done for p in progress], [1, 2, 3, 4])
+        self.assertEqual(progress[-1].bytes, 4 * 2 * 2000 * 8)
+        self.assertEqual(progress[-1].eta, 0)
+        total = analyze(self.filenames, peak_to_peak, reducer=add, initial=0.0, processes=1)
+        self.assertEqual(total, 20.0)
+
+    def test_analyze_array(self):
+        captures = np.outer([1, 2, 3], np.sin(2 * np.pi * 1e3 * self.t))
+        results = analyze_array(captures, measure_capture, xinc=1e-5, processes=2)
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertAlmostEqual(results[2]['CHAN1']['vpp'], 6.0)
+        self.assertAlmostEqual(results[0]['CHAN1']['frequency'], 1e3, places=3)
+
+if __name__ == '__main__':
+    unittest.main()
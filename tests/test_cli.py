@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+import unittest
+import contextlib
+import tempfile
+import shutil
+import time
+import io
+import os
+
+import ds1054z
+from ds1054z.cli import run_script, build_parser, perform_action
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform
+
+class ScriptTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = SimulatedScope(waveforms={'CHAN1': Waveform('sine', 1e3, 1.0)})
+        self.scope = ds1054z.DS1054Z('script', transport=SimulatorTransport(self.sim))
+
+    def run_script(self, script):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with self.scope.trace() as recorder:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                exit_code = run_script(self.scope, io.StringIO(script))
+        messages = [ev.command for ev in recorder.transactions if ev.direction == 'write']
+        return exit_code, stdout.getvalue(), stderr.getvalue(), messages
+
+    def test_pipelining(self):
+        exit_code, stdout, stderr, messages = self.run_script(
+            '# set up the timebase\n'
+            ':TIMebase:MAIN:SCALe 0.002\n'
+            '\n'
+            ':TIMebase:MAIN:SCALe?\n'
+            'CHANnel1:SCALe 0.5\n'
+            ':CHANnel1:SCALe?\n'
+            '*IDN?\n'
+            'STOP\n')
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(messages, [':TIMebase:MAIN:SCALe 0.002;:TIMebase:MAIN:SCALe?;:CHANnel1:SCALe 0.5;'
+                                    ':CHANnel1:SCALe?;*IDN?;:STOP'])
+        lines = stdout.splitlines()
+        self.assertEqual([float(line) for line in lines[:2]], [0.002, 0.5])
+        self.assertEqual(lines[2], self.sim.idn)
+        self.assertFalse(self.sim.running)
+        lines = stderr.splitlines()
+        self.assertTrue(lines[0].startswith('6 commands in 1 messages'))
+        self.assertEqual(lines[2].split()[:4], ['1', '2-8', '6', '3'])
+
+    def test_batches(self):
+        self.scope.setting_batch_size = 3
+        script = ''.join(':CHANnel1:OFFSet {0}\n:CHANnel1:OFFSet?\n'.format(i) for i in range(4)) + 'quit\n*IDN?\n'
+        exit_code, stdout, stderr, messages = self.run_script(script)
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(len(messages), 3)
+        self.assertEqual([float(line) for line in stdout.splitlines()], [0, 1, 2, 3])
+        self.assertEqual([line.split()[1] for line in stderr.splitlines()[2:]], ['1-3', '4-6', '7-8'])
+
+    def test_block_queries(self):
+        exit_code, stdout, stderr, messages = self.run_script(
+            ':WAVeform:SOURce CHAN1\n:WAVeform:MODE?\n:WAVeform:DATA?\n:WAVeform:FORMat?\n')
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(messages, [':WAVeform:SOURce CHAN1;:WAVeform:MODE?', ':WAVeform:DATA?', ':WAVeform:FORMat?'])
+        lines = stdout.splitlines()
+        self.assertEqual(lines[0], 'NORM')
+        self.assertTrue(lines[1].startswith("binary message: b'#41200"))
+        self.assertEqual(lines[2], 'BYTE')
+
+class BurstTest(unittest.TestCase):
+    """ save-data --count/--until """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='ds1054z-test-')
+        self.sim = SimulatedScope(memory_depth=30000, waveforms={
+            'CHAN1': Waveform('sine', 1e3, 1.0), 'CHAN2': Waveform('square', 2e3, 0.5)})
+        self.scope = ds1054z.DS1054Z('burst', transport=SimulatorTransport(self.sim))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def save_data(self, *argv):
+        parser = build_parser()
+        args = parser.parse_args(['save-data'] + list(argv) + ['burst'])
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with self.scope.trace() as recorder:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                with self.assertRaises(SystemExit) as cm:
+                    perform_action(args, self.scope, parser)
+        self.writes = [ev.command for ev in recorder.transactions if ev.direction == 'write']
+        self.stdout, self.stderr = stdout.getvalue(), stderr.getvalue()
+        return cm.exception.code
+
+    def files(self):
+        return sorted(os.listdir(self.tmpdir))
+
+    def read_file(self, name):
+        with open(os.path.join(self.tmpdir, name)) as f:
+            return f.read().splitlines()
+
+    def test_count_raw(self):
+        filename = os.path.join(self.tmpdir, 'capture.csv')
+        self.assertEqual(self.save_data('--mode', 'RAW', '--count', '3', '--filename', filename), 0)
+        self.assertEqual(self.files(), ['capture_0000.csv', 'capture_0001.csv', 'capture_0002.csv'])
+        self.assertEqual(self.stdout.splitlines(), [os.path.join(self.tmpdir, name) for name in self.files()])
+        self.assertIn('Saved 3 captures', self.stderr)
+        lines = self.read_file('capture_0002.csv')
+        self.assertEqual(lines[0], 'TIME,CHAN1,CHAN2')
+        self.assertEqual(len(lines), 1 + 30000)
+        # armed once per capture (not again after the last one),
+        # the preamble is read once per channel and capture
+        self.assertEqual(self.writes.count(':SINGle'), 3)
+        self.assertEqual(self.writes.count(':WAVeform:PREamble?'), 3 * 2)
+
+    def test_naming(self):
+        filename = os.path.join(self.tmpdir, 'run{n}.txt')
+        self.assertEqual(self.save_data('--count', '2', '--without-time', '--filename', filename), 0)
+        self.assertEqual(self.files(), ['run0.txt', 'run1.txt'])
+        lines = self.read_file('run1.txt')
+        self.assertEqual(lines[0], 'CHAN1\tCHAN2')
+        self.assertEqual(len(lines), 1 + 1200)
+        self.assertNotIn(':SINGle', self.writes)
+        self.assertTrue(self.sim.running)
+
+    def test_until(self):
+        filename = os.path.join(self.tmpdir, 'capture_{n:03d}.csv')
+        start = time.time()
+        self.assertEqual(self.save_data('--mode', 'RAW', '--until', '0.3', '--filename', filename), 0)
+        self.assertTrue(0.3 <= time.time() - start < 5)
+        n = len(self.files())
+        self.assertTrue(n >= 1)
+        self.assertEqual(self.files()[-1], 'capture_{0:03d}.csv'.format(n - 1))
+        self.assertEqual(self.writes.count(':SINGle'), n)
+
+    def test_write_error(self):
+        filename = os.path.join(self.tmpdir, 'missing', 'capture.csv')
+        self.assertEqual(self.save_data('--count', '5', '--filename', filename), 1)
+        self.assertEqual(self.files(), [])
+        self.assertEqual(self.stdout, '')
+
+    def test_invalid_arguments(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            for count in ('0', '-1', 'x'):
+                with self.assertRaises(SystemExit):
+                    build_parser().parse_args(['save-data', '--count', count])
+            for until in ('-5', '0', 'nan', 'inf', '25:00', '12:99', '12:00:60', '1:2:3:4', 'x:y'):
+                with self.assertRaises(SystemExit):
+                    build_parser().parse_args(['save-data', '--until', until])
+            for until in ('0.5', '23:59', '00:00:00'):
+                args = build_parser().parse_args(['save-data', '--until', until])
+                self.assertTrue(time.time() < args.until <= time.time() + 24 * 3600)
+            filename = os.path.join(self.tmpdir, 'capture.npy')
+            self.assertEqual(self.save_data('--count', '2', '--filename', filename), 2)
+            self.assertEqual(self.save_data('--until', '10', '--filename', filename), 2)
+        self.assertIn('--count and --until are only supported', self.stderr)
+        self.assertEqual(self.files(), [])
+
+if __name__ == '__main__':
+    unittest.main()
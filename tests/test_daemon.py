@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import threading
+import shutil
+import socket
+import os
+
+import ds1054z
+from ds1054z import daemon
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets are not available')
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='ds1054z-test-')
+        self.socket_path = os.path.join(self.tmpdir, 'daemon.sock')
+        self.server = daemon.DaemonServer(self.socket_path)
+        self.sim = SimulatedScope(waveforms={'CHAN1': Waveform('sine', 1e3, 1.0)})
+        self.server.scopes['sim'] = ds1054z.DS1054Z('sim', transport=SimulatorTransport(self.sim))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            self.server.shutdown()
+            self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def forward(self, *argv):
+        return daemon.forward(argv, socket_path=self.socket_path)
+
+    def test_round_trip(self):
+        response = self.forward('measure', '-c', '1', 'sim', 'vpp')
+        self.assertEqual(response['exit_code'], 0)
+        self.assertAlmostEqual(float(response['stdout']), 2.0)
+        self.assertEqual(response['stderr'], '')
+        # the single connected scope is used if no device is given
+        response = self.forward('properties', 'product')
+        self.assertEqual(response, {'stdout': 'DS1104Z\n', 'stderr': '', 'exit_code': 0})
+        self.forward('stop')
+        self.assertFalse(self.sim.running)
+
+    def test_exit_codes(self):
+        # an action writing files is not served
+        response = self.forward('save-data', 'sim')
+        self.assertEqual(response['exit_code'], 2)
+        self.assertIn('not served by the daemon', response['stderr'])
+        self.assertEqual(response['stdout'], '')
+        # invalid arguments
+        response = self.forward('measure', '-c', '7', 'sim', 'vpp')
+        self.assertEqual(response['exit_code'], 2)
+        self.assertIn('invalid choice', response['stderr'])
+        # errors while performing the action
+        response = self.forward('properties', 'no_such_property', 'sim')
+        self.assertEqual(response['exit_code'], 1)
+        self.assertIn('AttributeError', response['stderr'])
+        # a user error keeps the connection
+        self.assertIn('sim', self.server.scopes)
+
+    def test_transport_error(self):
+        self.server.scopes['sim'].transport.read_raw = self.broken_read
+        response = self.forward('properties', 'timebase_scale', 'sim')
+        self.assertEqual(response['exit_code'], 1)
+        self.assertIn('connection lost', response['stderr'])
+        # the connection was dropped and is made again on the next use
+        self.assertNotIn('sim', self.server.scopes)
+
+    @staticmethod
+    def broken_read(num=-1):
+        raise IOError('connection lost')
+
+    def test_shutdown(self):
+        self.assertTrue(daemon.stop_daemon(self.socket_path))
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+    def test_fallback(self):
+        # no daemon on the socket
+        self.assertIsNone(daemon.forward(['info'], socket_path=os.path.join(self.tmpdir, 'missing.sock')))
+        self.assertFalse(daemon.stop_daemon(os.path.join(self.tmpdir, 'missing.sock')))
+        # a daemon which doesn't answer
+        path = os.path.join(self.tmpdir, 'wedged.sock')
+        wedged = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        wedged.bind(path)
+        wedged.listen(1)
+        try:
+            # the request was sent, so it must not be repeated
+            with self.assertRaises(daemon.DaemonError):
+                daemon.forward(['info'], socket_path=path, timeout=0.2)
+            self.assertFalse(daemon.stop_daemon(path))
+        finally:
+            wedged.close()
+
+if __name__ == '__main__':
+    unittest.main()
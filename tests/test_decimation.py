@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import unittest
+
+try:
+    import numpy as np
+    from ds1054z.decimation import minmax, lttb, Pyramid
+except ImportError:
+    np = None
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class DecimationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.xinc = 1e-6
+        self.samples = np.sin(np.arange(1000003) * 2 * np.pi / 1e5)
+        self.samples[654321] = 3.0 # a glitch
+        self.samples[10:20] = np.nan
+
+    def test_minmax(self):
+        times, values = minmax(self.samples, 1000, self.xinc, xorig=-0.5)
+        self.assertEqual(len(values), 1000)
+        self.assertEqual(values.max(), 3.0)
+        self.assertAlmostEqual(times[values.argmax()], -0.5 + 654321 * self.xinc)
+        self.assertAlmostEqual(values.min(), -1.0, places=6)
+        self.assertTrue((np.diff(times) >= 0).all())
+        self.assertFalse(np.isnan(values).any())
+
+    def test_lttb(self):
+        times, values = lttb(self.samples, 500, self.xinc)
+        self.assertEqual(len(values), 500)
+        self.assertEqual(times[0], 0.0)
+        self.assertAlmostEqual(times[-1], (len(self.samples) - 1) * self.xinc)
+        self.assertEqual(values.max(), 3.0)
+        self.assertTrue((np.diff(times) > 0).all())
+        short = np.arange(10.)
+        self.assertEqual(list(lttb(short, 20)[1]), list(short))
+
+    def test_pyramid(self):
+        pyramid = Pyramid(self.samples, self.xinc)
+        times, values = pyramid.window(0, 2.0, 2000)
+        self.assertTrue(1000 <= len(values) <= 2000)
+        self.assertEqual(np.nanmax(values), 3.0)
+        self.assertAlmostEqual(np.nanmin(values), -1.0, places=6)
+        # zoomed in: only the window, still with the glitch
+        times, values = pyramid.window(0.6, 0.7, 2000)
+        self.assertTrue(len(values) <= 2000)
+        self.assertTrue(0.59 < times[0] and times[-1] < 0.71)
+        self.assertEqual(values.max(), 3.0)
+        # few samples in the window: all of them
+        times, values = pyramid.window(0.654320, 0.654322, 2000)
+        self.assertEqual(list(values), [self.samples[654320], 3.0, self.samples[654322]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import unittest
+
+try:
+    import numpy as np
+    from ds1054z.decoders import decode_uart, decode_i2c, decode_spi, UartDecoder, \
+        FRAMING_ERROR, PARITY_ERROR, I2C_START, I2C_STOP, I2C_ADDRESS, I2C_DATA
+except ImportError:
+    np = None
+
+PREAMBLE = {'xinc': 1e-6, 'xorig': 0.0, 'yinc': 0.04, 'yorig': 0, 'yref': 127}
+
+def codes(levels):
+    return np.where(np.asarray(levels, dtype=bool), 210, 45).astype(np.uint8).tobytes()
+
+def uart(data, spb=10, parity=None, gap=7):
+    bits = [1] * 25
+    for byte in bytearray(data):
+        frame = [0] + [(byte >> i) & 1 for i in range(8)]
+        if parity:
+            frame.append((sum(frame[1:]) + (parity == 'odd')) % 2)
+        bits += frame + [1]
+        bits += [1] * gap
+    return np.repeat(bits, spb)
+
+def i2c(transactions, half=4):
+    scl, sda = [1] * 10, [1] * 10
+    def step(c, d, n=half):
+        scl.extend([c] * n)
+        sda.extend([d] * n)
+    for address, data in transactions:
+        step(1, 0) # start
+        for byte, ack in [(address, 0)] + [(b, 0) for b in data[:-1]] + [(data[-1], 1)]:
+            for bit in [(byte >> i) & 1 for i in range(7, -1, -1)] + [ack]:
+                step(0, bit)
+                step(1, bit)
+        step(0, 0)
+        step(1, 0)
+        step(1, 1, 10) # stop
+    return np.array(scl), np.array(sda)
+
+def spi(words, half=3):
+    sclk, mosi, miso, cs = [0] * 10, [0] * 10, [0] * 10, [1] * 10
+    for transfer in words:
+        for out, back in transfer:
+            for i in range(7, -1, -1):
+                for c in (0, 1):
+                    sclk.extend([c] * half)
+                    mosi.extend([(out >> i) & 1] * half)
+                    miso.extend([(back >> i) & 1] * half)
+                    cs.extend([0] * half)
+        sclk.extend([0] * 10)
+        mosi.extend([0] * 10)
+        miso.extend([0] * 10)
+        cs.extend([1] * 10)
+    return [np.array(line) for line in (sclk, mosi, miso, cs)]
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class DecoderTest(unittest.TestCase):
+
+    def test_uart(self):
+        data = codes(uart(b'Hello, world!', gap=0))
+        frames = decode_uart(data, PREAMBLE, baudrate=1e5)
+        self.assertEqual(frames['data'].astype(np.uint8).tobytes(), b'Hello, world!')
+        self.assertTrue((frames['error'] == 0).all())
+        self.assertAlmostEqual(frames['time'][0], 250e-6)
+        self.assertAlmostEqual(frames['time'][1], 350e-6)
+        # the result doesn't depend on the chunk size
+        for chunk_size in (37, 100, 1001):
+            chunked = decode_uart(data, PREAMBLE, baudrate=1e5, chunk_size=chunk_size)
+            self.assertEqual(chunked.tobytes(), frames.tobytes())
+
+    def test_uart_errors(self):
+        levels = uart(b'ab', parity='even')
+        # frames of 11 bits after 25 idle bits, with 7 idle bits between them
+        levels[340:350] = 1 - levels[340:350] # the parity bit of the first frame
+        levels[530:540] = 0 # the stop bit of the second frame
+        decoder = UartDecoder(PREAMBLE, baudrate=1e5, parity='even', threshold=0.0)
+        frames = decoder.decode(codes(levels), chunk_size=64)
+        self.assertEqual(list(frames['data']), [ord('a'), ord('b')])
+        self.assertEqual(list(frames['error']), [PARITY_ERROR, FRAMING_ERROR])
+
+    def test_i2c(self):
+        scl, sda = i2c([(0xa0, b'\x00\x10'), (0xa1, b'\x42')])
+        frames = decode_i2c(codes(scl), codes(sda), PREAMBLE)
+        self.assertEqual(list(frames['kind']), [I2C_START, I2C_ADDRESS, I2C_DATA, I2C_DATA, I2C_STOP,
+                                                I2C_START, I2C_ADDRESS, I2C_DATA, I2C_STOP])
+        self.assertEqual(list(frames['data'][[1, 2, 3, 6, 7]]), [0xa0, 0x00, 0x10, 0xa1, 0x42])
+        self.assertEqual(list(frames['ack'][[1, 2, 3, 6, 7]]), [True, True, False, True, False])
+        self.assertTrue((np.diff(frames['time']) > 0).all())
+        for chunk_size in (50, 333):
+            chunked = decode_i2c(codes(scl), codes(sda), PREAMBLE, chunk_size=chunk_size)
+            self.assertEqual(chunked.tobytes(), frames.tobytes())
+
+    def test_spi(self):
+        sclk, mosi, miso, cs = spi([[(0x9f, 0x00), (0x00, 0xef)], [(0x05, 0x00), (0xff, 0x02)]])
+        frames = decode_spi(codes(sclk), codes(mosi), PREAMBLE, miso=codes(miso), cs=codes(cs))
+        self.assertEqual(list(frames['mosi']), [0x9f, 0x00, 0x05, 0xff])
+        self.assertEqual(list(frames['miso']), [0x00, 0xef, 0x00, 0x02])
+        self.assertAlmostEqual(frames['time'][0], 13e-6)
+        for chunk_size in (40, 100):
+            chunked = decode_spi(codes(sclk), codes(mosi), PREAMBLE, miso=codes(miso), cs=codes(cs),
+                                 chunk_size=chunk_size)
+            self.assertEqual(chunked.tobytes(), frames.tobytes())
+        # without chip select, 16 bit words
+        frames = decode_spi(codes(sclk), codes(mosi), PREAMBLE, bits=16, chunk_size=77)
+        self.assertEqual(list(frames['mosi']), [0x9f00, 0x05ff])
+
+if __name__ == '__main__':
+    unittest.main()
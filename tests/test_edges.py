@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import unittest
+
+try:
+    import numpy as np
+    from ds1054z.edges import EdgeIndex
+except ImportError:
+    np = None
+
+import ds1054z
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class EdgeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        # a square wave with a period of 100 samples, high for 30 samples
+        codes = np.where(np.arange(10000) % 100 < 30, 200, 50)
+        codes[5050:5052] = 210 # a glitch during a low phase
+        codes[7010] = 120 # noise not reaching the other level
+        self.codes = codes.astype(np.uint8)
+
+    def test_codes(self):
+        index = EdgeIndex(self.codes.tobytes(), threshold=125, hysteresis=20)
+        # the capture starts high: no rising edge at its beginning
+        self.assertEqual(len(index.rising), 100)
+        self.assertEqual(len(index.falling), 101)
+        self.assertAlmostEqual(index.next_edge(100, 'rising'), 199.5)
+        self.assertAlmostEqual(index.next_edge(100), 129.5)
+        self.assertAlmostEqual(index.previous_edge(100, 'falling'), 29.5)
+        self.assertIsNone(index.next_edge(9999))
+        self.assertEqual(index.count(0, 1000, 'rising'), 10)
+        starts, widths = index.pulses(max_width=5)
+        # interpolated between 50 and 210
+        self.assertEqual(list(starts), [5049 + 75 / 160.])
+        self.assertEqual(list(widths), [2 + 10 / 160.])
+        starts, widths = index.pulses(min_width=5)
+        self.assertEqual(len(starts), 99)
+        self.assertTrue((widths == 30).all())
+        starts, widths = index.pulses(polarity='negative', min_width=60)
+        self.assertEqual(len(starts), 98)
+
+    def test_preamble(self):
+        preamble = {'xinc': 1e-6, 'xorig': -5e-3, 'yinc': 0.04, 'yorig': 0, 'yref': 127}
+        index = EdgeIndex(self.codes, preamble, threshold=0.0, hysteresis=1.0)
+        self.assertAlmostEqual(index.threshold, 0.0)
+        self.assertAlmostEqual(index.next_edge(-5e-3, 'falling'), -5e-3 + 29.5e-6)
+        self.assertEqual(len(index.edges_between(-5e-3, -4e-3)), 20)
+
+    def test_simulator(self):
+        sim = SimulatedScope(memory_depth=120000, waveforms={'CHAN1': Waveform('square', 1e3, 1.0, duty=0.25)})
+        scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(sim))
+        data = scope.get_waveform_bytes(1, mode='RAW')
+        index = EdgeIndex(data, scope.waveform_preamble_dict)
+        starts, widths = index.pulses()
+        self.assertTrue(len(widths) > 5)
+        np.testing.assert_allclose(widths, 0.25e-3, rtol=0.01)
+        rising = index.rising
+        np.testing.assert_allclose(np.diff(rising), 1e-3, rtol=0.01)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import unittest
+
+try:
+    import numpy as np
+    from ds1054z.mask import Mask
+except ImportError:
+    np = None
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class MaskTest(unittest.TestCase):
+
+    def setUp(self):
+        self.xinc, self.xorig = 1e-5, -6e-3
+        t = self.xorig + np.arange(1200) * self.xinc
+        self.golden = np.sin(2 * np.pi * 1e3 * t)
+        self.captures = np.tile(self.golden, (20, 1))
+        self.captures[3, 100] += 0.5
+        self.captures[7, 200:210] -= 0.5
+        self.captures[9, 0] = np.nan
+
+    def test_corner_points(self):
+        mask = Mask(upper=[(-6e-3, 0.5), (-5e-3, 0.5)], lower=[(0, -2), (6e-3, -2)])
+        result = mask.test(self.captures[:2], self.xinc, self.xorig)
+        # the sine exceeds 0.5 V for a third of the first millisecond
+        self.assertEqual(list(result.counts), [33, 33])
+        self.assertTrue(result.failed.all())
+        self.assertEqual(Mask().test(self.golden, self.xinc, self.xorig).counts[0], 0)
+
+    def test_golden(self):
+        mask = Mask.from_golden(self.golden, self.xinc, self.xorig, voltage=0.1, time=1e-5)
+        result = mask.test(self.captures, self.xinc, self.xorig)
+        self.assertEqual(list(np.flatnonzero(result.failed)), [3, 7])
+        self.assertEqual(result.counts[3], 1)
+        self.assertEqual(result.counts[7], 10)
+        self.assertEqual(list(result.first[[0, 3, 7]]), [-1, 100, 200])
+        captures, samples = result.violations
+        self.assertEqual(list(captures), [3] + [7] * 10)
+
+    def test_raw_bytes(self):
+        preamble = {'xinc': self.xinc, 'xorig': self.xorig, 'yinc': 0.01, 'yorig': 0, 'yref': 127}
+        codes = np.rint(np.nan_to_num(self.captures) / 0.01 + 127).astype(np.uint8)
+        mask = Mask.from_golden(self.golden, self.xinc, self.xorig, voltage=0.1, time=1e-5)
+        result = mask.test([c.tobytes() for c in codes], preamble=preamble)
+        self.assertEqual(list(np.flatnonzero(result.failed)), [3, 7])
+        self.assertEqual(mask.test(codes[3].tobytes(), preamble=preamble).counts[0], 1)
+        self.assertRaises(ValueError, mask.test, codes, self.xinc, self.xorig)
+
+if __name__ == '__main__':
+    unittest.main()
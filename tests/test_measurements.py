@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import unittest, math
+
+try:
+    import numpy as np
+    from ds1054z.measurements import measure, ITEMS
+except ImportError:
+    np = None
+
+import ds1054z
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class MeasurementsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.xinc = 1e-6
+        t = np.arange(100000) * self.xinc
+        # 1 kHz square wave with 30 % duty cycle and 20 µs linear edges
+        square = np.where((t * 1e3) % 1 < 0.3, 1.0, 0.0)
+        self.square = np.convolve(square, np.ones(20) / 20, mode='same')
+        self.sine = np.sin(2 * np.pi * 1e3 * t)
+
+    def test_square(self):
+        values = measure(self.square, self.xinc)
+        self.assertEqual(set(values), set(ITEMS))
+        self.assertAlmostEqual(values['vtop'], 1.0)
+        self.assertAlmostEqual(values['vbase'], 0.0)
+        self.assertAlmostEqual(values['frequency'], 1e3, delta=0.1)
+        self.assertAlmostEqual(values['pduty'], 30.0, delta=0.1)
+        self.assertAlmostEqual(values['rtime'], 16e-6, delta=0.1e-6)
+        self.assertAlmostEqual(values['ftime'], 16e-6, delta=0.1e-6)
+        self.assertAlmostEqual(values['pslewrate'], 0.8 / 16e-6, delta=1e3)
+        self.assertIsNone(values['rdelay'])
+
+    def test_sine(self):
+        values = measure(self.sine, self.xinc, items=['vpp', 'vrms', 'pvrms', 'period', 'overshoot'])
+        self.assertAlmostEqual(values['vpp'], 2.0, places=6)
+        self.assertAlmostEqual(values['vrms'], 1 / math.sqrt(2))
+        self.assertAlmostEqual(values['pvrms'], 1 / math.sqrt(2), places=3)
+        self.assertAlmostEqual(values['period'], 1e-3)
+        self.assertAlmostEqual(values['overshoot'], 0.0, delta=0.1)
+
+    def test_reference(self):
+        values = measure(self.square, self.xinc, items=['rdelay', 'rphase'], reference=np.roll(self.square, 50))
+        self.assertAlmostEqual(values['rdelay'], 50e-6)
+        self.assertAlmostEqual(values['rphase'], 18.0, places=3)
+
+    def test_batch(self):
+        batch = np.stack([self.square, self.sine, np.zeros_like(self.sine), self.sine])
+        batch[3, :30000] = np.nan
+        values = measure(batch, self.xinc, items=['vpp', 'frequency', 'vtop'])
+        self.assertEqual(values['frequency'].shape, (4,))
+        np.testing.assert_allclose(values['frequency'][[0, 1, 3]], 1e3, rtol=1e-4)
+        self.assertTrue(np.isnan(values['frequency'][2]))
+        self.assertEqual(values['vpp'][2], 0.0)
+        single = measure(self.square, self.xinc, items=['vtop'])
+        self.assertAlmostEqual(values['vtop'][0], single['vtop'])
+
+    def test_against_scope(self):
+        sim = SimulatedScope(waveforms={'CHAN1': Waveform('sine', 2e3, 1.5)})
+        scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(sim))
+        samples = scope.get_waveform_samples(1, mode='RAW')
+        values = measure(samples, scope.waveform_preamble_dict['xinc'], items=['frequency', 'vpp', 'vrms'])
+        for item in values:
+            self.assertAlmostEqual(values[item], scope.get_channel_measurement(1, item), delta=abs(values[item]) * 0.02)
+
+    def test_percent_items(self):
+        sim = SimulatedScope(waveforms={'CHAN1': Waveform('square', 1e3, 1.0, duty=0.3)})
+        scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(sim))
+        samples = scope.get_waveform_samples(1, mode='RAW')
+        items = ['pduty', 'nduty', 'overshoot', 'preshoot']
+        values = measure(samples, scope.waveform_preamble_dict['xinc'], items=items)
+        expected = scope.get_measurements([1], items)['CHAN1']
+        self.assertEqual(expected['pduty'], 30.0)
+        for item in items:
+            self.assertAlmostEqual(values[item], expected[item], delta=0.5)
+
+    def test_empty(self):
+        self.assertRaises(ValueError, measure, [], self.xinc)
+        self.assertRaises(ValueError, measure, np.zeros((3, 0)), self.xinc)
+
+if __name__ == '__main__':
+    unittest.main()
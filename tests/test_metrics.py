@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import unittest
+
+from ds1054z.metrics import Metrics, command_header, transfer_type
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics(labels={'host': 'scope'})
+
+    def test_classification(self):
+        self.assertEqual(command_header(b':WAVeform:STARt 1\n'), ':WAVeform:STARt')
+        self.assertEqual(transfer_type(':WAVeform:STARt'), 'write')
+        self.assertEqual(transfer_type(':WAVeform:DATA?'), 'waveform_chunk')
+        self.assertEqual(transfer_type(':WAV:DATA?'), 'waveform_chunk')
+        self.assertEqual(transfer_type(':DISPlay:DATA?'), 'screenshot')
+        self.assertEqual(transfer_type('*IDN?'), 'query')
+
+    def test_snapshot(self):
+        self.metrics.record(b':WAVeform:DATA?', 0.5, 15, 250011)
+        self.metrics.record(b':WAVeform:DATA?', 1.5, 15, 250011)
+        self.metrics.record(b':RUN', 0.002, 4, 0)
+        snap = self.metrics.snapshot()
+        cmd = snap['commands'][':WAVeform:DATA?']
+        self.assertEqual(cmd['count'], 2)
+        self.assertEqual(cmd['bytes_in'], 500022)
+        self.assertEqual(cmd['latency']['max'], 1.5)
+        self.assertEqual(cmd['latency']['buckets']['0.5'], 1)
+        self.assertEqual(cmd['latency']['buckets']['inf'], 2)
+        chunks = snap['transfers']['waveform_chunk']
+        self.assertEqual(chunks['count'], 2)
+        self.assertAlmostEqual(chunks['throughput'], (2 * 250026) / 2.0)
+        self.assertEqual(snap['transfers']['write']['count'], 1)
+        self.assertIsNone(snap['transfers']['screenshot']['throughput'])
+
+    def test_prometheus(self):
+        self.metrics.record(b'*IDN?', 0.003, 5, 50)
+        text = self.metrics.prometheus()
+        self.assertIn('ds1054z_scpi_commands_total{command="*IDN?",host="scope"} 1', text)
+        self.assertIn('ds1054z_scpi_latency_seconds_bucket{command="*IDN?",host="scope",le="0.005"} 1', text)
+        self.assertIn('ds1054z_scpi_latency_seconds_bucket{command="*IDN?",host="scope",le="+Inf"} 1', text)
+        self.assertIn('ds1054z_transfer_bytes_total{host="scope",type="query"} 55', text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import unittest
+import threading
+import time
+
+import ds1054z
+from ds1054z.publish import PublishServer, Subscriber, subscribe, decimate_record
+from ds1054z.stream import Record
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform
+
+def record(sequence, channel='CHAN1'):
+    return Record(sequence, 0.0, channel, (0, 0, 1200, 1, 1e-5, -6e-3, 0, 0.04, 0, 127), bytes(bytearray(range(200))) * 6)
+
+class SubscriberTest(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        subscriber = Subscriber(queue_size=2)
+        for i in range(5):
+            subscriber.offer([record(i)])
+        self.assertEqual(subscriber.dropped, 3)
+        self.assertEqual([subscriber.get()[0].sequence for i in range(2)], [3, 4])
+        subscriber.close()
+        self.assertIsNone(subscriber.get())
+
+    def test_options(self):
+        subscriber = Subscriber(channels=[2], decimate=10, every=2)
+        for i in range(4):
+            subscriber.offer([record(i), record(i, 'CHAN2')])
+        records = subscriber.get()
+        self.assertEqual([(r.sequence, r.channel) for r in records], [(0, 'CHAN2')])
+        self.assertEqual(len(records[0].samples), 120)
+        self.assertEqual(records[0].preamble[2], 120)
+        self.assertAlmostEqual(records[0].preamble[4], 1e-4)
+        self.assertEqual(subscriber.get()[0].sequence, 2)
+        self.assertEqual(decimate_record(record(0), 7).samples, record(0).samples[::7])
+
+class PublishServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = SimulatedScope(memory_depth=120000, latency=0.001,
+            waveforms={'CHAN1': Waveform('sine', 1e3, 1.0), 'CHAN2': Waveform('square', 2e3, 0.5, offset=0.5)})
+        scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(self.sim))
+        self.server = PublishServer(scope, [1, 2], address=('127.0.0.1', 0), queue_size=2)
+        self.server.start()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def test_subscribers(self):
+        fast = subscribe(port=self.port, channels=['CHAN2'], decimate=4, timeout=10)
+        slow = subscribe(port=self.port, timeout=10)
+        first = next(slow)
+        self.assertEqual((first.channel, len(first.samples)), ('CHAN1', 1200))
+        records = [next(fast) for i in range(20)]
+        self.assertEqual(set(r.channel for r in records), set(['CHAN2']))
+        self.assertEqual(len(records[0].samples), 300)
+        # the fast subscriber got every acquisition while the slow one didn't read
+        self.assertEqual([r.sequence for r in records], list(range(records[0].sequence, records[0].sequence + 20)))
+        self.assertEqual(next(slow).channel, 'CHAN2')
+        self.assertTrue(self.server.acquisitions >= 20)
+        fast.close()
+        slow.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import unittest, os, shutil, tempfile
+
+import ds1054z
+from ds1054z.recording import replay, read_session, ReplayError
+from ds1054z.simulator import SimulatedScope, SimulatorTransport
+
+class RecordingTest(unittest.TestCase):
+    """ Records sessions with the simulator and plays them back """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'session.ds1054z.gz')
+        sim = SimulatedScope(memory_depth=600000)
+        self.scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(sim))
+        with self.scope.record(self.filename):
+            self.raw = self.scope.get_waveform_bytes(1, mode='RAW')
+            self.samples = self.scope.get_waveform_samples(2)
+            self.vpp = self.scope.get_channel_measurement(1, 'vpp')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_session_file(self):
+        meta, records = read_session(self.filename)
+        self.assertEqual(meta['host'], 'simulator')
+        self.assertTrue(meta['idn'].startswith('RIGOL TECHNOLOGIES,DS1104Z'))
+        self.assertEqual(records[0].kind, b'W')
+        self.assertEqual(records[-1].kind, b'R')
+        self.assertTrue(all(r.duration >= 0 for r in records))
+
+    def test_replay_identical(self):
+        scope = replay(self.filename)
+        self.assertEqual(scope.product, 'DS1104Z')
+        self.assertEqual(scope.get_waveform_bytes(1, mode='RAW'), self.raw)
+        self.assertEqual(scope.get_waveform_samples(2), self.samples)
+        self.assertEqual(scope.get_channel_measurement(1, 'vpp'), self.vpp)
+        self.assertRaises(ReplayError, scope.query, ':TRIGger:STATus?')
+
+    def test_replay_strict(self):
+        scope = replay(self.filename)
+        self.assertRaises(ReplayError, scope.get_channel_measurement, 1, 'vpp')
+
+    def test_replay_by_command(self):
+        scope = replay(self.filename, strict=False)
+        self.assertEqual(scope.get_channel_measurement(1, 'vpp'), self.vpp)
+        self.assertEqual(scope.get_waveform_bytes(1, mode='RAW'), self.raw)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import unittest
+import threading
+
+import ds1054z
+from ds1054z.shared import SharedScope, URGENT, BULK
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform
+
+class SharedScopeTest(unittest.TestCase):
+
+    def setUp(self):
+        # every chunk of the internal memory takes 50 ms
+        self.sim = SimulatedScope(memory_depth=1200000, latencies={'WAV:DATA?': 0.05},
+            waveforms={'CHAN1': Waveform('sine', 1e3, 1.0), 'CHAN2': Waveform('square', 2e3, 0.5, offset=0.5)})
+        self.scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(self.sim))
+        self.shared = SharedScope(self.scope)
+
+    def tearDown(self):
+        self.shared.close()
+
+    def test_proxy(self):
+        self.assertEqual(self.shared.product, 'DS1104Z')
+        self.assertTrue(self.shared.running)
+        self.assertAlmostEqual(self.shared.get_channel_measurement(1, 'vpp'), 2.0)
+        self.shared.set('timebase_scale', 2e-3)
+        self.assertEqual(self.shared.call(lambda scope, ch: scope.get_channel_scale(ch), 2), 1.0)
+        self.assertEqual(self.shared.timebase_scale, 2e-3)
+        # exceptions are raised in the calling thread
+        self.assertRaises(ValueError, self.shared.call, lambda scope: scope.decode_ieee_block(b'#xyz'))
+
+    def test_concurrent_reads(self):
+        expected = dict((ch, self.scope.get_waveform_bytes(ch, mode='RAW')) for ch in (1, 2))
+        results = {}
+        def read(ch):
+            results[ch] = self.shared.get_waveform_bytes(ch, mode='RAW')
+        threads = [threading.Thread(target=read, args=(ch,)) for ch in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, expected)
+
+    def test_preemption(self):
+        expected = self.scope.get_waveform_bytes(2, mode='RAW')
+        bulk = self.shared.submit('get_waveform_bytes', 2, mode='RAW')
+        # a screen read in between changes the waveform settings of the scope
+        screen = self.shared.get_waveform_samples(1, priority=URGENT)
+        self.assertFalse(bulk.done())
+        self.assertEqual(len(screen), 1200)
+        self.assertAlmostEqual(self.shared.get_channel_measurement(1, 'vpp', priority=URGENT), 2.0)
+        self.assertFalse(bulk.done())
+        self.assertEqual(bulk.result(), expected)
+        # requests of the same priority wait for the bulk transfer
+        first = self.shared.submit('get_waveform_bytes', 1, mode='RAW')
+        second = self.shared.submit('get_channel_measurement', 1, 'vpp', priority=BULK)
+        self.assertAlmostEqual(second.result(), 2.0)
+        self.assertTrue(first.done())
+
+    def test_preemption_changing_the_acquisition(self):
+        for urgent in (['run', 'stop'], ['run']):
+            self.scope.stop()
+            started = threading.Event()
+            bulk = self.shared.submit('get_waveform_bytes', 1, mode='RAW', progress=lambda p: started.set())
+            self.assertTrue(started.wait(5))
+            self.shared.run(priority=URGENT)
+            if 'stop' in urgent:
+                self.shared.set('timebase_scale', 2e-3, priority=URGENT)
+                self.shared.stop(priority=URGENT)
+            with self.assertRaises(ds1054z.TransferError) as cm:
+                bulk.result()
+            # the bytes read before can't be combined with the new acquisition
+            checkpoint = cm.exception.checkpoint
+            self.assertTrue(0 < len(checkpoint.data) < 1200000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+import unittest, math
+from collections import OrderedDict
+
+import ds1054z
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, SimulatorServer, Waveform, short_form
+from ds1054z.transport import SocketTransport
+
+class FlakyTransport(SimulatorTransport):
+    """ Cuts the answers to some of the :WAVeform:DATA? queries short (or drops them) """
+
+    def __init__(self, scope, failures):
+        super(FlakyTransport, self).__init__(scope)
+        self.failures = failures
+        self.data_queries = 0
+        self.data_query = False
+
+    def write_raw(self, data):
+        self.data_query = short_form(data.decode('ascii').strip()) == 'WAV:DATA?'
+        super(FlakyTransport, self).write_raw(data)
+
+    def read_raw(self, num=-1):
+        answer = super(FlakyTransport, self).read_raw(num)
+        if self.data_query:
+            self.data_queries += 1
+            failure = self.failures.get(self.data_queries)
+            if failure == 'timeout':
+                raise IOError('timed out')
+            if failure == 'short':
+                return answer[:len(answer) // 2]
+        return answer
+
+class SimulatedScopeTest(unittest.TestCase):
+    """ Runs the DS1054Z class against the simulator in the same process """
+
+    def setUp(self):
+        self.sim = SimulatedScope(memory_depth=600000,
+            waveforms={'CHAN1': Waveform('sine', 1e3, 1.0), 'CHAN2': Waveform('square', 2e3, 0.5, offset=0.5)})
+        self.scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(self.sim))
+
+    def test_short_form(self):
+        self.assertEqual(short_form(':WAVeform:STARt?'), 'WAV:STAR?')
+        self.assertEqual(short_form(':CHANnel2:DISPlay'), 'CHAN2:DISP')
+        self.assertEqual(short_form(':ACQuire:MDEPth'), 'ACQ:MDEP')
+        self.assertEqual(short_form(':MEASure:STATistic:item?'), 'MEAS:STAT:ITEM?')
+
+    def test_idn(self):
+        self.assertEqual(self.scope.product, 'DS1104Z')
+        self.assertEqual(self.scope.displayed_channels, ['CHAN1', 'CHAN2'])
+
+    def test_verify_identity(self):
+        other = SimulatedScope(idn='ACME,SCOPE 9000,0,1.0')
+        with self.assertRaises(NameError):
+            ds1054z.DS1054Z('acme', transport=SimulatorTransport(other))
+        scope = ds1054z.DS1054Z('acme', transport=SimulatorTransport(other), verify_identity=False)
+        self.assertEqual(scope.product, 'SCOPE 9000')
+        scope = ds1054z.DS1054Z('acme', transport=SimulatorTransport(other), verify_identity='lazy')
+        with self.assertRaises(NameError):
+            scope.product
+
+    def test_identity_cache(self):
+        # the identity of 'simulator' was cached in setUp()
+        with self.scope.trace() as recorder:
+            scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(self.sim))
+        self.assertEqual(recorder.transactions, [])
+        self.assertEqual(scope.product, 'DS1104Z')
+        # but not for a different kind of connection to the same host
+        other = SimulatedScope(idn='RIGOL TECHNOLOGIES,DS1054Z,DS1ZA000000002,00.04.04.SP3')
+        scope = ds1054z.DS1054Z('simulator', transport=FlakyTransport(other, {}))
+        self.assertEqual(scope.product, 'DS1054Z')
+
+    def test_closest_value(self):
+        steps = (1, 2, 5, 10)
+        self.assertEqual(ds1054z._closest_value(steps, 0), 1)
+        self.assertEqual(ds1054z._closest_value(steps, 2), 2)
+        self.assertEqual(ds1054z._closest_value(steps, 2.4), 2)
+        self.assertEqual(ds1054z._closest_value(steps, 3.5), 2)
+        self.assertEqual(ds1054z._closest_value(steps, 3.6), 5)
+        self.assertEqual(ds1054z._closest_value(steps, 100), 10)
+        self.scope.timebase_scale = 3.1e-6
+        self.assertEqual(self.scope.timebase_scale, 2e-6)
+        self.scope.memory_depth = 100000
+        self.assertEqual(self.scope.memory_depth, 120000)
+
+    def test_screen_samples(self):
+        samples = self.scope.get_waveform_samples(1)
+        self.assertEqual(len(samples), 1200)
+        self.assertAlmostEqual(max(samples), 1.0, delta=0.05)
+        self.assertAlmostEqual(min(samples), -1.0, delta=0.05)
+
+    def test_raw_bytes_chunked(self):
+        data = self.scope.get_waveform_bytes(2, mode='RAW')
+        self.assertEqual(len(data), 600000)
+        self.assertFalse(self.scope.running)
+        samples = self.scope.get_waveform_samples(2, mode='RAW')
+        self.assertAlmostEqual(max(samples), 1.0, delta=0.05)
+        self.assertAlmostEqual(min(samples), 0.0, delta=0.05)
+        self.assertEqual(len(self.scope.waveform_time_values), 600000)
+
+    def test_raw_bytes_retry(self):
+        expected = self.scope.get_waveform_bytes(2, mode='RAW')
+        transport = FlakyTransport(self.sim, {2: 'short', 3: 'timeout', 5: 'short'})
+        scope = ds1054z.DS1054Z('simulator', transport=transport)
+        scope.chunk_retry_backoff = 0
+        self.assertEqual(scope.get_waveform_bytes(2, mode='RAW'), expected)
+        # three chunks, each failed window requested again
+        self.assertEqual(transport.data_queries, 6)
+
+    def test_raw_bytes_resume(self):
+        expected = self.scope.get_waveform_bytes(1, mode='RAW')
+        transport = FlakyTransport(self.sim, dict((i, 'timeout') for i in range(2, 10)))
+        scope = ds1054z.DS1054Z('simulator', transport=transport)
+        scope.chunk_retries, scope.chunk_retry_backoff = 2, 0
+        with self.assertRaises(ds1054z.TransferError) as cm:
+            scope.get_waveform_bytes(1, mode='RAW')
+        checkpoint = cm.exception.checkpoint
+        self.assertEqual(len(checkpoint.data), 250000)
+        self.assertFalse(checkpoint.complete)
+        # a new connection continues the transfer
+        scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(self.sim))
+        with scope.trace() as recorder:
+            data = scope.get_waveform_bytes(1, mode='RAW', checkpoint=checkpoint)
+        self.assertEqual(data, expected)
+        self.assertTrue(checkpoint.complete)
+        commands = [ev.command for ev in recorder.transactions]
+        # the first bytes are compared, then the transfer continues after the ones received
+        self.assertIn(':WAVeform:STOP 1000', commands)
+        self.assertIn(':WAVeform:STARt 250001', commands)
+        self.assertNotIn(':WAVeform:STOP 250000', commands)
+        # not after a new acquisition
+        checkpoint.data = checkpoint.data[:250000]
+        scope.run()
+        self.assertRaises(ds1054z.TransferError, scope.get_waveform_bytes, 1, mode='RAW', checkpoint=checkpoint)
+        self.assertRaises(ValueError, scope.get_waveform_bytes, 2, mode='RAW', checkpoint=checkpoint)
+
+    def test_progress_and_cancel(self):
+        progress = []
+        token = ds1054z.CancellationToken()
+        def cancel_after_chunk(p):
+            progress.append(p)
+            token.cancel()
+        with self.assertRaises(ds1054z.TransferCancelled) as cm:
+            self.scope.get_waveform_bytes(1, mode='RAW', progress=cancel_after_chunk, cancel=token)
+        self.assertEqual([(p.done, p.total) for p in progress], [(250000, 600000)])
+        self.assertIsNotNone(progress[0].eta)
+        data = self.scope.get_waveform_bytes(1, mode='RAW', checkpoint=cm.exception.checkpoint, progress=progress.append)
+        self.assertEqual(len(data), 600000)
+        self.assertEqual([p.done for p in progress], [250000, 500000, 600000])
+        self.assertEqual(progress[-1].eta, 0)
+        progress = []
+        self.assertTrue(self.scope.get_display_data(progress=progress.append).startswith(b'\x89PNG'))
+        self.assertEqual(progress[-1].done, progress[-1].total)
+
+    def test_transfer_timeout(self):
+        self.assertIsNone(self.scope.throughput)
+        self.assertAlmostEqual(self.scope.transfer_timeout(100e3, base=10), 13.0)
+        self.scope.get_waveform_bytes(1, mode='RAW')
+        throughput = self.scope.throughput
+        self.assertTrue(throughput > 0)
+        self.assertAlmostEqual(self.scope.transfer_timeout(1e6, base=10), 10 + 3 * 1e6 / throughput)
+
+    def test_memory_depth(self):
+        self.scope.memory_depth = 120000
+        self.assertEqual(self.scope.memory_depth, 120000)
+        self.scope.stop()
+        self.assertEqual(self.scope.memory_depth_internal_total, 120000)
+        self.assertEqual(len(self.scope.get_waveform_bytes(1, mode='RAW')), 120000)
+
+    def test_memory_depth_model(self):
+        self.assertEqual(self.scope.max_memory_depth(1), 24000000)
+        self.assertEqual(self.scope.max_memory_depth(4), 6000000)
+        with self.scope.trace() as recorder:
+            self.assertEqual(self.scope.memory_depth_internal_total, 600000)
+            self.assertEqual(len(self.scope.waveform_time_values), 1200)
+        commands = [ev.command for ev in recorder.transactions]
+        self.assertNotIn(':STOP', commands)
+        self.assertNotIn(':WAVeform:MODE RAW', commands)
+        self.assertTrue(self.scope.running)
+        self.scope.get_waveform_bytes(1, mode='RAW')
+        self.assertEqual(self.scope.captured_memory_depth, 600000)
+        self.assertEqual(self.scope.memory_depth_internal_total, 600000)
+        # the depths following from the sample rate are snapped to the allowed ones
+        self.sim.auto_memory_depth = 500000
+        self.assertEqual(self.scope.memory_depth_model(), 600000)
+        self.sim.auto_memory_depth = 50000000
+        self.assertEqual(self.scope.memory_depth_model(), 12000000)
+        self.scope.write(':CHANnel2:DISPlay OFF')
+        self.assertEqual(self.scope.memory_depth_model(), 24000000)
+        self.sim.auto_memory_depth = 500000
+        self.assertEqual(self.scope.memory_depth_model(), 120000)
+
+    def test_measurements(self):
+        self.assertAlmostEqual(self.scope.get_channel_measurement(1, 'vpp'), 2.0)
+        self.assertAlmostEqual(self.scope.get_channel_measurement(2, 'frequency'), 2e3)
+        self.assertIsNone(self.scope.get_channel_measurement(3, 'vpp'))
+        self.assertAlmostEqual(self.scope.get_channel_measurement(1, 'vrms'), 1 / math.sqrt(2))
+
+    def test_bulk_measurements(self):
+        items = ['vpp', 'frequency', 'vmax', 'vmin']
+        with self.scope.trace() as recorder:
+            values = self.scope.get_measurements([1, 2, 3], items)
+        self.assertEqual(len([ev for ev in recorder.transactions if ev.direction == 'read']), 2)
+        self.assertEqual(list(values), ['CHAN1', 'CHAN2', 'CHAN3'])
+        self.assertAlmostEqual(values['CHAN2']['frequency'], 2e3)
+        self.assertIsNone(values['CHAN3']['vpp'])
+        for item in items:
+            self.assertEqual(values['CHAN1'][item], self.scope.get_channel_measurement(1, item))
+        values = self.scope.get_measurements(['CHAN1'], ['vpp'], types=['CURRent', 'MAXimum'])
+        self.assertAlmostEqual(values['CHAN1']['vpp']['MAXimum'], 2.0)
+
+    def test_setup(self):
+        setup = self.scope.save_setup()
+        self.scope.timebase_scale = 2e-3
+        self.scope.set_channel_scale(2, 0.5)
+        self.scope.restore_setup(setup)
+        self.assertEqual(self.scope.timebase_scale, 1e-3)
+        self.assertEqual(self.scope.get_channel_scale(2), 1.0)
+        self.assertEqual(self.scope.save_setup(), setup)
+
+    def test_configure(self):
+        settings = OrderedDict([(':TIMebase:MAIN:SCALe', 1e-3), (':CHANnel1:SCALe', 0.5),
+                                (':CHANnel2:DISPlay', False), (':CHANnel1:PROBe', 1), (':CHANnel3:DISPlay', False)])
+        with self.scope.trace() as recorder:
+            changed = self.scope.configure(settings)
+        self.assertEqual(list(changed), [':CHANnel1:SCALe', ':CHANnel2:DISPlay'])
+        # one compound query and one compound command
+        self.assertEqual([(ev.direction, ev.command) for ev in recorder.transactions if ev.direction == 'write'][-1],
+                         ('write', ':CHANnel1:SCALe 0.5;:CHANnel2:DISPlay 0'))
+        self.assertEqual(len([ev for ev in recorder.transactions if ev.direction == 'write']), 2)
+        self.assertEqual(self.scope.get_channel_scale(1), 0.5)
+        self.assertEqual(self.scope.displayed_channels, ['CHAN1'])
+        self.assertEqual(self.scope.configure(settings), OrderedDict())
+        # headers without the leading colon are sent as absolute ones
+        settings = OrderedDict([('CHANnel1:SCALe', 0.2), ('CHANnel2:DISPlay', True)])
+        with self.scope.trace() as recorder:
+            self.assertEqual(self.scope.configure(settings), settings)
+        self.assertEqual([ev.command for ev in recorder.transactions if ev.direction == 'write'],
+                         [':CHANnel1:SCALe?;:CHANnel2:DISPlay?', ':CHANnel1:SCALe 0.2;:CHANnel2:DISPlay 1'])
+
+    def test_screenshot(self):
+        self.assertTrue(self.scope.display_data.startswith(b'\x89PNG'))
+
+class SimulatorServerTest(unittest.TestCase):
+    """ Talks to the simulator over the network """
+
+    def setUp(self):
+        self.server = SimulatorServer(SimulatedScope(memory_depth=300000), raw_port=0).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_vxi11(self):
+        scope = ds1054z.DS1054Z('127.0.0.1', vxi11_port=self.server.ports['vxi11'])
+        self.assertEqual(scope.vendor, 'RIGOL TECHNOLOGIES')
+        self.assertEqual(len(scope.get_waveform_bytes(1, mode='RAW')), 300000)
+        scope.close()
+
+    def test_display_data_pieces(self):
+        scope = ds1054z.DS1054Z('127.0.0.1', vxi11_port=self.server.ports['vxi11'])
+        scope.DISPLAY_DATA_PIECE = 256
+        scope.enable_metrics()
+        progress = []
+        image = scope.get_display_data(progress=progress.append)
+        self.assertTrue(image.startswith(b'\x89PNG'))
+        total = progress[0].total
+        self.assertEqual([p.done for p in progress], list(range(256, total, 256)) + [total])
+        # all pieces are attributed to the query
+        commands = scope.metrics.snapshot()['commands']
+        self.assertEqual(list(commands), [':DISPlay:DATA?'])
+        self.assertEqual(commands[':DISPlay:DATA?']['bytes_in'], total)
+        self.assertEqual(commands[':DISPlay:DATA?']['bytes_out'], len(':DISPlay:DATA? ON,OFF,PNG'))
+        # the throughput is measured from the bytes received (too few here)
+        self.assertLess(total, 10000)
+        self.assertIsNone(scope.throughput)
+        scope.close()
+
+    def test_raw_tcp(self):
+        transport = SocketTransport('127.0.0.1', self.server.ports['raw'])
+        scope = ds1054z.DS1054Z('127.0.0.1', transport=transport)
+        self.assertEqual(scope.serial, 'DS1ZA000000001')
+        self.assertEqual(len(scope.get_waveform_bytes(1, mode='RAW')), 300000)
+        scope.close()
+
+if __name__ == '__main__':
+    unittest.main()
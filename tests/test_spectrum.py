@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import unittest
+
+try:
+    import numpy as np
+    from ds1054z.spectrum import welch, Welch
+except ImportError:
+    np = None
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class SpectrumTest(unittest.TestCase):
+
+    def setUp(self):
+        self.xinc = 1e-6
+        t = np.arange(1000000) * self.xinc
+        noise = np.random.default_rng(0).normal(0, 0.01, len(t))
+        self.samples = (np.sin(2 * np.pi * 1e3 * t) + 0.1 * np.sin(2 * np.pi * 3e3 * t)
+                        + 0.05 * np.sin(2 * np.pi * 5e3 * t) + noise)
+
+    def test_welch(self):
+        spectrum = welch(self.samples, self.xinc, nperseg=8192)
+        self.assertAlmostEqual(spectrum.resolution, 1e6 / 8192)
+        # Parseval: the PSD integrates to the mean square
+        self.assertAlmostEqual(spectrum.psd.sum() * spectrum.resolution, np.mean(self.samples ** 2), places=4)
+        peaks = spectrum.peaks(3)
+        self.assertEqual([round(f, -1) for f, _ in peaks], [1000, 3000, 5000])
+        self.assertAlmostEqual(peaks[0][1], 0.5, places=3)
+        self.assertAlmostEqual(spectrum.power(3e3), 0.005, places=4)
+        self.assertAlmostEqual(spectrum.thd(), np.sqrt(0.1 ** 2 + 0.05 ** 2), places=4)
+        # signal power 0.5 V², noise power 1e-4 V²
+        self.assertAlmostEqual(spectrum.snr(), 37.0, delta=0.5)
+
+    def test_chunks(self):
+        whole = welch(self.samples, self.xinc, nperseg=4096)
+        acc = Welch(self.xinc, nperseg=4096, workers=2, block_segments=16)
+        for chunk in np.array_split(self.samples, 33):
+            acc.add(chunk)
+        chunked = acc.spectrum()
+        self.assertEqual(chunked.segments, whole.segments)
+        np.testing.assert_allclose(chunked.psd, whole.psd)
+
+    def test_nan_segments(self):
+        samples = self.samples.copy()
+        samples[:5000] = np.nan
+        acc = Welch(self.xinc, nperseg=4096).add(samples)
+        self.assertEqual(acc.skipped, 3)
+        self.assertAlmostEqual(acc.spectrum().peaks(1)[0][1], 0.5, places=3)
+
+if __name__ == '__main__':
+    unittest.main()
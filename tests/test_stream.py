@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import unittest
+import io
+
+import ds1054z
+from ds1054z.stream import Record, StreamWriter, iter_records, read_records, RECORD_HEADER
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform
+
+class SlowStream(io.BytesIO):
+    """ A consumer which takes its time """
+
+    def __init__(self, delay):
+        super(SlowStream, self).__init__()
+        self.delay = delay
+
+    def write(self, data):
+        import time
+        time.sleep(self.delay)
+        return super(SlowStream, self).write(data)
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = SimulatedScope(memory_depth=120000,
+            waveforms={'CHAN1': Waveform('sine', 1e3, 1.0), 'CHAN2': Waveform('square', 2e3, 0.5, offset=0.5)})
+        self.scope = ds1054z.DS1054Z('simulator', transport=SimulatorTransport(self.sim))
+
+    def test_records(self):
+        stream = io.BytesIO()
+        with StreamWriter(stream) as writer:
+            for records in iter_records(self.scope, [1, 2], count=3):
+                writer.put(records)
+        self.assertEqual(writer.stats.acquisitions, 3)
+        self.assertEqual(writer.stats.bytes, 6 * (RECORD_HEADER.size + 1200))
+        stream.seek(0)
+        records = list(read_records(stream))
+        self.assertEqual([(r.sequence, r.channel) for r in records],
+                         [(i, ch) for i in range(3) for ch in ('CHAN1', 'CHAN2')])
+        self.assertEqual(records[1].samples, self.scope.get_waveform_bytes(2))
+        self.assertEqual(tuple(records[1].preamble), self.scope.waveform_preamble)
+
+    def test_scrolled_records(self):
+        full = next(iter_records(self.scope, [1], count=1))[0]
+        self.scope.stop()
+        for offset, shift in ((1e-3, 100), (-1e-3, -100)):
+            self.scope.write(':TIMebase:MAIN:OFFSet {0}'.format(offset))
+            record = next(iter_records(self.scope, [1], count=1))[0]
+            # only the samples of the waveform, no padding
+            self.assertEqual(record.preamble[2], 1100)
+            self.assertEqual(len(record.samples), 1100)
+            xinc, xorig = full.preamble[4], full.preamble[5]
+            if shift > 0:
+                # the waveform moved to the left, its end is missing
+                self.assertEqual(record.samples, full.samples[shift:])
+                self.assertAlmostEqual(record.preamble[5], xorig + offset)
+            else:
+                # the waveform moved to the right, its start is missing
+                self.assertEqual(record.samples, full.samples[:shift])
+                self.assertAlmostEqual(record.preamble[5], xorig + offset - shift * xinc)
+            stream = io.BytesIO(record.pack())
+            self.assertEqual(next(read_records(stream)), record)
+
+    def test_raw_records(self):
+        records, = iter_records(self.scope, ['CHAN1'], mode='RAW', count=1)
+        self.assertEqual(len(records[0].samples), 120000)
+        self.assertEqual(records[0].preamble[2], 120000)
+        self.assertFalse(self.scope.running)
+
+    def test_ndjson(self):
+        import json
+        stream = io.BytesIO()
+        with StreamWriter(stream, fmt='ndjson') as writer:
+            writer.put([Record(7, 1.5, 'CHAN3', (0, 0, 3, 1, 1e-3, 0.0, 0, 0.04, 0, 127), b'\x00\x7f\xff')])
+        obj = json.loads(stream.getvalue().decode('utf-8'))
+        self.assertEqual(obj['samples'], [0, 127, 255])
+        self.assertEqual(obj['preamble']['yref'], 127)
+        self.assertEqual((obj['sequence'], obj['channel']), (7, 'CHAN3'))
+
+    def test_drop_oldest(self):
+        stream = SlowStream(0.05)
+        record = Record(0, 0.0, 'CHAN1', (0,) * 10, b'\x80' * 10)
+        with StreamWriter(stream, buffer=2, drop=True) as writer:
+            for i in range(20):
+                writer.put([record._replace(sequence=i)])
+        stats = writer.stats
+        self.assertTrue(stats.dropped > 0)
+        self.assertEqual(stats.acquisitions + stats.dropped, 20)
+        stream.seek(0)
+        sequences = [r.sequence for r in read_records(stream)]
+        # the newest acquisitions are kept
+        self.assertEqual(sequences[-1], 19)
+        self.assertEqual(sequences, sorted(sequences))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+import ds1054z
+from ds1054z.simulator import SimulatedScope, SimulatorTransport, Waveform
+from ds1054z.tracing import TraceRecorder, Transaction, Operation
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = SimulatedScope(memory_depth=600000, waveforms={'CHAN1': Waveform('sine', 1e3, 1.0)})
+        self.scope = ds1054z.DS1054Z('tracing', transport=SimulatorTransport(self.sim))
+
+    def test_add_remove_tracer(self):
+        events = []
+        self.scope.add_tracer(events.append)
+        self.scope.query('*IDN?')
+        self.scope.remove_tracer(events.append)
+        self.scope.query('*IDN?')
+        self.assertEqual([(ev.command, ev.direction) for ev in events],
+                         [('*IDN?', 'write'), ('*IDN?', 'read')])
+        self.assertTrue(all(isinstance(ev, Transaction) for ev in events))
+        self.assertEqual(events[1].nbytes, len(self.sim.idn) + 1)
+        self.assertTrue(events[0].start <= events[0].end <= events[1].start <= events[1].end)
+        self.assertIsNone(events[0].operation)
+
+    def test_trace(self):
+        own = TraceRecorder()
+        with self.scope.trace(own) as recorder:
+            self.scope.run()
+        self.assertIs(recorder, own)
+        self.assertEqual(self.scope._tracers, [])
+        self.assertEqual([ev.command for ev in recorder.events], [':RUN'])
+        # the tracer is removed even if the block fails
+        with self.assertRaises(ZeroDivisionError):
+            with self.scope.trace():
+                1 / 0
+        self.assertEqual(self.scope._tracers, [])
+
+    def test_disable_metrics(self):
+        with self.scope.trace() as recorder:
+            self.scope.enable_metrics()
+            self.scope.disable_metrics()
+            self.scope.get_waveform_bytes(1)
+        self.assertEqual(self.scope._tracers, [])
+        self.assertEqual(len(recorder.operations), 2)
+
+    def test_operations(self):
+        self.scope.stop()
+        progress = []
+        def report(p):
+            # reported after the :WAVeform:DATA? answer of each chunk
+            progress.append((p.done, p.total, recorder.transactions[-1].command))
+        with self.scope.trace() as recorder:
+            # the progress callback is left out of the label
+            self.scope.get_waveform_samples(1, mode='RAW', progress=report)
+            self.scope.get_waveform_bytes('CHAN1', 'NORMal')
+        self.assertEqual(progress, [(done, 600000, ':WAVeform:DATA?') for done in (250000, 500000, 600000)])
+        operations = recorder.operations
+        self.assertEqual([(op.name, op.parent) for op in operations], [
+            ('waveform_preamble', 'get_waveform_bytes(CHAN1, RAW)'),
+            ('get_waveform_bytes(CHAN1, RAW)', 'get_waveform_samples(CHAN1, RAW)'),
+            ('waveform_preamble', 'get_waveform_samples(CHAN1, RAW)'),
+            ('get_waveform_samples(CHAN1, RAW)', None),
+            ('waveform_preamble', 'get_waveform_bytes(CHAN1, NORMal)'),
+            ('get_waveform_bytes(CHAN1, NORMal)', None),
+        ])
+        outer = operations[3]
+        for op in operations[:3]:
+            self.assertTrue(outer.start <= op.start <= op.end <= outer.end)
+        self.assertEqual(self.scope._operations, [])
+        # every chunk of the RAW read is a :WAVeform:DATA? transaction of its own
+        reads = [ev for ev in recorder.transactions
+                 if ev.command == ':WAVeform:DATA?' and ev.direction == 'read'
+                 and ev.operation == 'get_waveform_bytes(CHAN1, RAW)']
+        self.assertEqual([ev.chunk for ev in reads], [0, 1, 2])
+        self.assertTrue(600000 < sum(ev.nbytes for ev in reads) < 600100)
+        self.assertTrue(all(ev.chunk is None for ev in recorder.transactions
+                            if ev.operation != 'get_waveform_bytes(CHAN1, RAW)'))
+        summary = recorder.summary()
+        raw = summary['get_waveform_bytes(CHAN1, RAW)']
+        self.assertEqual(raw['transactions'], len([ev for ev in recorder.transactions
+                                                   if ev.operation == 'get_waveform_bytes(CHAN1, RAW)']))
+        self.assertTrue(raw['bytes'] > 600000)
+        self.assertTrue(raw['seconds'] > 0)
+        self.assertEqual(sum(entry['transactions'] for entry in summary.values()), len(recorder.transactions))
+
+    def test_chrome_trace(self):
+        with self.scope.trace() as recorder:
+            self.scope.get_waveform_bytes(1)
+        trace = recorder.to_chrome_trace()
+        events = trace['traceEvents']
+        self.assertEqual([ev['args']['name'] for ev in events if ev['ph'] == 'M'], ['operations', 'transactions'])
+        complete = [ev for ev in events if ev['ph'] == 'X']
+        self.assertEqual(len(complete), len(recorder.events))
+        self.assertEqual(min(ev['ts'] for ev in complete), 0)
+        operation = [ev for ev in complete if ev['cat'] == 'operation' and ev['args']['parent'] is None]
+        self.assertEqual([ev['name'] for ev in operation], ['get_waveform_bytes(CHAN1)'])
+        self.assertEqual(operation[0]['tid'], 1)
+        reads = [ev for ev in complete if ev['name'] == 'read :WAVeform:DATA?']
+        self.assertEqual(len(reads), 1)
+        self.assertEqual(reads[0]['tid'], 2)
+        self.assertEqual(reads[0]['args']['operation'], 'get_waveform_bytes(CHAN1)')
+        tmpdir = tempfile.mkdtemp(prefix='ds1054z-test-')
+        try:
+            filename = os.path.join(tmpdir, 'session.trace.json')
+            recorder.save(filename)
+            with open(filename) as f:
+                self.assertEqual(json.load(f), json.loads(json.dumps(trace)))
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    unittest.main()